@@ -0,0 +1,134 @@
+"""
+Per-user semantic answer cache.
+
+Answers are keyed by the question's embedding: a new question whose cosine
+similarity to a cached one is above ANSWER_CACHE_THRESHOLD gets the cached
+answer without touching Chroma or the LLM. Entries expire after a TTL,
+each user keeps at most ANSWER_CACHE_MAX_PER_USER (LRU), and a user's
+entries are dropped whenever their documents change.
+
+The cache lives in the API process; with several uvicorn workers each one
+has its own copy. Hit/miss/eviction counters are exported on /metrics and
+summarized on /health.
+"""
+import os
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import List, Optional
+
+import numpy as np
+
+from app.observability import register_collector, render_metric
+
+ANSWER_CACHE_ENABLED = os.getenv("ANSWER_CACHE_ENABLED", "1") == "1"
+ANSWER_CACHE_THRESHOLD = float(os.getenv("ANSWER_CACHE_THRESHOLD", "0.95"))
+ANSWER_CACHE_TTL_SECONDS = float(os.getenv("ANSWER_CACHE_TTL_SECONDS", "3600"))
+ANSWER_CACHE_MAX_PER_USER = int(os.getenv("ANSWER_CACHE_MAX_PER_USER", "64"))
+ANSWER_CACHE_MAX_USERS = int(os.getenv("ANSWER_CACHE_MAX_USERS", "1024"))
+
+
+@dataclass
+class _Entry:
+    embedding: np.ndarray
+    question: str
+    answer: str
+    created: float
+    llm_ms: float
+
+
+def _normalize(vector) -> np.ndarray:
+    vector = np.asarray(vector, dtype=np.float32)
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm else vector
+
+
+class AnswerCache:
+    def __init__(
+        self,
+        threshold: float = ANSWER_CACHE_THRESHOLD,
+        ttl_seconds: float = ANSWER_CACHE_TTL_SECONDS,
+        max_per_user: int = ANSWER_CACHE_MAX_PER_USER,
+        max_users: int = ANSWER_CACHE_MAX_USERS,
+    ):
+        self.threshold = threshold
+        self.ttl_seconds = ttl_seconds
+        self.max_per_user = max_per_user
+        self.max_users = max_users
+        self.hits = 0
+        self.misses = 0
+        # Entries dropped by the TTL or the LRU limits (not by invalidate())
+        self.evictions = 0
+        self.saved_llm_ms = 0.0
+        self._users: "OrderedDict[int, list[_Entry]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def lookup(self, user_id: int, query_embedding) -> Optional[str]:
+        query = _normalize(query_embedding)
+        now = time.monotonic()
+        with self._lock:
+            entries = self._users.get(user_id)
+            if entries:
+                live = [e for e in entries if now - e.created < self.ttl_seconds]
+                self.evictions += len(entries) - len(live)
+                entries[:] = live
+            if not entries:
+                self.misses += 1
+                return None
+
+            scores = np.stack([e.embedding for e in entries]) @ query
+            best = int(np.argmax(scores))
+            if scores[best] < self.threshold:
+                self.misses += 1
+                return None
+
+            # Most recently used entries live at the end of the list
+            entry = entries.pop(best)
+            entries.append(entry)
+            self._users.move_to_end(user_id)
+            self.hits += 1
+            self.saved_llm_ms += entry.llm_ms
+            return entry.answer
+
+    def store(self, user_id: int, query_embedding, question: str, answer: str, llm_ms: float):
+        entry = _Entry(_normalize(query_embedding), question, answer, time.monotonic(), llm_ms)
+        with self._lock:
+            entries = self._users.setdefault(user_id, [])
+            entries.append(entry)
+            self.evictions += max(0, len(entries) - self.max_per_user)
+            del entries[:-self.max_per_user]
+            self._users.move_to_end(user_id)
+            while len(self._users) > self.max_users:
+                self.evictions += len(self._users.popitem(last=False)[1])
+
+    def invalidate(self, user_id: int):
+        with self._lock:
+            self._users.pop(user_id, None)
+
+    def stats(self) -> dict:
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / total, 4) if total else 0.0,
+                "evictions": self.evictions,
+                "saved_llm_ms": round(self.saved_llm_ms, 1),
+                "entries": sum(len(e) for e in self._users.values()),
+            }
+
+    def metrics(self) -> List[str]:
+        stats = self.stats()
+        return (
+            render_metric("answer_cache_hits_total", "counter", "Questions answered from the answer cache", stats["hits"])
+            + render_metric("answer_cache_misses_total", "counter", "Questions that went to retrieval and the LLM", stats["misses"])
+            + render_metric("answer_cache_evictions_total", "counter", "Cached answers dropped by the TTL or LRU limits", stats["evictions"])
+            + render_metric("answer_cache_entries", "gauge", "Cached answers currently held", stats["entries"])
+            + render_metric("answer_cache_saved_llm_seconds_total", "counter",
+                            "LLM time the cached answers originally took", stats["saved_llm_ms"] / 1000)
+        )
+
+
+answer_cache = AnswerCache()
+register_collector(answer_cache.metrics)
@@ -1,13 +1,19 @@
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
 from datetime import datetime, timedelta
 from typing import Optional
 
 from jose import JWTError, jwt
-from passlib.context import CryptContext
 from fastapi import Depends, HTTPException, status
+from fastapi.concurrency import run_in_threadpool
 from fastapi.security import OAuth2PasswordBearer
-from sqlalchemy.orm import Session
+from sqlalchemy import event
 
 from app import models, database
+# Hashing lives in app.passwords so the password worker processes don't import FastAPI
+from app.passwords import pwd_context, verify_password, hash_password as get_password_hash
 import os
 from dotenv import load_dotenv
 
@@ -17,23 +23,16 @@ SECRET_KEY = os.getenv("SECRET_KEY", "supersecretkey")  # Change this in product
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 30
 
-# ✅ Use pbkdf2_sha256 instead of bcrypt – no 72-byte limit, no broken backend issues
-pwd_context = CryptContext(schemes=["pbkdf2_sha256"], deprecated="auto")
+# Authenticated users are cached in-process so hot endpoints skip the users
+# table. Entries are dropped when this process changes the user row; with
+# several API worker processes the others only notice when the entry expires,
+# so a deleted user can keep authenticating there for up to the TTL. Keep it short.
+AUTH_CACHE_TTL_SECONDS = float(os.getenv("AUTH_CACHE_TTL_SECONDS", "30"))
+AUTH_CACHE_MAX_ENTRIES = int(os.getenv("AUTH_CACHE_MAX_ENTRIES", "4096"))
 
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="auth/login")
 
 
-def get_password_hash(password: str) -> str:
-    # Simple: no truncation, no byte juggling needed
-    password_str = str(password) if not isinstance(password, str) else password
-    return pwd_context.hash(password_str)
-
-
-def verify_password(plain_password: str, hashed_password: str) -> bool:
-    password_str = str(plain_password) if not isinstance(plain_password, str) else plain_password
-    return pwd_context.verify(password_str, hashed_password)
-
-
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None) -> str:
     to_encode = data.copy()
     if expires_delta:
@@ -45,10 +44,86 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None) -
     return encoded_jwt
 
 
-async def get_current_user(
-    token: str = Depends(oauth2_scheme),
-    db: Session = Depends(database.get_db),
-):
+@dataclass(frozen=True)
+class Principal:
+    """Detached snapshot of the authenticated user, safe to share between requests."""
+    id: int
+    username: str
+    full_name: Optional[str] = None
+    provider_info: Optional[str] = None
+
+    @classmethod
+    def from_user(cls, user: models.User) -> "Principal":
+        return cls(user.id, user.username, user.full_name, user.provider_info)
+
+
+class PrincipalCache:
+    """Bounded LRU of user id -> (Principal, cached_at)."""
+
+    def __init__(self, ttl_seconds: float = AUTH_CACHE_TTL_SECONDS, max_entries: int = AUTH_CACHE_MAX_ENTRIES):
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._entries: "OrderedDict[int, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, user_id: int) -> Optional[Principal]:
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is None or time.monotonic() - entry[1] >= self.ttl_seconds:
+                self._entries.pop(user_id, None)
+                self.misses += 1
+                return None
+            self._entries.move_to_end(user_id)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, principal: Principal):
+        with self._lock:
+            self._entries[principal.id] = (principal, time.monotonic())
+            self._entries.move_to_end(principal.id)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, user_id: int):
+        with self._lock:
+            self._entries.pop(user_id, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+principal_cache = PrincipalCache()
+
+
+# ORM events only fire in the process making the change; see AUTH_CACHE_TTL_SECONDS
+@event.listens_for(models.User, "after_update")
+@event.listens_for(models.User, "after_delete")
+def _invalidate_principal(mapper, connection, target):
+    principal_cache.invalidate(target.id)
+
+
+def _load_principal(user_id: Optional[int], username: str) -> Optional[Principal]:
+    db = database.SessionLocal()
+    try:
+        query = db.query(models.User)
+        if user_id is not None:
+            user = query.filter(models.User.id == user_id).first()
+        else:
+            # Tokens issued before the uid claim existed
+            user = query.filter(models.User.username == username).first()
+        return Principal.from_user(user) if user else None
+    finally:
+        db.close()
+
+
+async def get_current_user(token: str = Depends(oauth2_scheme)) -> Principal:
+    """
+    Resolves the bearer token to a Principal. Tokens carry the user id in a
+    "uid" claim, so a cache hit needs no database session at all.
+    """
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Could not validate credentials",
@@ -57,12 +132,20 @@ async def get_current_user(
     try:
         payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
         username: str = payload.get("sub")
+        user_id: Optional[int] = payload.get("uid")
         if username is None:
             raise credentials_exception
     except JWTError:
         raise credentials_exception
 
-    user = db.query(models.User).filter(models.User.username == username).first()
-    if user is None:
+    principal = principal_cache.get(user_id) if user_id is not None else None
+    if principal is None:
+        # Sync DB call; keep it off the event loop
+        principal = await run_in_threadpool(_load_principal, user_id, username)
+        if principal is None:
+            raise credentials_exception
+        principal_cache.put(principal)
+    # A deleted user's id can be reused by a new account
+    if principal.username != username:
         raise credentials_exception
-    return user
+    return principal
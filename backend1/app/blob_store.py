@@ -0,0 +1,286 @@
+"""
+Content-addressed store for uploaded files.
+
+Each distinct upload is kept once, named by its SHA-256 and fanned out by
+hash prefix so no directory grows past a few thousand entries:
+
+    uploaded_files/blobs/3f/a9/3fa9...c2.pdf
+
+Every document with the same bytes points its file_path at the same blob
+(the extension of the first upload is kept, which extraction dispatches on).
+The blobs table counts references: store() takes one per new document and
+release() drops it when the document is deleted. Files are never removed on
+the request path; collect_garbage() (gc_blobs.py) deletes blobs that have
+had no references for BLOB_GC_GRACE_SECONDS, and also fixes counts that
+drifted after a crash.
+
+Writes go to a temp file under blobs/tmp, are fsynced and then renamed into
+place, so a blob path only ever holds complete files.
+"""
+import hashlib
+import logging
+import os
+import shutil
+import time
+import uuid
+from datetime import datetime, timedelta
+from typing import Dict, Optional
+
+from sqlalchemy import or_
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+from app import models
+
+logger = logging.getLogger(__name__)
+
+BLOB_DIR = os.getenv("BLOB_DIR", os.path.join("uploaded_files", "blobs"))
+# How long an unreferenced blob (or stray temp file) is kept before gc_blobs.py deletes it
+BLOB_GC_GRACE_SECONDS = int(os.getenv("BLOB_GC_GRACE_SECONDS", "3600"))
+
+_TMP_DIR = os.path.join(BLOB_DIR, "tmp")
+# Statuses whose worker may have the file open; legacy adoption skips them
+_ACTIVE_STATUSES = ("extracting", "embedding")
+
+
+def blob_path(content_hash: str, ext: str = "") -> str:
+    return os.path.join(BLOB_DIR, content_hash[:2], content_hash[2:4], content_hash + ext)
+
+
+def is_blob_path(path: Optional[str]) -> bool:
+    if not path:
+        return False
+    return os.path.abspath(path).startswith(os.path.abspath(BLOB_DIR) + os.sep)
+
+
+def temp_path(suffix: str = ".part") -> str:
+    """A fresh temp file name on the same filesystem as the blobs, so the final rename is atomic."""
+    os.makedirs(_TMP_DIR, exist_ok=True)
+    return os.path.join(_TMP_DIR, f"{uuid.uuid4()}{suffix}")
+
+
+def _fsync_dir(path: str):
+    # Makes the rename itself durable; not possible on Windows
+    try:
+        fd = os.open(path, os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
+
+
+def _place(tmp_path: str, final_path: str):
+    with open(tmp_path, "rb") as f:
+        os.fsync(f.fileno())
+    directory = os.path.dirname(final_path)
+    os.makedirs(directory, exist_ok=True)
+    os.replace(tmp_path, final_path)
+    _fsync_dir(directory)
+
+
+def _acquire(db: Session, content_hash: str) -> Optional[models.Blob]:
+    """Takes a reference on an existing blob; None if there is no row for content_hash."""
+    updated = db.query(models.Blob).filter(models.Blob.content_hash == content_hash).update(
+        {models.Blob.ref_count: models.Blob.ref_count + 1, models.Blob.unreferenced_at: None},
+        synchronize_session=False,
+    )
+    db.commit()
+    return db.get(models.Blob, content_hash) if updated else None
+
+
+def store(db: Session, tmp_path: str, content_hash: str, size: int, ext: str = "") -> models.Blob:
+    """
+    Moves the complete file at tmp_path into the store and takes a reference
+    on its blob (committed). If the bytes are already stored, tmp_path is
+    simply deleted.
+    """
+    while True:
+        blob = _acquire(db, content_hash)
+        if blob is not None:
+            if os.path.exists(blob.path):
+                os.remove(tmp_path)
+            else:
+                # Lost (or collected between our count and the caller's upload); these bytes restore it
+                _place(tmp_path, blob.path)
+            return blob
+
+        # The row goes in before the file: collect_garbage() re-checks for it
+        # before deleting a file, so a concurrent collection can't take ours
+        blob = models.Blob(content_hash=content_hash, path=blob_path(content_hash, ext), size=size, ref_count=1)
+        db.add(blob)
+        try:
+            db.commit()
+        except IntegrityError:
+            # Someone stored the same bytes first; take a reference on theirs
+            db.rollback()
+            continue
+        _place(tmp_path, blob.path)
+        return blob
+
+
+def release(db: Session, content_hash: Optional[str]) -> bool:
+    """
+    Drops one reference, in the caller's transaction. Only for documents
+    whose file_path is a blob path. Returns False if there is no blob for
+    content_hash.
+    """
+    if not content_hash or db.get(models.Blob, content_hash) is None:
+        return False
+    blobs = db.query(models.Blob).filter(models.Blob.content_hash == content_hash)
+    blobs.filter(models.Blob.ref_count > 0).update(
+        {models.Blob.ref_count: models.Blob.ref_count - 1}, synchronize_session=False
+    )
+    blobs.filter(models.Blob.ref_count == 0, models.Blob.unreferenced_at.is_(None)).update(
+        {models.Blob.unreferenced_at: datetime.utcnow()}, synchronize_session=False
+    )
+    return True
+
+
+def recount(db: Session, dry_run: bool = False) -> int:
+    """
+    Resets ref_count to the number of documents using each blob, fixing
+    counts left behind by a crash between store() and the document insert.
+    Returns the number of blobs corrected.
+    """
+    actual: Dict[str, int] = {}
+    for content_hash, file_path in db.query(models.Document.content_hash, models.Document.file_path).filter(
+        models.Document.content_hash.isnot(None)
+    ):
+        if is_blob_path(file_path):
+            actual[content_hash] = actual.get(content_hash, 0) + 1
+
+    fixed = 0
+    now = datetime.utcnow()
+    for blob in db.query(models.Blob).all():
+        count = actual.get(blob.content_hash, 0)
+        if blob.ref_count == count:
+            continue
+        logger.warning(f"Blob {blob.content_hash[:12]} ref_count {blob.ref_count} -> {count}")
+        fixed += 1
+        if dry_run:
+            continue
+        blob.ref_count = count
+        if count == 0 and blob.unreferenced_at is None:
+            blob.unreferenced_at = now
+        elif count:
+            blob.unreferenced_at = None
+    if not dry_run:
+        db.commit()
+    return fixed
+
+
+def _delete_blob(db: Session, content_hash: str, path: str) -> bool:
+    deleted = db.query(models.Blob).filter(
+        models.Blob.content_hash == content_hash, models.Blob.ref_count == 0
+    ).delete(synchronize_session=False)
+    db.commit()
+    if not deleted or not os.path.exists(path):
+        return bool(deleted)
+
+    # Move the file aside first: if an upload re-created the row meanwhile,
+    # its bytes are identical and go back in place
+    trash = temp_path(".gc")
+    os.replace(path, trash)
+    db.expire_all()
+    if db.get(models.Blob, content_hash) is not None and not os.path.exists(path):
+        os.replace(trash, path)
+        return False
+    os.remove(trash)
+    return True
+
+
+def adopt_legacy_files(db: Session, dry_run: bool = False) -> int:
+    """
+    Moves files uploaded before the store existed (uploaded_files/<uuid>.ext)
+    into it, deduplicating as it goes. Returns the number of documents moved.
+    """
+    docs = db.query(models.Document).filter(or_(
+        models.Document.status.is_(None), models.Document.status.notin_(_ACTIVE_STATUSES)
+    )).all()
+    moved = 0
+    for doc in docs:
+        if is_blob_path(doc.file_path) or not doc.file_path or not os.path.exists(doc.file_path):
+            continue
+        moved += 1
+        if dry_run:
+            continue
+        legacy_path = doc.file_path
+        tmp = temp_path()
+        try:
+            os.link(legacy_path, tmp)
+        except OSError:
+            shutil.copyfile(legacy_path, tmp)
+        content_hash = doc.content_hash or _sha256(tmp)
+        blob = store(db, tmp, content_hash, os.path.getsize(legacy_path), os.path.splitext(legacy_path)[1].lower())
+        doc.file_path, doc.content_hash = blob.path, content_hash
+        db.commit()
+        os.remove(legacy_path)
+    return moved
+
+
+def _sha256(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def _older_than(path: str, cutoff: float) -> bool:
+    try:
+        return os.path.getmtime(path) < cutoff
+    except OSError:
+        return False
+
+
+def collect_garbage(
+    db: Session,
+    grace_seconds: Optional[int] = None,
+    dry_run: bool = False,
+    adopt_legacy: bool = False,
+) -> dict:
+    """
+    Recounts references, then deletes blobs unreferenced for longer than
+    grace_seconds, temp files left by interrupted uploads, and files in the
+    fan-out directories that have no blob row. Returns what was (or, with
+    dry_run, would be) done.
+    """
+    grace_seconds = BLOB_GC_GRACE_SECONDS if grace_seconds is None else grace_seconds
+    stats = {"adopted": 0, "recounted": 0, "blobs_deleted": 0, "bytes_freed": 0, "temp_deleted": 0, "orphans_deleted": 0}
+    if adopt_legacy:
+        stats["adopted"] = adopt_legacy_files(db, dry_run)
+    stats["recounted"] = recount(db, dry_run)
+
+    cutoff = datetime.utcnow() - timedelta(seconds=grace_seconds)
+    for content_hash, path, size in db.query(models.Blob.content_hash, models.Blob.path, models.Blob.size).filter(
+        models.Blob.ref_count == 0, models.Blob.unreferenced_at < cutoff
+    ).all():
+        if dry_run or _delete_blob(db, content_hash, path):
+            stats["blobs_deleted"] += 1
+            stats["bytes_freed"] += size or 0
+
+    file_cutoff = time.time() - grace_seconds
+    if os.path.isdir(_TMP_DIR):
+        for name in os.listdir(_TMP_DIR):
+            path = os.path.join(_TMP_DIR, name)
+            if _older_than(path, file_cutoff):
+                stats["temp_deleted"] += 1
+                if not dry_run:
+                    os.remove(path)
+
+    known = {os.path.abspath(path) for (path,) in db.query(models.Blob.path)}
+    for root, dirs, files in os.walk(BLOB_DIR):
+        dirs[:] = [d for d in dirs if os.path.join(root, d) != _TMP_DIR]
+        for name in files:
+            path = os.path.join(root, name)
+            if os.path.abspath(path) in known or not _older_than(path, file_cutoff):
+                continue
+            stats["orphans_deleted"] += 1
+            stats["bytes_freed"] += os.path.getsize(path)
+            if not dry_run:
+                os.remove(path)
+    return stats
@@ -0,0 +1,176 @@
+"""
+Bulk ingestion pipeline used by reindex_docs.py.
+
+Text extraction fans out over a process pool, chunks from different
+documents are packed into shared encode batches, and ChromaDB is written
+with one large upsert per batch instead of one small add per document.
+At most IN_FLIGHT_PER_WORKER x workers documents are being extracted (or
+waiting to be chunked) at a time, so memory stays flat however many
+documents a run covers.
+"""
+import logging
+import multiprocessing
+import os
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from dataclasses import dataclass, field
+from typing import Callable, Iterable, List, Optional, Tuple
+
+from app import chunking, database, embeddings, extraction, ocr, rag_engine
+from app.lexical_index import lexical_index
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_WORKERS = os.cpu_count() or 1
+DEFAULT_WRITE_BATCH_SIZE = 1024
+# Extractions submitted ahead per worker; enough to keep every worker busy
+IN_FLIGHT_PER_WORKER = 2
+
+
+@dataclass
+class IngestStats:
+    documents: int = 0
+    chunks: int = 0
+    failed: List[Tuple[int, str]] = field(default_factory=list)
+    elapsed: float = 0.0
+
+    @property
+    def docs_per_sec(self) -> float:
+        return self.documents / self.elapsed if self.elapsed else 0.0
+
+    @property
+    def chunks_per_sec(self) -> float:
+        return self.chunks / self.elapsed if self.elapsed else 0.0
+
+
+class _ChunkBuffer:
+    """Accumulates chunks across documents and flushes them in fixed-size batches."""
+
+    def __init__(self, write_batch_size: int, encode_batch_size: int, on_indexed):
+        self.write_batch_size = write_batch_size
+        self.encode_batch_size = encode_batch_size
+        self.on_indexed = on_indexed
+        self.ids, self.texts, self.metadatas = [], [], []
+        # doc_id -> document metadata text for the BM25 index
+        self.meta = {}
+        # doc_id -> [chunks still buffered, chunk stats]
+        self.pending = {}
+
+    def add(self, doc_id: int, user_id: int, chunks: List[str], meta: str = ""):
+        self.pending[doc_id] = [len(chunks), chunking.chunk_stats(chunks)]
+        self.meta[doc_id] = meta
+        for chunk_id, chunk in zip(rag_engine.chunk_ids(doc_id, len(chunks)), chunks):
+            self.ids.append(chunk_id)
+            self.texts.append(chunk)
+            self.metadatas.append({"doc_id": doc_id, "user_id": user_id})
+        while len(self.ids) >= self.write_batch_size:
+            self.flush(self.write_batch_size)
+
+    def flush(self, limit: Optional[int] = None):
+        n = len(self.ids) if limit is None else min(limit, len(self.ids))
+        if n == 0:
+            return
+        ids, texts, metadatas = self.ids[:n], self.texts[:n], self.metadatas[:n]
+        del self.ids[:n], self.texts[:n], self.metadatas[:n]
+
+        # One encode call for the whole batch, then one upsert per partition
+        vectors = embeddings.embed_texts(texts, batch_size=self.encode_batch_size)
+        by_user = {}
+        for i, meta in enumerate(metadatas):
+            by_user.setdefault(meta["user_id"], []).append(i)
+        for user_id, rows in by_user.items():
+            rag_engine.get_user_collection(user_id).upsert(
+                ids=[ids[i] for i in rows],
+                documents=[texts[i] for i in rows],
+                metadatas=[metadatas[i] for i in rows],
+                embeddings=vectors[rows],
+            )
+        lexical_index.add_chunks(
+            (chunk_id, meta["doc_id"], meta["user_id"], text, self.meta[meta["doc_id"]])
+            for chunk_id, text, meta in zip(ids, texts, metadatas)
+        )
+
+        for meta in metadatas:
+            counts = self.pending[meta["doc_id"]]
+            counts[0] -= 1
+            if counts[0] == 0:
+                del self.pending[meta["doc_id"]]
+                del self.meta[meta["doc_id"]]
+                if self.on_indexed:
+                    self.on_indexed(meta["doc_id"], counts[1])
+
+
+def ingest_documents(
+    docs: Iterable[Tuple[int, int, str]],
+    workers: int = DEFAULT_WORKERS,
+    batch_size: int = embeddings.EMBED_BATCH_SIZE,
+    write_batch_size: int = DEFAULT_WRITE_BATCH_SIZE,
+    on_indexed: Optional[Callable[[int, dict], None]] = None,
+) -> IngestStats:
+    """
+    Indexes (doc_id, user_id, file_path) tuples. Chunks are upserted and any
+    left over from a previous, longer run are deleted. on_indexed(doc_id,
+    chunk_stats) fires once all of a document's chunks are written.
+    """
+    stats = IngestStats()
+    max_batch = rag_engine.max_write_batch_size()
+    if max_batch is not None:
+        write_batch_size = min(write_batch_size, max_batch)
+
+    def indexed(doc_id: int, chunk_stats: dict):
+        stats.documents += 1
+        stats.chunks += chunk_stats["chunk_count"]
+        if on_indexed:
+            on_indexed(doc_id, chunk_stats)
+
+    buffer = _ChunkBuffer(write_batch_size, batch_size, indexed)
+    db = database.SessionLocal()
+    start = time.perf_counter()
+
+    # spawn: the parent already holds torch and Chroma threads
+    with ProcessPoolExecutor(
+        max_workers=max(1, workers),
+        mp_context=multiprocessing.get_context("spawn"),
+        # One OCR process per spare CPU, not OCR_WORKERS per extraction worker
+        initializer=ocr.init_pool_worker,
+        initargs=(max(1, workers),),
+    ) as pool:
+        pending = iter(docs)
+        in_flight = {}
+        window = max(1, workers) * IN_FLIGHT_PER_WORKER
+
+        def submit_more():
+            for doc_id, user_id, file_path in pending:
+                in_flight[pool.submit(extraction.extract_text, file_path)] = (doc_id, user_id)
+                if len(in_flight) >= window:
+                    break
+
+        submit_more()
+        while in_flight:
+            done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+            for future in done:
+                # Dropped as soon as it is consumed, so its text can be freed
+                doc_id, user_id = in_flight.pop(future)
+                try:
+                    text = future.result()
+                except Exception as e:
+                    logger.error(f"Extraction failed for document {doc_id}: {e}")
+                    stats.failed.append((doc_id, str(e)))
+                    continue
+
+                chunks = chunking.chunk_text(text)
+                if not chunks:
+                    rag_engine.delete_document_embeddings(doc_id, user_id)
+                    indexed(doc_id, chunking.chunk_stats(chunks))
+                    continue
+                # Chunks are upserted in place; only ids past the new chunk count
+                # are deleted. The BM25 rows are rebuilt from scratch
+                rag_engine.delete_orphan_chunks(doc_id, user_id, rag_engine.chunk_ids(doc_id, len(chunks)))
+                lexical_index.delete_document(doc_id)
+                buffer.add(doc_id, user_id, chunks, rag_engine.document_meta(db, doc_id))
+            submit_more()
+
+    buffer.flush()
+    db.close()
+    stats.elapsed = time.perf_counter() - start
+    return stats
@@ -0,0 +1,209 @@
+"""
+Pluggable text chunkers.
+
+- "fixed":    the original 1000-char window with 100-char overlap.
+- "sentence": paragraph/sentence-aware chunks of up to CHUNK_MAX_CHARS.
+- "token":    the same structure-aware units, packed to the embedding
+              model's token limit (MiniLM truncates at 256 tokens).
+
+Both structure-aware strategies never split a sentence or a lab table row
+("Hemoglobin  13.5  g/dL  12.0-15.5"), keep section headers with the rows
+below them and repeat the header at the top of continuation chunks.
+"""
+import os
+import re
+from functools import lru_cache
+from typing import Callable, Dict, List
+
+from app.observability import span
+
+CHUNK_STRATEGY = os.getenv("CHUNK_STRATEGY", "token")
+CHUNK_MAX_CHARS = int(os.getenv("CHUNK_MAX_CHARS", "1000"))
+# all-MiniLM-L6-v2 max_seq_length; two positions go to [CLS] and [SEP]
+CHUNK_TOKEN_BUDGET = int(os.getenv("CHUNK_TOKEN_BUDGET", "256"))
+
+CHUNKER_VERSION = f"{CHUNK_STRATEGY}-v1-{CHUNK_TOKEN_BUDGET if CHUNK_STRATEGY == 'token' else CHUNK_MAX_CHARS}"
+
+_SENTENCE_END = re.compile(
+    r"(?<!\bDr\.)(?<!\bMr\.)(?<!\bMs\.)(?<!\bMrs\.)(?<!\bNo\.)(?<!\bvs\.)"
+    r"(?<=[.!?])\s+(?=[A-Z0-9(\"'])"
+)
+# A value with an optional unit/range, e.g. "13.5 g/dL", "<200", "4.5-11.0"
+_VALUE = re.compile(r"[<>]?\d+(?:[.,]\d+)?")
+_COLUMN_GAP = re.compile(r"\t|\s{2,}|\s\|\s")
+
+
+def is_header(line: str) -> bool:
+    """Section titles: short lines in capitals or ending with a colon."""
+    stripped = line.strip()
+    if not stripped or len(stripped) > 60 or _VALUE.search(stripped):
+        return False
+    letters = [c for c in stripped if c.isalpha()]
+    return stripped.endswith(":") or (len(letters) >= 3 and all(c.isupper() for c in letters))
+
+
+def is_table_row(line: str) -> bool:
+    """Lab rows: a name followed by one or more value columns."""
+    stripped = line.strip()
+    if not stripped or len(stripped) > 200:
+        return False
+    return bool(_VALUE.search(stripped)) and (
+        len(_COLUMN_GAP.split(stripped)) >= 2 or re.match(r"^[A-Za-z][\w ()/%-]*:\s*\S", stripped) is not None
+    )
+
+
+def split_sentences(text: str) -> List[str]:
+    return [s.strip() for s in _SENTENCE_END.split(text) if s.strip()]
+
+
+def _sections(text: str) -> List[tuple]:
+    """
+    Splits text into (header, units) sections. Units are table rows or
+    sentences, the smallest pieces a chunk may contain.
+    """
+    sections = []
+    header, units, prose = "", [], []
+
+    def flush_prose():
+        if prose:
+            units.extend(split_sentences(" ".join(prose)))
+            prose.clear()
+
+    for line in text.splitlines():
+        stripped = line.strip()
+        if not stripped:
+            flush_prose()
+            continue
+        if is_header(stripped):
+            flush_prose()
+            if units:
+                sections.append((header, units))
+                header, units = stripped, []
+            else:
+                # Consecutive titles ("LAB REPORT" / "HEMATOLOGY:") form one header
+                header = f"{header}\n{stripped}" if header else stripped
+        elif is_table_row(stripped):
+            flush_prose()
+            units.append(" ".join(stripped.split()))
+        else:
+            prose.append(stripped)
+
+    flush_prose()
+    if units or header:
+        sections.append((header, units))
+    return sections
+
+
+def _split_oversized(unit: str, size: Callable[[str], int], budget: int) -> List[str]:
+    """Last resort for a single unit over budget: split on word boundaries."""
+    pieces, current = [], []
+    for word in unit.split():
+        if current and size(" ".join(current + [word])) > budget:
+            pieces.append(" ".join(current))
+            current = []
+        current.append(word)
+    if current:
+        pieces.append(" ".join(current))
+    return pieces
+
+
+def _pack(text: str, size: Callable[[str], int], budget: int, sep_cost: int) -> List[str]:
+    """
+    Greedily packs units into chunks of at most budget (as measured by size).
+    A header always travels with the first unit of its section, and is
+    repeated at the top of a chunk that continues a section.
+    """
+    chunks, current, used = [], [], 0
+
+    for header, units in _sections(text):
+        header_cost = size(header) + sep_cost if header else 0
+        room = max(1, budget - header_cost)
+        items = []
+        for unit in units:
+            cost = size(unit)
+            if cost > room:
+                items.extend((p, size(p)) for p in _split_oversized(unit, size, room))
+            else:
+                items.append((unit, cost))
+        if not items and header:
+            items = [(header, size(header))]
+            header, header_cost = "", 0
+
+        for i, (piece, cost) in enumerate(items):
+            block, block_cost = [piece], cost
+            if header and i == 0:
+                block, block_cost = [header, piece], header_cost + cost
+            if current and used + sep_cost + block_cost > budget:
+                chunks.append("\n".join(current))
+                current, used = [], 0
+                if header and i > 0:
+                    # Continuation chunks keep their section title for context
+                    current, used = [header], header_cost - sep_cost
+            used += (sep_cost if current else 0) + block_cost
+            current.extend(block)
+
+    if current:
+        chunks.append("\n".join(current))
+    return chunks
+
+
+def fixed_chunks(text: str, chunk_size: int = 1000, overlap: int = 100) -> List[str]:
+    chunks = []
+    for i in range(0, len(text), chunk_size - overlap):
+        chunks.append(text[i:i + chunk_size])
+    return chunks
+
+
+def sentence_chunks(text: str, max_chars: int = CHUNK_MAX_CHARS) -> List[str]:
+    return _pack(text, len, max_chars, sep_cost=1)
+
+
+def _approx_tokens(text: str) -> int:
+    # WordPiece splits long words and every punctuation mark
+    return sum(1 + len(w) // 8 for w in re.findall(r"\w+|[^\w\s]", text))
+
+
+@lru_cache(maxsize=1)
+def _tokenizer():
+    try:
+        from app.embeddings import get_embedding_model
+        return get_embedding_model().tokenizer
+    except Exception:
+        return None
+
+
+def count_tokens(text: str) -> int:
+    """Token count under the embedding model's tokenizer (approximate if unavailable)."""
+    tokenizer = _tokenizer()
+    if tokenizer is None:
+        return _approx_tokens(text)
+    return len(tokenizer(text, add_special_tokens=False)["input_ids"])
+
+
+def token_chunks(text: str, max_tokens: int = CHUNK_TOKEN_BUDGET) -> List[str]:
+    # Chunks are joined with newlines, which the tokenizer drops
+    return _pack(text, count_tokens, max_tokens - 2, sep_cost=0)
+
+
+CHUNKERS: Dict[str, Callable[[str], List[str]]] = {
+    "fixed": fixed_chunks,
+    "sentence": sentence_chunks,
+    "token": token_chunks,
+}
+
+
+def chunk_text(text: str, strategy: str = None) -> List[str]:
+    strategy = strategy or CHUNK_STRATEGY
+    if strategy not in CHUNKERS:
+        raise ValueError(f"Unknown chunking strategy '{strategy}', expected one of {sorted(CHUNKERS)}")
+    with span("chunking"):
+        return [c for c in CHUNKERS[strategy](text) if c.strip()]
+
+
+def chunk_stats(chunks: List[str]) -> dict:
+    lengths = [len(c) for c in chunks]
+    return {
+        "chunk_count": len(chunks),
+        "avg_chunk_chars": round(sum(lengths) / len(lengths), 1) if lengths else 0.0,
+        "max_chunk_chars": max(lengths, default=0),
+    }
@@ -0,0 +1,179 @@
+"""
+Prompt context assembly.
+
+Retrieved chunks often come from the same document and sit next to each
+other, and consecutive chunks repeat text: the fixed chunker overlaps
+windows by 100 characters and the token/sentence chunkers repeat a section
+header at the top of a continuation chunk. assemble() turns the ranked
+chunks into one block per document:
+
+    [Source: cbc_march.pdf | 2025-03-12 | lab]
+    COMPLETE BLOOD COUNT
+    Hemoglobin 13.5 g/dL 12.0-15.5
+    ...
+
+Adjacent chunks are merged with the duplicated span stripped, passages
+already contained in another are dropped, and passages are added in rank
+order until CONTEXT_TOKEN_BUDGET is spent. Blocks keep the order of their
+best-ranked chunk.
+"""
+import os
+import re
+from dataclasses import dataclass, field
+from typing import Dict, List, Tuple
+
+from sqlalchemy.orm import Session
+
+from app import chunking, models
+
+# Prompt context tokens (embedding tokenizer, a close proxy); 0 = no limit
+CONTEXT_TOKEN_BUDGET = int(os.getenv("CONTEXT_TOKEN_BUDGET", "1500"))
+CONTEXT_SOURCE_TAGS = os.getenv("CONTEXT_SOURCE_TAGS", "1") == "1"
+# Shortest repeated span treated as chunk overlap rather than coincidence
+_MIN_OVERLAP = 20
+_MAX_OVERLAP = 400
+
+_CHUNK_ID = re.compile(r"^doc_(\d+)_chunk_(\d+)$")
+_SEPARATOR = "\n...\n"
+
+
+@dataclass
+class _Passage:
+    doc_id: int
+    first: int
+    last: int
+    text: str
+    rank: int
+
+
+@dataclass
+class _Block:
+    doc_id: int
+    rank: int
+    passages: List[_Passage] = field(default_factory=list)
+
+
+def parse_chunk_id(chunk_id: str) -> Tuple[int, int]:
+    match = _CHUNK_ID.match(chunk_id)
+    if match is None:
+        raise ValueError(f"Unexpected chunk id '{chunk_id}'")
+    return int(match.group(1)), int(match.group(2))
+
+
+def merge_overlap(first: str, second: str) -> str:
+    """Joins two consecutive chunks, dropping the text second repeats from the end of first."""
+    # Section headers repeated at the top of a continuation chunk
+    lines = second.split("\n")
+    seen = set(first.split("\n"))
+    while len(lines) > 1 and chunking.is_header(lines[0]) and lines[0] in seen:
+        lines.pop(0)
+    second = "\n".join(lines)
+
+    # Character overlap of the fixed-window chunker
+    for size in range(min(len(first), len(second), _MAX_OVERLAP), _MIN_OVERLAP - 1, -1):
+        if first.endswith(second[:size]):
+            return first + second[size:]
+    return f"{first}\n{second}"
+
+
+def _passages(ranked: List[Tuple[str, str]]) -> List[_Passage]:
+    """Merges runs of adjacent chunks of one document; a run ranks as its best chunk."""
+    by_doc: Dict[int, List[Tuple[int, str, int]]] = {}
+    for rank, (chunk_id, text) in enumerate(ranked):
+        doc_id, index = parse_chunk_id(chunk_id)
+        by_doc.setdefault(doc_id, []).append((index, text, rank))
+
+    passages = []
+    for doc_id, chunks in by_doc.items():
+        current = None
+        for index, text, rank in sorted(chunks):
+            if current is not None and index == current.last + 1:
+                current.text = merge_overlap(current.text, text)
+                current.last, current.rank = index, min(current.rank, rank)
+                continue
+            current = _Passage(doc_id, index, index, text, rank)
+            passages.append(current)
+    return sorted(passages, key=lambda p: p.rank)
+
+
+def _normalized(text: str) -> str:
+    return " ".join(text.split())
+
+
+def source_tags(db: Session, doc_ids: List[int]) -> Dict[int, str]:
+    rows = db.query(
+        models.Document.id,
+        models.Document.filename,
+        models.Document.upload_date,
+        models.Document.category,
+    ).filter(models.Document.id.in_(doc_ids)).all()
+    tags = {}
+    for row in rows:
+        fields = [row.filename, row.upload_date.date().isoformat() if row.upload_date else None, row.category]
+        tags[row.id] = "[Source: " + " | ".join(f for f in fields if f) + "]"
+    return tags
+
+
+def assemble(
+    db: Session,
+    ranked: List[Tuple[str, str]],
+    token_budget: int = None,
+    with_sources: bool = None,
+) -> List[str]:
+    """
+    Turns ranked (chunk_id, text) pairs into per-document context blocks
+    within token_budget. The best passage is always kept, trimmed if needed.
+    """
+    token_budget = CONTEXT_TOKEN_BUDGET if token_budget is None else token_budget
+    with_sources = CONTEXT_SOURCE_TAGS if with_sources is None else with_sources
+    passages = _passages(ranked)
+    tags = source_tags(db, sorted({p.doc_id for p in passages})) if with_sources and passages else {}
+
+    blocks: Dict[int, _Block] = {}
+    kept: List[str] = []
+    used = 0
+    for passage in passages:
+        normalized = _normalized(passage.text)
+        if any(normalized in other for other in kept):
+            continue
+        block = blocks.get(passage.doc_id)
+        cost = chunking.count_tokens(passage.text)
+        if block is None:
+            cost += chunking.count_tokens(tags.get(passage.doc_id, ""))
+        if token_budget and used + cost > token_budget:
+            if kept:
+                # A shorter, lower-ranked passage may still fit
+                continue
+            passage.text = _truncate(passage.text, token_budget - (cost - chunking.count_tokens(passage.text)))
+            cost = token_budget
+        if block is None:
+            block = blocks[passage.doc_id] = _Block(passage.doc_id, passage.rank)
+        block.passages.append(passage)
+        kept.append(normalized)
+        used += cost
+
+    rendered = []
+    for block in sorted(blocks.values(), key=lambda b: b.rank):
+        # Passages of one document in document order
+        body = _SEPARATOR.join(p.text for p in sorted(block.passages, key=lambda p: p.first))
+        tag = tags.get(block.doc_id)
+        rendered.append(f"{tag}\n{body}" if tag else body)
+    return rendered
+
+
+def _truncate(text: str, budget: int) -> str:
+    lines = text.split("\n")
+    while len(lines) > 1 and chunking.count_tokens("\n".join(lines)) > budget:
+        lines.pop()
+    text = "\n".join(lines)
+    if chunking.count_tokens(text) <= budget:
+        return text
+    # A single line longer than the budget: keep the longest prefix that fits
+    low, high = 0, len(text)
+    while low < high:
+        middle = (low + high + 1) // 2
+        if chunking.count_tokens(text[:middle]) <= budget:
+            low = middle
+        else:
+            high = middle - 1
+    return text[:low]
@@ -0,0 +1,122 @@
+"""
+Persistent embedding cache keyed by (model name, sha256 of the chunk text).
+
+Vectors are stored as float32 blobs in a small SQLite file next to the app
+database, so ingestion, reindexing and repeated queries only run the model
+for text it has never seen before. Hits and misses are counted in
+embedding_cache_lookups_total on /metrics (ingestion workers included).
+"""
+import hashlib
+import os
+import sqlite3
+import threading
+from typing import Callable, Dict, Iterable, List
+
+import numpy as np
+
+from app.observability import EMBEDDING_CACHE_LOOKUPS
+
+EMBEDDING_CACHE_PATH = os.getenv("EMBEDDING_CACHE_PATH", "embedding_cache.db")
+
+# SQLite's default limit on bound parameters is 999
+_LOOKUP_BATCH = 500
+
+
+def text_hash(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+class EmbeddingCache:
+    def __init__(self, path: str = EMBEDDING_CACHE_PATH):
+        self.path = path
+        self.hits = 0
+        self.misses = 0
+        self._conn = None
+        self._lock = threading.Lock()
+
+    def _connection(self) -> sqlite3.Connection:
+        # Opened lazily so every ingestion worker process gets its own handle
+        if self._conn is None:
+            conn = sqlite3.connect(self.path, timeout=30, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS embeddings (
+                    model TEXT NOT NULL,
+                    text_hash TEXT NOT NULL,
+                    dim INTEGER NOT NULL,
+                    vector BLOB NOT NULL,
+                    PRIMARY KEY (model, text_hash)
+                ) WITHOUT ROWID
+                """
+            )
+            self._conn = conn
+        return self._conn
+
+    def get_many(self, model: str, hashes: Iterable[str]) -> Dict[str, np.ndarray]:
+        hashes = list(hashes)
+        found = {}
+        with self._lock:
+            conn = self._connection()
+            for start in range(0, len(hashes), _LOOKUP_BATCH):
+                batch = hashes[start:start + _LOOKUP_BATCH]
+                placeholders = ",".join("?" * len(batch))
+                rows = conn.execute(
+                    f"SELECT text_hash, vector FROM embeddings WHERE model = ? AND text_hash IN ({placeholders})",
+                    [model, *batch],
+                )
+                for h, blob in rows:
+                    found[h] = np.frombuffer(blob, dtype=np.float32)
+        return found
+
+    def put_many(self, model: str, vectors: Dict[str, np.ndarray]):
+        rows = [
+            (model, h, int(v.shape[0]), np.asarray(v, dtype=np.float32).tobytes())
+            for h, v in vectors.items()
+        ]
+        with self._lock:
+            conn = self._connection()
+            conn.executemany(
+                "INSERT OR REPLACE INTO embeddings (model, text_hash, dim, vector) VALUES (?, ?, ?, ?)",
+                rows,
+            )
+            conn.commit()
+
+    def embed(self, model: str, texts: List[str], encode: Callable[[List[str]], np.ndarray]) -> np.ndarray:
+        """
+        Returns a (len(texts), dim) float32 matrix, calling encode() only for
+        texts that are not cached yet. Duplicates within texts are encoded once.
+        """
+        if not texts:
+            return np.zeros((0, 0), dtype=np.float32)
+
+        hashes = [text_hash(t) for t in texts]
+        vectors = self.get_many(model, set(hashes))
+
+        pending = {}
+        for h, t in zip(hashes, texts):
+            if h not in vectors and h not in pending:
+                pending[h] = t
+
+        if pending:
+            encoded = np.asarray(encode(list(pending.values())), dtype=np.float32)
+            fresh = dict(zip(pending.keys(), encoded))
+            self.put_many(model, fresh)
+            vectors.update(fresh)
+
+        misses = sum(1 for h in hashes if h in pending)
+        self.misses += misses
+        self.hits += len(hashes) - misses
+        EMBEDDING_CACHE_LOOKUPS.inc(len(hashes) - misses, "hit")
+        EMBEDDING_CACHE_LOOKUPS.inc(misses, "miss")
+
+        return np.stack([vectors[h] for h in hashes])
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / total, 4) if total else 0.0,
+        }
@@ -0,0 +1,105 @@
+import os
+import threading
+
+import numpy as np
+
+from app.embedding_cache import EmbeddingCache
+from app.observability import span
+
+# Use a local model for embeddings to ensure privacy and no cost
+# 'all-MiniLM-L6-v2' is a good balance of speed and quality
+EMBEDDING_MODEL_NAME = "all-MiniLM-L6-v2"
+EMBED_BATCH_SIZE = int(os.getenv("EMBED_BATCH_SIZE", "64"))
+
+# "torch" (fp32 PyTorch), "onnx" (ONNX Runtime, fp32) or "onnx-int8"
+# (dynamically quantized ONNX). The ONNX variants are several times faster
+# on CPU-only hosts; compare them with `python -m benchmarks.embedding_backends`.
+EMBEDDING_BACKEND = os.getenv("EMBEDDING_BACKEND", "torch")
+BACKENDS = ("torch", "onnx", "onnx-int8")
+# ONNX files shipped in the model's hub repo; point EMBEDDING_ONNX_FILE at
+# another export (e.g. onnx/model_qint8_avx512_vnni.onnx, onnx/model_qint8_arm64.onnx)
+# to match the host CPU
+ONNX_FILES = {
+    "onnx": "onnx/model.onnx",
+    "onnx-int8": "onnx/model_quint8_avx2.onnx",
+}
+EMBEDDING_ONNX_FILE = os.getenv("EMBEDDING_ONNX_FILE")
+# Intra-op threads for inference; 0 leaves the runtime's default (all cores).
+# Ingestion workers each load their own model, so INGEST_WORKERS x threads
+# should stay near the core count.
+EMBEDDING_THREADS = int(os.getenv("EMBEDDING_THREADS", "0"))
+
+# Recorded per document; a different value makes reindex_docs.py re-embed.
+# Quantized vectors drift slightly from fp32 ones, so the backend is part of it.
+EMBEDDING_VERSION = EMBEDDING_MODEL_NAME if EMBEDDING_BACKEND == "torch" else f"{EMBEDDING_MODEL_NAME}+{EMBEDDING_BACKEND}"
+
+# Embeddings are cached by (model version, sha256(text)) so unchanged chunks
+# and repeated queries never hit the model twice
+embedding_cache = EmbeddingCache()
+
+_embedding_model = None
+_model_lock = threading.Lock()
+
+def load_model(backend: str = EMBEDDING_BACKEND, threads: int = EMBEDDING_THREADS):
+    """Builds a SentenceTransformer on the given inference backend."""
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown EMBEDDING_BACKEND '{backend}', expected one of {BACKENDS}")
+    from sentence_transformers import SentenceTransformer
+
+    if backend == "torch":
+        if threads:
+            import torch
+            torch.set_num_threads(threads)
+        return SentenceTransformer(EMBEDDING_MODEL_NAME)
+
+    import onnxruntime
+    options = onnxruntime.SessionOptions()
+    if threads:
+        options.intra_op_num_threads = threads
+        options.inter_op_num_threads = 1
+    return SentenceTransformer(
+        EMBEDDING_MODEL_NAME,
+        backend="onnx",
+        model_kwargs={
+            "file_name": EMBEDDING_ONNX_FILE or ONNX_FILES[backend],
+            "provider": "CPUExecutionProvider",
+            "session_options": options,
+        },
+    )
+
+def get_embedding_model():
+    """Loads the configured model on first use (a few seconds, ~100MB)."""
+    global _embedding_model
+    if _embedding_model is None:
+        with _model_lock:
+            if _embedding_model is None:
+                _embedding_model = load_model()
+    return _embedding_model
+
+def _encode(batch: list[str], batch_size: int) -> np.ndarray:
+    # Only cache misses get here, so this is the model's own time
+    with span("embedding"):
+        return get_embedding_model().encode(batch, batch_size=batch_size)
+
+def embed_texts(texts: list[str], batch_size: int = EMBED_BATCH_SIZE) -> np.ndarray:
+    return embedding_cache.embed(
+        EMBEDDING_VERSION,
+        texts,
+        lambda batch: _encode(batch, batch_size),
+    )
+
+_embedding_function_class = None
+
+def local_embedding_function():
+    """Custom embedding function for Chroma. chromadb is imported here, only once a Chroma collection is opened."""
+    global _embedding_function_class
+    if _embedding_function_class is None:
+        import chromadb
+
+        class LocalEmbeddingFunction(chromadb.EmbeddingFunction):
+            def __call__(self, input: list[str]) -> np.ndarray:
+                # Chroma takes the float32 matrix directly, no Python float per value
+                return embed_texts(input)
+
+        _embedding_function_class = LocalEmbeddingFunction
+    return _embedding_function_class()
@@ -0,0 +1,72 @@
+import logging
+import os
+
+from pypdf import PdfReader
+import pytesseract
+from PIL import Image
+
+from app import ocr
+from app.observability import span
+
+logger = logging.getLogger(__name__)
+
+# Text extraction lives apart from rag_engine so extraction worker processes
+# can import it without loading the embedding model or opening ChromaDB.
+
+# Bump when extraction output changes so reindex_docs.py re-extracts
+EXTRACTOR_VERSION = f"v1+ocr-{ocr.OCR_VERSION}"
+
+def extract_text_from_pdf(file_path: str) -> str:
+    reader = PdfReader(file_path)
+    pages = [page.extract_text() or "" for page in reader.pages]
+
+    # Pages without a usable text layer are scanned images: OCR them in parallel
+    scanned = [i for i, text in enumerate(pages) if len(text.strip()) < ocr.OCR_MIN_TEXT_CHARS]
+    if scanned:
+        if ocr.tesseract_available():
+            for i, text in ocr.ocr_pdf_pages(file_path, scanned).items():
+                pages[i] = text
+        else:
+            logger.warning("Tesseract not found. Scanned PDF pages will not be read.")
+
+    return "\n".join(pages) + "\n"
+
+def extract_text_from_image(file_path: str) -> str:
+    try:
+        image = Image.open(file_path)
+        text = ocr.ocr_image(image)
+        return text
+    except pytesseract.TesseractNotFoundError:
+        logger.warning("Tesseract not found. Please install Tesseract-OCR.")
+        return "[Image content cannot be read - Tesseract OCR is not installed on the server]"
+    except Exception as e:
+        logger.error(f"OCR Error: {e}")
+        return f"[Error extracting text from image: {str(e)}]"
+
+def extract_text(file_path: str) -> str:
+    """
+    Extracts the text of a PDF, image or text file.
+    Unreadable files yield a placeholder so they are still indexed by name.
+    """
+    file_ext = os.path.splitext(file_path)[1].lower()
+    text = ""
+
+    with span("extraction"):
+        if file_ext == ".pdf":
+            text = extract_text_from_pdf(file_path)
+        elif file_ext in [".png", ".jpg", ".jpeg"]:
+            text = extract_text_from_image(file_path)
+        elif file_ext == ".txt":
+            with open(file_path, "r", encoding="utf-8") as f:
+                text = f.read()
+
+    logger.debug(f"Extracted {len(text)} characters.")
+
+    if not text.strip():
+        logger.debug("Text is empty. Indexing metadata only.")
+        text = f"Filename: {os.path.basename(file_path)}\n"
+        # We can't easily get description here without DB query, but we can at least index the filename
+        # so the user knows the file exists but is unreadable.
+        text += "[Content unreadable - Scanned document or Image without OCR]"
+
+    return text
@@ -0,0 +1,362 @@
+"""
+Background ingestion queue.
+
+The documents table is the queue: uploads are inserted with status "queued",
+and a dispatcher thread claims them and hands them to a pool of worker
+processes. PDF parsing, OCR and embedding therefore never run on the API
+event loop, and pending work survives restarts because it lives in the DB.
+"""
+import hashlib
+import logging
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from datetime import datetime, timedelta
+from functools import partial
+from typing import Optional, Tuple
+
+from sqlalchemy import or_
+from sqlalchemy.orm import Session
+
+from app import models, database, observability
+from app.answer_cache import answer_cache
+
+logger = logging.getLogger(__name__)
+
+STATUS_QUEUED = "queued"
+STATUS_EXTRACTING = "extracting"
+STATUS_EMBEDDING = "embedding"
+STATUS_INDEXED = "indexed"
+STATUS_FAILED = "failed"
+IN_PROGRESS_STATUSES = (STATUS_EXTRACTING, STATUS_EMBEDDING)
+
+INGEST_WORKERS = int(os.getenv("INGEST_WORKERS", "2"))
+INGEST_POLL_SECONDS = float(os.getenv("INGEST_POLL_SECONDS", "5"))
+# A claim whose status_updated_at is older than this belongs to a process that died; it goes back to the queue
+INGEST_CLAIM_TIMEOUT_SECONDS = int(os.getenv("INGEST_CLAIM_TIMEOUT_SECONDS", "300"))
+
+
+def set_status(db: Session, doc_id: int, status: str, detail: Optional[str] = None) -> bool:
+    """
+    Updates the ingestion status of a document.
+    Returns False if the document no longer exists (deleted while processing).
+    """
+    updated = db.query(models.Document).filter(models.Document.id == doc_id).update(
+        {
+            models.Document.status: status,
+            models.Document.status_detail: detail,
+            models.Document.status_updated_at: datetime.utcnow(),
+        },
+        synchronize_session=False,
+    )
+    db.commit()
+    return updated > 0
+
+
+def file_sha256(file_path: str) -> str:
+    sha256 = hashlib.sha256()
+    with open(file_path, "rb") as f:
+        for block in iter(lambda: f.read(1024 * 1024), b""):
+            sha256.update(block)
+    return sha256.hexdigest()
+
+
+def index_versions() -> dict:
+    """Versions of the extractor, chunker and embedding model chunks are built with now."""
+    # Imported here: extraction and embeddings are heavy for the API process
+    from app import chunking, embeddings, extraction
+    return {
+        "extractor_version": extraction.EXTRACTOR_VERSION,
+        "chunker_version": chunking.CHUNKER_VERSION,
+        "embedding_version": embeddings.EMBEDDING_VERSION,
+    }
+
+
+def record_index_state(db: Session, doc_id: int, file_hash: str, stats: dict, versions: Optional[dict] = None):
+    """Records chunk stats and what the document's chunks were built from."""
+    versions = versions or index_versions()
+    db.query(models.Document).filter(models.Document.id == doc_id).update(
+        {
+            models.Document.chunk_count: stats["chunk_count"],
+            models.Document.avg_chunk_chars: stats["avg_chunk_chars"],
+            models.Document.index_file_hash: file_hash,
+            models.Document.extractor_version: versions["extractor_version"],
+            models.Document.chunker_version: versions["chunker_version"],
+            models.Document.embedding_version: versions["embedding_version"],
+            models.Document.indexed_at: datetime.utcnow(),
+        },
+        synchronize_session=False,
+    )
+    db.commit()
+
+
+def run_ingestion_job(doc_id: int) -> str:
+    """
+    Entry point executed inside a worker process.
+    Opens its own DB session, runs the RAG pipeline and records the outcome.
+    """
+    # Imported here so the model is loaded in the worker, not the dispatcher
+    from app import rag_engine
+
+    db = database.SessionLocal()
+    try:
+        doc = db.query(models.Document).filter(models.Document.id == doc_id).first()
+        if doc is None:
+            return STATUS_FAILED
+
+        try:
+            file_hash = file_sha256(doc.file_path)
+            stats = rag_engine.process_document(
+                doc.id,
+                doc.file_path,
+                db,
+                on_status=lambda status: set_status(db, doc_id, status),
+                user_id=doc.user_id,
+            )
+        except Exception as e:
+            logger.exception(f"Ingestion failed for document {doc_id}")
+            db.rollback()
+            set_status(db, doc_id, STATUS_FAILED, str(e))
+            return STATUS_FAILED
+
+        record_index_state(db, doc_id, file_hash, stats)
+        if not set_status(db, doc_id, STATUS_INDEXED):
+            # Document was deleted while we were indexing it; drop the orphans
+            rag_engine.delete_document_embeddings(doc_id, doc.user_id)
+        return STATUS_INDEXED
+    finally:
+        db.close()
+
+
+def _init_worker(workers: int = INGEST_WORKERS):
+    observability.configure_logging()
+    # This pool's workers share the CPUs with their nested OCR pools
+    from app import ocr
+    ocr.init_pool_worker(workers)
+    # Stage timings recorded in the worker are shipped back with each result
+    observability.collect_for_parent()
+
+
+def _run_job(doc_id: int) -> Tuple[str, list]:
+    try:
+        return run_ingestion_job(doc_id), observability.drain()
+    except Exception:
+        observability.drain()
+        raise
+
+
+class IngestionQueue:
+    """
+    Dispatches queued documents to a process pool.
+
+    Claims are atomic (UPDATE ... WHERE status = 'queued'), so several API
+    processes can each run a queue against the same database. Each queue
+    refreshes status_updated_at on the documents it is running every poll;
+    claims left unrefreshed for INGEST_CLAIM_TIMEOUT_SECONDS (their process
+    crashed) are re-queued by whichever queue notices first.
+    """
+
+    def __init__(self, workers: int = INGEST_WORKERS, poll_seconds: float = INGEST_POLL_SECONDS):
+        self.workers = max(1, workers)
+        self.poll_seconds = poll_seconds
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._slots = threading.BoundedSemaphore(self.workers)
+        self._running = set()
+        self._running_lock = threading.Lock()
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self):
+        if self._thread is not None:
+            return
+        self._recover()
+        self._stop.clear()
+        self._executor = self._new_executor()
+        self._thread = threading.Thread(target=self._run, name="ingestion-dispatcher", daemon=True)
+        self._thread.start()
+        self._wake.set()
+        logger.info(f"Ingestion queue started with {self.workers} worker processes")
+
+    def stop(self):
+        if self._thread is None:
+            return
+        self._stop.set()
+        self._wake.set()
+        self._thread.join()
+        self._thread = None
+        # Jobs cancelled here are handed back to the queue by _on_done()
+        self._executor.shutdown(wait=True, cancel_futures=True)
+        self._executor = None
+
+    def notify(self):
+        """Wakes the dispatcher so a new upload is picked up immediately."""
+        self._wake.set()
+
+    def _new_executor(self) -> ProcessPoolExecutor:
+        # spawn: forking a process that already holds torch/Chroma threads can deadlock
+        return ProcessPoolExecutor(
+            max_workers=self.workers,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=_init_worker,
+            initargs=(self.workers,),
+        )
+
+    def _recover(self):
+        self._requeue_stale()
+        db = database.SessionLocal()
+        try:
+            # Rows created before the queue existed were indexed inline on upload
+            db.query(models.Document).filter(
+                models.Document.status.is_(None)
+            ).update({models.Document.status: STATUS_INDEXED}, synchronize_session=False)
+            db.commit()
+        finally:
+            db.close()
+
+    def _requeue_stale(self):
+        # Claims of a crashed process stop being refreshed; live ones (ours or
+        # another process's) are touched every poll by _heartbeat()
+        cutoff = datetime.utcnow() - timedelta(seconds=INGEST_CLAIM_TIMEOUT_SECONDS)
+        db = database.SessionLocal()
+        try:
+            requeued = db.query(models.Document).filter(
+                models.Document.status.in_(IN_PROGRESS_STATUSES),
+                or_(models.Document.status_updated_at.is_(None), models.Document.status_updated_at < cutoff),
+            ).update(
+                {models.Document.status: STATUS_QUEUED, models.Document.status_updated_at: datetime.utcnow()},
+                synchronize_session=False,
+            )
+            db.commit()
+        finally:
+            db.close()
+        if requeued:
+            logger.warning(f"Re-queued {requeued} documents whose ingestion claim went stale")
+
+    def _heartbeat(self):
+        with self._running_lock:
+            running = list(self._running)
+        if not running:
+            return
+        db = database.SessionLocal()
+        try:
+            db.query(models.Document).filter(
+                models.Document.id.in_(running),
+                models.Document.status.in_(IN_PROGRESS_STATUSES),
+            ).update({models.Document.status_updated_at: datetime.utcnow()}, synchronize_session=False)
+            db.commit()
+        finally:
+            db.close()
+
+    def _release_claim(self, doc_id: int):
+        """Puts a claimed document that never ran back in the queue."""
+        db = database.SessionLocal()
+        try:
+            db.query(models.Document).filter(
+                models.Document.id == doc_id,
+                models.Document.status == STATUS_EXTRACTING,
+            ).update(
+                {models.Document.status: STATUS_QUEUED, models.Document.status_updated_at: datetime.utcnow()},
+                synchronize_session=False,
+            )
+            db.commit()
+        finally:
+            db.close()
+
+    def _run(self):
+        while not self._stop.is_set():
+            self._wake.wait(self.poll_seconds)
+            self._wake.clear()
+            if self._stop.is_set():
+                break
+            try:
+                self._heartbeat()
+                self._requeue_stale()
+                self._dispatch_pending()
+            except Exception:
+                logger.exception("Ingestion dispatcher error")
+
+    def _dispatch_pending(self):
+        while not self._stop.is_set() and self._slots.acquire(blocking=False):
+            claimed = self._claim_next()
+            if claimed is None:
+                self._slots.release()
+                return
+            doc_id, user_id = claimed
+            try:
+                future = self._submit(doc_id)
+            except Exception:
+                # Hand back the slot and the document; the next poll retries it
+                self._slots.release()
+                self._release_claim(doc_id)
+                raise
+            with self._running_lock:
+                self._running.add(doc_id)
+            future.add_done_callback(partial(self._on_done, doc_id, user_id))
+
+    def _submit(self, doc_id: int):
+        try:
+            return self._executor.submit(_run_job, doc_id)
+        except BrokenProcessPool:
+            logger.error("Ingestion pool is broken, restarting it")
+            self._executor = self._new_executor()
+            return self._executor.submit(_run_job, doc_id)
+
+    def _claim_next(self) -> Optional[Tuple[int, int]]:
+        db = database.SessionLocal()
+        try:
+            while True:
+                row = (
+                    db.query(models.Document.id, models.Document.user_id)
+                    .filter(models.Document.status == STATUS_QUEUED)
+                    .order_by(models.Document.id)
+                    .first()
+                )
+                if row is None:
+                    return None
+                claimed = db.query(models.Document).filter(
+                    models.Document.id == row.id,
+                    models.Document.status == STATUS_QUEUED,
+                ).update(
+                    {
+                        models.Document.status: STATUS_EXTRACTING,
+                        models.Document.status_updated_at: datetime.utcnow(),
+                    },
+                    synchronize_session=False,
+                )
+                db.commit()
+                if claimed:
+                    return row.id, row.user_id
+                # Another process claimed it first; try the next one
+        finally:
+            db.close()
+
+    def _on_done(self, doc_id: int, user_id: int, future):
+        with self._running_lock:
+            self._running.discard(doc_id)
+        self._slots.release()
+        if future.cancelled():
+            # Cancelled by stop() before it started
+            self._release_claim(doc_id)
+            return
+        from app import rag_engine
+        # The worker wrote to Chroma from another process
+        rag_engine.reopen_client()
+        # The user's cached chat answers predate this document
+        answer_cache.invalidate(user_id)
+        if future.exception() is not None:
+            # The worker process itself died (OOM, segfault in a native lib...)
+            logger.error(f"Ingestion worker crashed on document {doc_id}: {future.exception()}")
+            db = database.SessionLocal()
+            try:
+                set_status(db, doc_id, STATUS_FAILED, f"Worker crashed: {future.exception()}")
+            finally:
+                db.close()
+        else:
+            observability.replay(future.result()[1])
+        self._wake.set()
+
+
+queue = IngestionQueue()
@@ -0,0 +1,143 @@
+"""
+Local BM25 index over document chunks (SQLite FTS5).
+
+MiniLM embeddings are good at paraphrases but weak on exact tokens that
+matter in medical records: lab codes, drug names, numeric values, doctor
+names. This index holds the same chunks as ChromaDB, plus each document's
+filename/category/description/metadata_info, and is kept in sync by
+process_document and delete_document_embeddings. rag_engine fuses its
+ranking with the vector ranking.
+
+Rows live in a plain table (chunk_rows, indexed on doc_id and
+(user_id, doc_id)) that an external-content FTS5 table indexes through
+triggers, so deletes by document are index lookups. Each row also carries
+its owner as an indexed token ("u42"); searches match it alongside the
+query terms, so BM25 only ranks the asking user's chunks.
+"""
+import os
+import re
+import sqlite3
+import threading
+from typing import Iterable, List, Tuple
+
+LEXICAL_INDEX_PATH = os.getenv("LEXICAL_INDEX_PATH", "lexical_index.db")
+
+# Relative BM25 weight of chunk text vs. the per-document metadata column
+_TEXT_WEIGHT = 1.0
+_META_WEIGHT = 0.5
+
+# Words like "13.5", "g/dL" or "HbA1c" are kept whole; FTS5 turns them into phrases
+_QUERY_TERM = re.compile(r"\w+(?:[./,-]\w+)*")
+_STOPWORDS = frozenset(
+    "a an and are as at be by can did do does for from had has have how i in is it "
+    "me my of on or our show tell that the their there this to was were what when "
+    "where which who why with you your".split()
+)
+_INSERT = "INSERT INTO chunk_rows (chunk_id, doc_id, user_id, text, meta, owner) VALUES (?, ?, ?, ?, ?, ?)"
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS chunk_rows (
+    id INTEGER PRIMARY KEY,
+    chunk_id TEXT NOT NULL,
+    doc_id INTEGER NOT NULL,
+    user_id INTEGER NOT NULL,
+    text TEXT NOT NULL,
+    meta TEXT NOT NULL,
+    owner TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS ix_chunk_rows_doc_id ON chunk_rows (doc_id);
+CREATE INDEX IF NOT EXISTS ix_chunk_rows_user_id_doc_id ON chunk_rows (user_id, doc_id);
+CREATE VIRTUAL TABLE IF NOT EXISTS chunk_fts USING fts5(
+    text,
+    meta,
+    owner,
+    content = 'chunk_rows',
+    content_rowid = 'id',
+    tokenize = 'unicode61 remove_diacritics 2'
+);
+CREATE TRIGGER IF NOT EXISTS chunk_rows_ai AFTER INSERT ON chunk_rows BEGIN
+    INSERT INTO chunk_fts (rowid, text, meta, owner) VALUES (new.id, new.text, new.meta, new.owner);
+END;
+CREATE TRIGGER IF NOT EXISTS chunk_rows_ad AFTER DELETE ON chunk_rows BEGIN
+    INSERT INTO chunk_fts (chunk_fts, rowid, text, meta, owner) VALUES ('delete', old.id, old.text, old.meta, old.owner);
+END;
+"""
+
+
+def query_terms(text: str) -> List[str]:
+    return [t for t in _QUERY_TERM.findall(text.lower()) if t not in _STOPWORDS]
+
+
+def _owner(user_id: int) -> str:
+    return f"u{user_id}"
+
+
+class LexicalIndex:
+    def __init__(self, path: str = LEXICAL_INDEX_PATH):
+        self.path = path
+        self._conn = None
+        self._lock = threading.Lock()
+
+    def _connection(self) -> sqlite3.Connection:
+        # Opened lazily so every ingestion worker process gets its own handle
+        if self._conn is None:
+            conn = sqlite3.connect(self.path, timeout=30, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.executescript(_SCHEMA)
+            self._conn = conn
+        return self._conn
+
+    def add_chunks(self, rows: Iterable[Tuple[str, int, int, str, str]]):
+        """Inserts (chunk_id, doc_id, user_id, text, meta) rows."""
+        with self._lock:
+            conn = self._connection()
+            conn.executemany(_INSERT, ((*row, _owner(row[2])) for row in rows))
+            conn.commit()
+
+    def replace_document(self, doc_id: int, user_id: int, ids: List[str], chunks: List[str], meta: str = ""):
+        with self._lock:
+            conn = self._connection()
+            conn.execute("DELETE FROM chunk_rows WHERE doc_id = ?", (doc_id,))
+            conn.executemany(
+                _INSERT,
+                [(chunk_id, doc_id, user_id, chunk, meta, _owner(user_id)) for chunk_id, chunk in zip(ids, chunks)],
+            )
+            conn.commit()
+
+    def delete_document(self, doc_id: int):
+        with self._lock:
+            conn = self._connection()
+            conn.execute("DELETE FROM chunk_rows WHERE doc_id = ?", (doc_id,))
+            conn.commit()
+
+    def document_ids(self) -> set:
+        with self._lock:
+            return {row[0] for row in self._connection().execute("SELECT DISTINCT doc_id FROM chunk_rows")}
+
+    def search(self, user_id: int, query_text: str, limit: int = 10) -> List[Tuple[str, str]]:
+        """
+        Returns up to limit (chunk_id, text) pairs of user_id's chunks, best
+        BM25 score first. Any query term may match.
+        """
+        terms = query_terms(query_text)
+        if not terms:
+            return []
+        any_term = " OR ".join('"{}"'.format(t.replace('"', "")) for t in terms)
+        # The owner token narrows the match before ranking; its column has no BM25 weight
+        match = f'owner : "{_owner(user_id)}" AND ({any_term})'
+        with self._lock:
+            rows = self._connection().execute(
+                f"""
+                SELECT r.chunk_id, r.text FROM chunk_fts
+                JOIN chunk_rows r ON r.id = chunk_fts.rowid
+                WHERE chunk_fts MATCH ?
+                ORDER BY bm25(chunk_fts, {_TEXT_WEIGHT}, {_META_WEIGHT}, 0.0)
+                LIMIT ?
+                """,
+                (match, limit),
+            ).fetchall()
+        return [(chunk_id, text) for chunk_id, text in rows]
+
+
+lexical_index = LexicalIndex()
@@ -0,0 +1,371 @@
+"""
+Long-lived LLM client.
+
+query_rag and the chat endpoints talk to one process-wide LLMClient rather
+than building a Gemini SDK model per request. The client owns:
+
+- a reused httpx.AsyncClient (keep-alive connections to the provider),
+- a semaphore capping concurrent provider calls at LLM_MAX_CONCURRENCY,
+- a per-call deadline (LLM_TIMEOUT_SECONDS) covering queueing, retries and
+  the call itself,
+- retries with full jitter on transient failures (timeouts, connection
+  errors, 429/5xx, honouring Retry-After),
+- single-flight: identical prompts already in flight share one call.
+
+It runs on its own event loop thread, so sync callers (query_rag in the
+threadpool, scripts) and async ones (the streaming endpoint) share the same
+connections, limit and in-flight table.
+
+Providers are pluggable: "gemini" speaks Gemini's REST API (GEMINI_BASE_URL
+can point it at `python -m benchmarks.stub_llm_server`), "stub" answers in
+process without any network.
+"""
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import random
+import re
+import threading
+import time
+from typing import AsyncIterator, Optional
+
+import httpx
+
+from app.observability import observe_stage
+
+logger = logging.getLogger(__name__)
+
+GEMINI_MODEL = os.getenv("GEMINI_MODEL", "gemini-2.0-flash-exp")
+GEMINI_BASE_URL = os.getenv("GEMINI_BASE_URL", "https://generativelanguage.googleapis.com")
+LLM_PROVIDER = os.getenv("LLM_PROVIDER", "gemini")
+
+LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", "8"))
+LLM_TIMEOUT_SECONDS = float(os.getenv("LLM_TIMEOUT_SECONDS", "60"))
+LLM_CONNECT_TIMEOUT_SECONDS = float(os.getenv("LLM_CONNECT_TIMEOUT_SECONDS", "5"))
+LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "2"))
+LLM_RETRY_BASE_SECONDS = float(os.getenv("LLM_RETRY_BASE_SECONDS", "0.5"))
+
+RETRYABLE_STATUS = {408, 429, 500, 502, 503, 504}
+
+
+class LLMConfigError(Exception):
+    """The configured provider cannot be used (e.g. missing API key)."""
+
+
+class LLMError(Exception):
+    """The provider call failed for good (after retries, or not retryable)."""
+
+
+class LLMTimeout(LLMError):
+    """The call's deadline passed."""
+
+
+class TransientLLMError(LLMError):
+    """Worth retrying; retry_after is the provider's hint in seconds, if any."""
+
+    def __init__(self, message: str, retry_after: Optional[float] = None):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+def stub_answer(prompt: str) -> str:
+    """Echoes the first words of the prompt's context; shared by the stub provider and stub server."""
+    match = re.search(r"Context:\s*(.*?)\s*Question:", prompt, re.S)
+    context = match.group(1).strip() if match else ""
+    if not context:
+        return "I cannot find this information in your documents."
+    return f"Based on your documents: {' '.join(context.split()[:40])}"
+
+
+class Provider:
+    name = "base"
+
+    async def generate(self, http: httpx.AsyncClient, prompt: str) -> str:
+        return "".join([token async for token in self.stream(http, prompt)])
+
+    def stream(self, http: httpx.AsyncClient, prompt: str) -> AsyncIterator[str]:
+        raise NotImplementedError
+
+
+class GeminiProvider(Provider):
+    name = "gemini"
+
+    def __init__(self, api_key: str, model_name: str = GEMINI_MODEL, base_url: str = GEMINI_BASE_URL):
+        self.api_key = api_key
+        self.url = f"{base_url.rstrip('/')}/v1beta/models/{model_name}"
+
+    def _request(self, prompt: str) -> dict:
+        return {
+            "headers": {"x-goog-api-key": self.api_key},
+            "json": {"contents": [{"role": "user", "parts": [{"text": prompt}]}]},
+        }
+
+    @staticmethod
+    def _check(response: httpx.Response):
+        if response.status_code in RETRYABLE_STATUS:
+            retry_after = response.headers.get("Retry-After")
+            raise TransientLLMError(
+                f"Gemini returned {response.status_code}",
+                float(retry_after) if retry_after and retry_after.isdigit() else None,
+            )
+        if response.status_code >= 400:
+            raise LLMError(f"Gemini returned {response.status_code}: {response.text[:200]}")
+
+    @staticmethod
+    def _text(payload: dict) -> str:
+        candidates = payload.get("candidates") or [{}]
+        parts = candidates[0].get("content", {}).get("parts", [])
+        return "".join(part.get("text", "") for part in parts)
+
+    async def generate(self, http: httpx.AsyncClient, prompt: str) -> str:
+        response = await http.post(f"{self.url}:generateContent", **self._request(prompt))
+        self._check(response)
+        return self._text(response.json())
+
+    async def stream(self, http: httpx.AsyncClient, prompt: str) -> AsyncIterator[str]:
+        async with http.stream("POST", f"{self.url}:streamGenerateContent", params={"alt": "sse"},
+                               **self._request(prompt)) as response:
+            if response.status_code >= 400:
+                await response.aread()
+                self._check(response)
+            async for line in response.aiter_lines():
+                if line.startswith("data:"):
+                    text = self._text(json.loads(line[5:]))
+                    if text:
+                        yield text
+
+
+class StubProvider(Provider):
+    """
+    Deterministic offline provider, no network.
+    STUB_LLM_DELAY_MS adds a per-token delay to mimic a real model.
+    """
+    name = "stub"
+
+    def __init__(self, delay_ms: float = float(os.getenv("STUB_LLM_DELAY_MS", "0"))):
+        self.delay = delay_ms / 1000
+
+    async def stream(self, http: httpx.AsyncClient, prompt: str) -> AsyncIterator[str]:
+        for token in re.findall(r"\S+\s*", stub_answer(prompt)):
+            if self.delay:
+                await asyncio.sleep(self.delay)
+            yield token
+
+
+_DONE = object()
+
+
+class LLMClient:
+    def __init__(
+        self,
+        provider: Provider,
+        max_concurrency: int = LLM_MAX_CONCURRENCY,
+        timeout: float = LLM_TIMEOUT_SECONDS,
+        max_retries: int = LLM_MAX_RETRIES,
+        retry_base: float = LLM_RETRY_BASE_SECONDS,
+    ):
+        self.provider = provider
+        self.max_concurrency = max_concurrency
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.retry_base = retry_base
+        self.calls = 0
+        self.coalesced = 0
+        self.retries = 0
+        self.failures = 0
+        self._loop = None
+        self._thread = None
+        self._lock = threading.Lock()
+        # Only touched from the client's own loop
+        self._http = None
+        self._semaphore = None
+        self._inflight = {}
+
+    def _ensure_loop(self) -> asyncio.AbstractEventLoop:
+        with self._lock:
+            if self._loop is None:
+                self._loop = asyncio.new_event_loop()
+                self._thread = threading.Thread(target=self._loop.run_forever, name="llm-client", daemon=True)
+                self._thread.start()
+            return self._loop
+
+    def _submit(self, coro):
+        return asyncio.run_coroutine_threadsafe(coro, self._ensure_loop())
+
+    def _http_client(self) -> httpx.AsyncClient:
+        if self._http is None:
+            self._http = httpx.AsyncClient(
+                timeout=httpx.Timeout(self.timeout, connect=LLM_CONNECT_TIMEOUT_SECONDS),
+                limits=httpx.Limits(max_connections=self.max_concurrency, max_keepalive_connections=self.max_concurrency),
+            )
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        return self._http
+
+    def close(self):
+        with self._lock:
+            loop, self._loop = self._loop, None
+        if loop is None:
+            return
+
+        async def shutdown():
+            if self._http is not None:
+                await self._http.aclose()
+                self._http = None
+
+        asyncio.run_coroutine_threadsafe(shutdown(), loop).result(timeout=5)
+        loop.call_soon_threadsafe(loop.stop)
+        self._thread.join(timeout=5)
+        loop.close()
+
+    def stats(self) -> dict:
+        return {
+            "provider": self.provider.name,
+            "max_concurrency": self.max_concurrency,
+            "in_flight": len(self._inflight),
+            "calls": self.calls,
+            "coalesced": self.coalesced,
+            "retries": self.retries,
+            "failures": self.failures,
+        }
+
+    def _backoff(self, attempt: int, error: TransientLLMError) -> float:
+        # Full jitter keeps a burst of failed calls from retrying in lockstep
+        if error.retry_after is not None:
+            return error.retry_after
+        return random.uniform(0, self.retry_base * 2 ** attempt)
+
+    async def _attempt(self, call, http: httpx.AsyncClient):
+        queued = time.perf_counter()
+        async with self._semaphore:
+            observe_stage("llm_queue_wait", time.perf_counter() - queued)
+            self.calls += 1
+            return await call(http)
+
+    async def _with_retries(self, call, timeout: Optional[float]):
+        """Runs call() under the semaphore until it succeeds, fails for good or the deadline passes."""
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + (timeout or self.timeout)
+        http = self._http_client()
+        attempt = 0
+        while True:
+            remaining = deadline - loop.time()
+            try:
+                if remaining <= 0:
+                    raise asyncio.TimeoutError
+                return await asyncio.wait_for(self._attempt(call, http), remaining)
+            except asyncio.TimeoutError:
+                self.failures += 1
+                raise LLMTimeout(f"LLM call exceeded its {timeout or self.timeout:g}s deadline")
+            except (httpx.TimeoutException, httpx.TransportError) as e:
+                error = TransientLLMError(f"{type(e).__name__}: {e}")
+            except TransientLLMError as e:
+                error = e
+            except LLMError:
+                self.failures += 1
+                raise
+
+            delay = self._backoff(attempt, error)
+            attempt += 1
+            if attempt > self.max_retries or loop.time() + delay >= deadline:
+                self.failures += 1
+                raise LLMError(f"LLM call failed after {attempt} attempts: {error}") from error
+            self.retries += 1
+            logger.warning(f"Transient LLM error ({error}), retry {attempt} in {delay:.2f}s")
+            await asyncio.sleep(delay)
+
+    async def _generate(self, prompt: str, timeout: Optional[float]) -> str:
+        key = hashlib.sha256(prompt.encode("utf-8")).hexdigest()
+        task = self._inflight.get(key)
+        if task is None:
+            task = asyncio.ensure_future(
+                self._with_retries(lambda http: self.provider.generate(http, prompt), timeout)
+            )
+            self._inflight[key] = task
+            task.add_done_callback(lambda _: self._inflight.pop(key, None))
+        else:
+            self.coalesced += 1
+        # shield: a caller that gives up must not cancel the call others wait on
+        return await asyncio.shield(task)
+
+    async def _stream_into(self, prompt: str, timeout: Optional[float], put):
+        sent = False
+
+        async def call(http):
+            nonlocal sent
+            async for token in self.provider.stream(http, prompt):
+                sent = True
+                put(token)
+
+        async def guarded(http):
+            try:
+                await call(http)
+            except (TransientLLMError, httpx.TimeoutException, httpx.TransportError) as e:
+                if sent:
+                    # Tokens already reached the client; a retry would repeat them
+                    raise LLMError(f"LLM stream interrupted: {e}") from e
+                raise
+
+        try:
+            await self._with_retries(guarded, timeout)
+            put(_DONE)
+        except Exception as e:
+            put(e)
+
+    def generate(self, prompt: str, timeout: Optional[float] = None) -> str:
+        """Blocking; for sync callers (threadpool, scripts)."""
+        return self._submit(self._generate(prompt, timeout)).result()
+
+    async def agenerate(self, prompt: str, timeout: Optional[float] = None) -> str:
+        return await asyncio.wrap_future(self._submit(self._generate(prompt, timeout)))
+
+    async def astream(self, prompt: str, timeout: Optional[float] = None) -> AsyncIterator[str]:
+        """Yields answer text as the provider produces it. Streams are not coalesced."""
+        caller = asyncio.get_running_loop()
+        queue: asyncio.Queue = asyncio.Queue()
+        future = self._submit(self._stream_into(prompt, timeout, lambda item: caller.call_soon_threadsafe(queue.put_nowait, item)))
+        try:
+            while True:
+                item = await queue.get()
+                if item is _DONE:
+                    return
+                if isinstance(item, Exception):
+                    raise item
+                yield item
+        finally:
+            # The client went away: stop generating and free the slot
+            future.cancel()
+
+
+def make_provider(name: str = LLM_PROVIDER) -> Provider:
+    if name == "stub":
+        return StubProvider()
+    if name != "gemini":
+        raise LLMConfigError(f"[System] Unknown LLM_PROVIDER '{name}'.")
+    api_key = os.getenv("GEMINI_API_KEY")
+    if not api_key or api_key == "paste_your_key_here":
+        raise LLMConfigError("[System] Gemini API Key is missing. Please add it to backend/.env file.")
+    return GeminiProvider(api_key)
+
+
+_client = None
+_client_lock = threading.Lock()
+
+
+def get_client() -> LLMClient:
+    """The process-wide client; raises LLMConfigError until the provider is configured."""
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                _client = LLMClient(make_provider())
+    return _client
+
+
+def close_client():
+    global _client
+    with _client_lock:
+        client, _client = _client, None
+    if client is not None:
+        client.close()
@@ -1,21 +1,51 @@
-from fastapi import FastAPI
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, Request
 from fastapi.middleware.cors import CORSMiddleware
-from app.database import engine, Base
+from fastapi.responses import PlainTextResponse
 from app.routers import auth, documents, chat
+from app import ingestion, llm, migrations, observability, rag_engine
+from app.answer_cache import answer_cache
+from app.passwords import password_pool
 import logging
+import os
+import threading
+import time
 
-# Configure logging
-logging.basicConfig(level=logging.INFO)
+# Leveled logging with the request's trace id on every line (LOG_LEVEL=DEBUG for stage detail)
+observability.configure_logging()
 logger = logging.getLogger(__name__)
 
-# Create database tables
+# Create database tables / apply pending schema migrations
 try:
-    Base.metadata.create_all(bind=engine)
+    migrations.upgrade()
     logger.info("Database tables created successfully")
 except Exception as e:
     logger.error(f"Error creating database tables: {e}")
 
-app = FastAPI(title="Medical Records RAG App")
+RAG_WARMUP = os.getenv("RAG_WARMUP", "1") == "1"
+
+def warm_up_rag():
+    start = time.perf_counter()
+    try:
+        rag_engine.warm_up()
+        logger.info(f"RAG engine warmed up in {time.perf_counter() - start:.1f}s")
+    except Exception as e:
+        logger.error(f"RAG warm-up failed, will retry lazily on first use: {e}")
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Uploads are indexed by background worker processes, not in the request
+    ingestion.queue.start()
+    if RAG_WARMUP:
+        # Load the model and vector store off the startup path so /health and
+        # /auth/* are served while it happens
+        threading.Thread(target=warm_up_rag, name="rag-warmup", daemon=True).start()
+    yield
+    ingestion.queue.stop()
+    password_pool.shutdown()
+    llm.close_client()
+
+app = FastAPI(title="Medical Records RAG App", lifespan=lifespan)
 
 # CORS setup
 origins = [
@@ -29,8 +59,33 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    # Paging and caching headers of GET /documents/, file downloads, and the trace id
+    expose_headers=["X-Next-Cursor", "ETag", "X-Request-ID", "Content-Range", "Accept-Ranges", "Content-Disposition"],
 )
 
+@app.middleware("http")
+async def trace_requests(request: Request, call_next):
+    # Honour an upstream proxy's id so logs can be joined across services
+    trace_id = request.headers.get("X-Request-ID") or observability.new_trace_id()
+    token = observability.trace_id_var.set(trace_id)
+    start = time.perf_counter()
+    status = 500
+    try:
+        response = await call_next(request)
+        status = response.status_code
+        response.headers["X-Request-ID"] = trace_id
+        return response
+    finally:
+        # The route template, not the raw path, so ids don't explode the label set
+        route = request.scope.get("route")
+        observability.HTTP_SECONDS.observe(
+            time.perf_counter() - start,
+            request.method,
+            route.path if route is not None else "unmatched",
+            str(status),
+        )
+        observability.trace_id_var.reset(token)
+
 app.include_router(auth.router)
 app.include_router(documents.router)
 app.include_router(chat.router)
@@ -39,6 +94,21 @@ app.include_router(chat.router)
 def read_root():
     return {"message": "Medical Records RAG API is running"}
 
+@app.get("/metrics", response_class=PlainTextResponse)
+def metrics():
+    """Prometheus text exposition of the stage and request latency histograms and cache counters."""
+    return PlainTextResponse(observability.render_metrics(), media_type="text/plain; version=0.0.4")
+
 @app.get("/health")
 def health_check():
-    return {"status": "ok", "message": "Backend is healthy"}
+    try:
+        llm_stats = llm.get_client().stats()
+    except llm.LLMConfigError as e:
+        llm_stats = {"error": str(e)}
+    return {
+        "status": "ok",
+        "message": "Backend is healthy",
+        "password_pool": password_pool.stats(),
+        "llm": llm_stats,
+        "answer_cache": answer_cache.stats(),
+    }
@@ -0,0 +1,116 @@
+"""
+Versioned schema migrations, applied in order and recorded in the
+schema_migrations table (the same idea as Alembic's alembic_version, without
+the dependency).
+
+The app upgrades on startup; `python migrate.py --status` shows what an
+existing database is missing. New schema changes get a new entry at the
+end of MIGRATIONS; never edit one that has shipped.
+"""
+import logging
+from datetime import datetime
+from typing import Callable, List, Tuple
+
+from sqlalchemy import Column, DateTime, MetaData, String, Table, inspect, text
+from sqlalchemy.engine import Connection
+
+from app import database, models  # noqa: F401  (models registers the tables on Base)
+
+logger = logging.getLogger(__name__)
+
+_metadata = MetaData()
+schema_migrations = Table(
+    "schema_migrations",
+    _metadata,
+    Column("version", String(32), primary_key=True),
+    Column("description", String),
+    Column("applied_at", DateTime),
+)
+
+
+def _create_tables(conn: Connection):
+    # A fresh database gets the current schema here, so later steps are no-ops
+    database.Base.metadata.create_all(bind=conn)
+
+
+def _add_document_columns(conn: Connection):
+    # Columns added before migrations existed; spelled out so later model changes can't alter this step
+    existing = {col["name"] for col in inspect(conn).get_columns("documents")}
+    for name, col_type in [
+        ("file_size", "INTEGER"),
+        ("content_hash", "VARCHAR"),
+        ("status", "VARCHAR"),
+        ("status_detail", "TEXT"),
+        ("status_updated_at", "DATETIME" if conn.dialect.name == "sqlite" else "TIMESTAMP"),
+        ("chunk_count", "INTEGER"),
+        ("avg_chunk_chars", "FLOAT"),
+    ]:
+        if name not in existing:
+            conn.execute(text(f"ALTER TABLE documents ADD COLUMN {name} {col_type}"))
+
+
+def _index_documents_user_upload(conn: Connection):
+    conn.execute(text(
+        "CREATE INDEX IF NOT EXISTS ix_documents_user_id_upload_date "
+        "ON documents (user_id, upload_date)"
+    ))
+
+
+def _add_index_state_columns(conn: Connection):
+    existing = {col["name"] for col in inspect(conn).get_columns("documents")}
+    for name, col_type in [
+        ("index_file_hash", "VARCHAR"),
+        ("extractor_version", "VARCHAR"),
+        ("chunker_version", "VARCHAR"),
+        ("embedding_version", "VARCHAR"),
+        ("indexed_at", "DATETIME" if conn.dialect.name == "sqlite" else "TIMESTAMP"),
+    ]:
+        if name not in existing:
+            conn.execute(text(f"ALTER TABLE documents ADD COLUMN {name} {col_type}"))
+
+
+def _create_blobs_table(conn: Connection):
+    models.Blob.__table__.create(bind=conn, checkfirst=True)
+
+
+def _index_documents_hash_status(conn: Connection):
+    # 0002 added these columns without the indexes the model declares, so only fresh databases had them
+    conn.execute(text("CREATE INDEX IF NOT EXISTS ix_documents_content_hash ON documents (content_hash)"))
+    conn.execute(text("CREATE INDEX IF NOT EXISTS ix_documents_status ON documents (status)"))
+
+
+MIGRATIONS: List[Tuple[str, str, Callable[[Connection], None]]] = [
+    ("0001", "baseline tables", _create_tables),
+    ("0002", "document ingestion, dedup and chunk stat columns", _add_document_columns),
+    ("0003", "index documents (user_id, upload_date)", _index_documents_user_upload),
+    ("0004", "per-document index state for incremental reindexing", _add_index_state_columns),
+    ("0005", "content-addressed blob store with reference counts", _create_blobs_table),
+    ("0006", "index documents content_hash and status", _index_documents_hash_status),
+]
+
+
+def applied_versions(conn: Connection) -> set:
+    schema_migrations.create(bind=conn, checkfirst=True)
+    return {row.version for row in conn.execute(schema_migrations.select())}
+
+
+def pending_migrations() -> List[Tuple[str, str]]:
+    with database.engine.begin() as conn:
+        applied = applied_versions(conn)
+    return [(version, description) for version, description, _ in MIGRATIONS if version not in applied]
+
+
+def upgrade() -> List[str]:
+    """Applies every pending migration, each in its own transaction. Returns the versions applied."""
+    done = []
+    for version, description, migrate in MIGRATIONS:
+        with database.engine.begin() as conn:
+            if version in applied_versions(conn):
+                continue
+            logger.info(f"Applying migration {version}: {description}")
+            migrate(conn)
+            conn.execute(schema_migrations.insert().values(
+                version=version, description=description, applied_at=datetime.utcnow()
+            ))
+        done.append(version)
+    return done
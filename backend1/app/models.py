@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, DateTime, ForeignKey, Text
+from sqlalchemy import Column, Integer, Float, String, DateTime, ForeignKey, Index, Text
 from sqlalchemy.orm import relationship
 from datetime import datetime
 from app.database import Base
@@ -25,5 +25,40 @@ class Document(Base):
     category = Column(String, nullable=True)
     description = Column(Text, nullable=True)
     metadata_info = Column(Text, nullable=True) # JSON string for extra metadata (doctor, hospital, etc)
-    
+    file_size = Column(Integer, nullable=True)
+    content_hash = Column(String, nullable=True, index=True) # SHA-256 of the uploaded bytes, used for dedup
+    # Ingestion state: queued -> extracting -> embedding -> indexed | failed
+    status = Column(String, default="queued", index=True)
+    status_detail = Column(Text, nullable=True) # Error message when status is "failed"
+    status_updated_at = Column(DateTime, default=datetime.utcnow, nullable=True)
+    chunk_count = Column(Integer, nullable=True)
+    avg_chunk_chars = Column(Float, nullable=True)
+    # What the current chunks were built from; reindex_docs.py only reprocesses
+    # documents where one of these no longer matches
+    index_file_hash = Column(String, nullable=True)
+    extractor_version = Column(String, nullable=True)
+    chunker_version = Column(String, nullable=True)
+    embedding_version = Column(String, nullable=True)
+    indexed_at = Column(DateTime, nullable=True)
+
     owner = relationship("User", back_populates="documents")
+
+    # Listing, chat and delete all filter on user_id; listings sort by upload_date
+    __table_args__ = (
+        Index("ix_documents_user_id_upload_date", "user_id", "upload_date"),
+    )
+
+class Blob(Base):
+    """
+    One stored file in uploaded_files/blobs, shared by every document with
+    the same content_hash. ref_count is kept by app.blob_store; gc_blobs.py
+    deletes blobs that have stayed unreferenced past the grace period.
+    """
+    __tablename__ = "blobs"
+
+    content_hash = Column(String, primary_key=True) # SHA-256 of the bytes
+    path = Column(String)
+    size = Column(Integer, nullable=True)
+    ref_count = Column(Integer, default=0, nullable=False)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    unreferenced_at = Column(DateTime, nullable=True) # When ref_count last dropped to 0
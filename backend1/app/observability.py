@@ -0,0 +1,235 @@
+"""
+Timing spans, Prometheus histograms and per-request trace ids.
+
+    with span("chroma_query"):
+        results = collection.query(...)
+
+records the duration in rag_stage_duration_seconds{stage="chroma_query"} and
+logs it at DEBUG with the current request's trace id. Histograms are plain
+in-process counters (a lock and a bisect per observation), cheap enough to
+leave on; GET /metrics renders them in the Prometheus text format, along
+with the counters of any register_collector() callback (caches, pools).
+
+Ingestion workers run in other processes: they drain() what they recorded
+(stage timings and counter increments) and the API process replay()s it,
+so /metrics covers their work too.
+"""
+import bisect
+import contextvars
+import logging
+import os
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+LOG_FORMAT = "%(asctime)s %(levelname)s [%(trace_id)s] %(name)s: %(message)s"
+
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+trace_id_var: contextvars.ContextVar[str] = contextvars.ContextVar("trace_id", default="-")
+
+logger = logging.getLogger(__name__)
+
+
+def new_trace_id() -> str:
+    return uuid.uuid4().hex[:16]
+
+
+class TraceIdFilter(logging.Filter):
+    def filter(self, record: logging.LogRecord) -> bool:
+        record.trace_id = trace_id_var.get()
+        return True
+
+
+def configure_logging(level: str = LOG_LEVEL):
+    """Leveled logging with trace ids. LOG_LEVEL=DEBUG shows the per-stage detail."""
+    root = logging.getLogger()
+    if not any(isinstance(f, TraceIdFilter) for h in root.handlers for f in h.filters):
+        handler = logging.StreamHandler()
+        handler.setFormatter(logging.Formatter(LOG_FORMAT))
+        handler.addFilter(TraceIdFilter())
+        root.addHandler(handler)
+    root.setLevel(level)
+
+
+class Histogram:
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str], buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets)
+        # label values -> [count per bucket..., +Inf count, sum]
+        self._series: Dict[Tuple[str, ...], list] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, *labelvalues: str):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(labelvalues)
+            if series is None:
+                series = self._series[labelvalues] = [0] * (len(self.buckets) + 1) + [0.0]
+            series[index] += 1
+            series[-1] += value
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            series = {labels: list(values) for labels, values in self._series.items()}
+        for labelvalues, values in sorted(series.items()):
+            labels = ",".join(f'{k}="{v}"' for k, v in zip(self.labelnames, labelvalues))
+            prefix = labels + "," if labels else ""
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), values):
+                cumulative += count
+                le = "+Inf" if bound == float("inf") else repr(bound)
+                lines.append(f'{self.name}_bucket{{{prefix}le="{le}"}} {cumulative}')
+            suffix = f"{{{labels}}}" if labels else ""
+            lines.append(f"{self.name}_sum{suffix} {values[-1]}")
+            lines.append(f"{self.name}_count{suffix} {cumulative}")
+        return lines
+
+
+class Counter:
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values: Dict[Tuple[str, ...], float] = {}
+        self._lock = threading.Lock()
+
+    def add(self, amount: float, *labelvalues: str):
+        """Counts locally only; replay() uses it for increments made in workers."""
+        with self._lock:
+            self._values[labelvalues] = self._values.get(labelvalues, 0) + amount
+
+    def inc(self, amount: float = 1, *labelvalues: str):
+        self.add(amount, *labelvalues)
+        _record_for_parent(self.name, labelvalues, amount)
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            values = dict(self._values)
+        for labelvalues, value in sorted(values.items()):
+            labels = ",".join(f'{k}="{v}"' for k, v in zip(self.labelnames, labelvalues))
+            lines.append(f"{self.name}{{{labels}}} {value}" if labels else f"{self.name} {value}")
+        return lines
+
+
+STAGE_SECONDS = Histogram(
+    "rag_stage_duration_seconds",
+    "Time spent in each pipeline stage (extraction, ocr, chunking, embedding, chroma, sql, llm, ...)",
+    ["stage"],
+)
+HTTP_SECONDS = Histogram(
+    "http_request_duration_seconds",
+    "HTTP request latency by route",
+    ["method", "route", "status"],
+)
+HISTOGRAMS = {h.name: h for h in (STAGE_SECONDS, HTTP_SECONDS)}
+
+EMBEDDING_CACHE_LOOKUPS = Counter(
+    "embedding_cache_lookups_total",
+    "Texts looked up in the embedding cache, by result (hit = no model call)",
+    ["result"],
+)
+COUNTERS = {c.name: c for c in (EMBEDDING_CACHE_LOOKUPS,)}
+
+# Observations not yet handed to the API process (only drained in workers)
+_pending: List[Tuple[str, Tuple[str, ...], float]] = []
+_pending_lock = threading.Lock()
+_collect_pending = False
+
+
+def _record_for_parent(name: str, labelvalues: Tuple[str, ...], value: float):
+    if _collect_pending:
+        with _pending_lock:
+            _pending.append((name, labelvalues, value))
+
+
+def observe_stage(stage: str, seconds: float):
+    STAGE_SECONDS.observe(seconds, stage)
+    _record_for_parent(STAGE_SECONDS.name, (stage,), seconds)
+
+
+@contextmanager
+def span(stage: str):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start
+        observe_stage(stage, elapsed)
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug(f"span {stage} {elapsed * 1000:.1f}ms")
+
+
+def collect_for_parent():
+    """Call in worker processes: stage observations and counter increments are kept for drain()."""
+    global _collect_pending
+    _collect_pending = True
+
+
+def drain() -> List[Tuple[str, Tuple[str, ...], float]]:
+    with _pending_lock:
+        samples = list(_pending)
+        _pending.clear()
+    return samples
+
+
+def replay(samples: Optional[List[Tuple[str, Tuple[str, ...], float]]]):
+    for name, labelvalues, value in samples or ():
+        if name in COUNTERS:
+            COUNTERS[name].add(value, *labelvalues)
+        else:
+            HISTOGRAMS[name].observe(value, *labelvalues)
+
+
+def instrument_engine(engine):
+    """Times every SQL statement executed through engine as the "sql" stage."""
+    from sqlalchemy import event
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def _start(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("query_start", []).append(time.perf_counter())
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def _end(conn, cursor, statement, parameters, context, executemany):
+        observe_stage("sql", time.perf_counter() - conn.info["query_start"].pop())
+
+    @event.listens_for(engine, "handle_error")
+    def _failed(context):
+        starts = context.connection.info.get("query_start") if context.connection is not None else None
+        if starts:
+            starts.pop()
+
+
+# Callbacks returning exposition lines for state kept elsewhere (cache counters etc.)
+_collectors: List[Callable[[], List[str]]] = []
+
+
+def register_collector(collect: Callable[[], List[str]]):
+    _collectors.append(collect)
+    return collect
+
+
+def render_metric(name: str, kind: str, documentation: str, value: float) -> List[str]:
+    """One unlabelled counter or gauge in the Prometheus text format."""
+    return [f"# HELP {name} {documentation}", f"# TYPE {name} {kind}", f"{name} {value}"]
+
+
+def render_metrics() -> str:
+    lines = []
+    for histogram in HISTOGRAMS.values():
+        lines.extend(histogram.render())
+    for counter in COUNTERS.values():
+        lines.extend(counter.render())
+    for collect in _collectors:
+        try:
+            lines.extend(collect())
+        except Exception:
+            logger.exception("Metrics collector failed")
+    return "\n".join(lines) + "\n"
@@ -0,0 +1,290 @@
+"""
+OCR for scanned PDFs and images.
+
+Pages without a text layer are rasterized with pypdfium2 and OCR'd in
+parallel on a process pool. Images are downscaled, converted to grayscale
+and binarized first, which cuts Tesseract time considerably on phone
+photos and 300+ DPI scans. Per-page results are cached on disk (at most
+OCR_CACHE_MAX_MB, least recently used documents go first), so a retried
+document only re-runs the pages that failed.
+
+Extraction itself usually runs inside an ingestion or bulk pool worker;
+those call init_pool_worker() so the nested OCR pools share the CPUs
+instead of each taking OCR_WORKERS of them.
+"""
+import hashlib
+import logging
+import multiprocessing
+import os
+import shutil
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from functools import lru_cache
+from typing import Dict, Iterable, List, Optional
+
+import pytesseract
+from PIL import Image
+
+from app.observability import span
+
+logger = logging.getLogger(__name__)
+
+OCR_WORKERS = int(os.getenv("OCR_WORKERS", str(min(4, os.cpu_count() or 1))))
+OCR_DPI = int(os.getenv("OCR_DPI", "200"))
+OCR_MAX_WIDTH = int(os.getenv("OCR_MAX_WIDTH", "1800"))
+OCR_LANG = os.getenv("OCR_LANG", "eng")
+OCR_CACHE_DIR = os.getenv("OCR_CACHE_DIR", "ocr_cache")
+OCR_CACHE_MAX_MB = int(os.getenv("OCR_CACHE_MAX_MB", "512"))
+# Pages whose text layer is shorter than this are treated as scanned
+OCR_MIN_TEXT_CHARS = int(os.getenv("OCR_MIN_TEXT_CHARS", "20"))
+
+# Part of the cache key: changing any OCR setting invalidates cached pages
+OCR_VERSION = f"v1-{OCR_DPI}dpi-{OCR_MAX_WIDTH}w-{OCR_LANG}"
+
+
+class OcrError(Exception):
+    """Raised when some pages of a document could not be OCR'd."""
+
+
+# Tesseract Path Configuration for Windows
+# Attempt to find tesseract binary in common locations
+tesseract_paths = [
+    r"C:\Program Files\Tesseract-OCR\tesseract.exe",
+    r"C:\Program Files (x86)\Tesseract-OCR\tesseract.exe",
+    os.path.join(os.getenv('LOCALAPPDATA', ''), r"Tesseract-OCR\tesseract.exe"),
+    os.path.join(os.getenv('LOCALAPPDATA', ''), r"Programs\Tesseract-OCR\tesseract.exe"),
+    r"C:\Tesseract-OCR\tesseract.exe"
+]
+
+
+@lru_cache(maxsize=1)
+def configure_tesseract() -> Optional[str]:
+    """Points pytesseract at a known install location, once, on first OCR use."""
+    for path in tesseract_paths:
+        if os.path.exists(path):
+            pytesseract.pytesseract.tesseract_cmd = path
+            logger.info(f"Found Tesseract at: {path}")
+            return path
+    return None
+
+
+@lru_cache(maxsize=1)
+def tesseract_available() -> bool:
+    configure_tesseract()
+    try:
+        pytesseract.get_tesseract_version()
+        return True
+    except (pytesseract.TesseractNotFoundError, OSError):
+        return False
+
+
+def _otsu_threshold(gray: Image.Image) -> int:
+    hist = gray.histogram()
+    total = sum(hist)
+    sum_all = sum(i * h for i, h in enumerate(hist))
+    sum_bg = weight_bg = 0
+    best_variance, threshold = 0.0, 127
+    for i, h in enumerate(hist):
+        weight_bg += h
+        if weight_bg == 0:
+            continue
+        weight_fg = total - weight_bg
+        if weight_fg == 0:
+            break
+        sum_bg += i * h
+        mean_bg = sum_bg / weight_bg
+        mean_fg = (sum_all - sum_bg) / weight_fg
+        variance = weight_bg * weight_fg * (mean_bg - mean_fg) ** 2
+        if variance > best_variance:
+            best_variance, threshold = variance, i
+    return threshold
+
+
+def preprocess(image: Image.Image) -> Image.Image:
+    """Grayscale, downscale to OCR_MAX_WIDTH and binarize with Otsu's threshold."""
+    gray = image.convert("L")
+    if gray.width > OCR_MAX_WIDTH:
+        height = round(gray.height * OCR_MAX_WIDTH / gray.width)
+        gray = gray.resize((OCR_MAX_WIDTH, height), Image.LANCZOS)
+    threshold = _otsu_threshold(gray)
+    return gray.point(lambda p: 255 if p > threshold else 0, mode="1")
+
+
+def _ocr_image(image: Image.Image) -> str:
+    configure_tesseract()
+    return pytesseract.image_to_string(preprocess(image), lang=OCR_LANG)
+
+
+def ocr_image(image: Image.Image) -> str:
+    # PDF pages skip the span: ocr_pdf_pages() times their whole batch as one "ocr" observation
+    with span("ocr"):
+        return _ocr_image(image)
+
+
+def _ocr_pdf_page(file_path: str, page_index: int) -> str:
+    # Runs in a pool worker: each worker opens the PDF itself, so only the
+    # path and page number cross the process boundary
+    import pypdfium2 as pdfium
+
+    pdf = pdfium.PdfDocument(file_path)
+    try:
+        page = pdf[page_index]
+        image = page.render(scale=OCR_DPI / 72, grayscale=True).to_pil()
+        return _ocr_image(image)
+    finally:
+        pdf.close()
+
+
+_executor: Optional[ProcessPoolExecutor] = None
+_executor_lock = threading.Lock()
+_max_workers = max(1, OCR_WORKERS)
+
+
+def init_pool_worker(parent_workers: int):
+    """
+    Call in each worker of a pool of parent_workers processes: caps this
+    process's OCR pool at its share of the CPUs, and OCRs inline (no nested
+    pool at all) when that share is one.
+    """
+    global _max_workers
+    _max_workers = max(1, min(OCR_WORKERS, (os.cpu_count() or 1) // max(1, parent_workers)))
+
+
+def _get_executor() -> ProcessPoolExecutor:
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ProcessPoolExecutor(
+                max_workers=_max_workers,
+                mp_context=multiprocessing.get_context("spawn"),
+            )
+        return _executor
+
+
+def _reset_executor(broken: ProcessPoolExecutor):
+    # A crashed worker (OOM, Tesseract segfault) breaks the whole pool; the next call gets a new one
+    global _executor
+    with _executor_lock:
+        if _executor is broken:
+            _executor = None
+    broken.shutdown(wait=False, cancel_futures=True)
+
+
+def _file_hash(file_path: str) -> str:
+    sha256 = hashlib.sha256()
+    with open(file_path, "rb") as f:
+        for block in iter(lambda: f.read(1024 * 1024), b""):
+            sha256.update(block)
+    return sha256.hexdigest()
+
+
+def _cache_dir(file_path: str) -> str:
+    return os.path.join(OCR_CACHE_DIR, f"{_file_hash(file_path)}-{OCR_VERSION}")
+
+
+def _prune_cache(keep: str):
+    """Deletes the least recently used documents' pages until the cache fits OCR_CACHE_MAX_MB."""
+    if OCR_CACHE_MAX_MB <= 0 or not os.path.isdir(OCR_CACHE_DIR):
+        return
+    entries, total = [], 0
+    for name in os.listdir(OCR_CACHE_DIR):
+        path = os.path.join(OCR_CACHE_DIR, name)
+        try:
+            size = sum(entry.stat().st_size for entry in os.scandir(path))
+            entries.append((os.path.getmtime(path), path, size))
+        except OSError:
+            # Pruned by another process meanwhile
+            continue
+        total += size
+    limit = OCR_CACHE_MAX_MB * 1024 * 1024
+    for _, path, size in sorted(entries):
+        if total <= limit:
+            break
+        if os.path.abspath(path) == os.path.abspath(keep):
+            continue
+        shutil.rmtree(path, ignore_errors=True)
+        total -= size
+
+
+def _run_pages(file_path: str, pages: List[int]) -> Dict[int, object]:
+    """page index -> text, or the exception it failed with."""
+    if _max_workers <= 1 or len(pages) == 1:
+        outcomes = {}
+        for page_index in pages:
+            try:
+                outcomes[page_index] = _ocr_pdf_page(file_path, page_index)
+            except Exception as e:
+                outcomes[page_index] = e
+        return outcomes
+
+    executor = _get_executor()
+    try:
+        futures = {i: executor.submit(_ocr_pdf_page, file_path, i) for i in pages}
+    except BrokenProcessPool as e:
+        _reset_executor(executor)
+        return {i: e for i in pages}
+    outcomes = {}
+    for page_index, future in futures.items():
+        try:
+            outcomes[page_index] = future.result()
+        except Exception as e:
+            outcomes[page_index] = e
+    if any(isinstance(o, BrokenProcessPool) for o in outcomes.values()):
+        _reset_executor(executor)
+    return outcomes
+
+
+def ocr_pdf_pages(file_path: str, pages: Iterable[int]) -> Dict[int, str]:
+    """
+    OCRs the given page indexes of a PDF in parallel.
+    Successful pages are cached; if any page fails, OcrError is raised after
+    the others have been cached so a retry only redoes the failures.
+    """
+    pages = list(pages)
+    cache_dir = _cache_dir(file_path)
+    results: Dict[int, str] = {}
+
+    todo = []
+    for page_index in pages:
+        cached = os.path.join(cache_dir, f"{page_index}.txt")
+        if os.path.exists(cached):
+            with open(cached, "r", encoding="utf-8") as f:
+                results[page_index] = f.read()
+        else:
+            todo.append(page_index)
+
+    if os.path.isdir(cache_dir):
+        # Marks the document as recently used for _prune_cache
+        os.utime(cache_dir)
+    if not todo:
+        return results
+
+    logger.info(f"OCR {len(todo)} pages of {file_path} ({len(results)} cached)")
+    os.makedirs(cache_dir, exist_ok=True)
+
+    failed = {}
+    # One observation for the whole batch: pages run in parallel
+    with span("ocr"):
+        outcomes = _run_pages(file_path, todo)
+        broken = [i for i, o in outcomes.items() if isinstance(o, BrokenProcessPool)]
+        if broken:
+            # Pages lost with the crashed pool get one more go on a fresh one
+            logger.warning(f"OCR pool broke, retrying {len(broken)} pages of {file_path}")
+            outcomes.update(_run_pages(file_path, broken))
+        for page_index, text in outcomes.items():
+            if isinstance(text, Exception):
+                failed[page_index] = text
+                continue
+            results[page_index] = text
+            tmp_path = os.path.join(cache_dir, f"{page_index}.txt.tmp")
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                f.write(text)
+            os.replace(tmp_path, os.path.join(cache_dir, f"{page_index}.txt"))
+    _prune_cache(keep=cache_dir)
+
+    if failed:
+        details = ", ".join(f"page {i + 1}: {e}" for i, e in sorted(failed.items()))
+        raise OcrError(f"OCR failed for {len(failed)} of {len(pages)} pages ({details})")
+
+    return results
@@ -0,0 +1,170 @@
+"""
+Password hashing off the request threadpool.
+
+pbkdf2_sha256 is deliberately slow (~tens of ms of pure CPU per call), so
+login and register hand it to a small dedicated process pool instead of
+running it inline in the shared threadpool. The number of hashes running or
+waiting is capped at PASSWORD_MAX_PENDING; past that, callers get
+PasswordPoolBusy (HTTP 503 in the routers) instead of piling up behind a
+login storm. A pool broken by a killed worker is rebuilt and the call
+retried once; if that fails too, callers get PasswordPoolUnavailable (also
+a 503).
+
+PASSWORD_WORKERS=0 hashes on the shared request threadpool, as before.
+"""
+import asyncio
+import multiprocessing
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from passlib.context import CryptContext
+
+from app.observability import observe_stage
+
+PASSWORD_WORKERS = int(os.getenv("PASSWORD_WORKERS", str(max(1, (os.cpu_count() or 2) // 2))))
+PASSWORD_MAX_PENDING = int(os.getenv("PASSWORD_MAX_PENDING", str(max(1, PASSWORD_WORKERS) * 8)))
+
+# ✅ Use pbkdf2_sha256 instead of bcrypt – no 72-byte limit, no broken backend issues
+pwd_context = CryptContext(schemes=["pbkdf2_sha256"], deprecated="auto")
+
+
+class PasswordPoolError(Exception):
+    """The password pool can't take the call right now; worth retrying shortly."""
+
+
+class PasswordPoolBusy(PasswordPoolError):
+    """Too many password hashes already running or queued."""
+
+
+class PasswordPoolUnavailable(PasswordPoolError):
+    """The worker pool broke and a rebuilt one failed as well."""
+
+
+def hash_password(password: str) -> str:
+    # Simple: no truncation, no byte juggling needed
+    password_str = str(password) if not isinstance(password, str) else password
+    return pwd_context.hash(password_str)
+
+
+def verify_password(plain_password: str, hashed_password: str) -> bool:
+    password_str = str(plain_password) if not isinstance(plain_password, str) else plain_password
+    return pwd_context.verify(password_str, hashed_password)
+
+
+def _timed(fn, *args):
+    # Runs in the worker; the parent derives queue wait from the total time
+    start = time.perf_counter()
+    result = fn(*args)
+    return result, time.perf_counter() - start
+
+
+class PasswordPool:
+    def __init__(self, workers: int = PASSWORD_WORKERS, max_pending: int = PASSWORD_MAX_PENDING):
+        self.workers = workers
+        self.max_pending = max_pending
+        self.pending = 0
+        self.completed = 0
+        self.rejected = 0
+        self.restarts = 0
+        # (queue wait, hash time) in seconds for the most recent calls
+        self._timings = deque(maxlen=1000)
+        self._executor = None
+        self._lock = threading.Lock()
+
+    def _get_executor(self) -> ProcessPoolExecutor:
+        if self._executor is None:
+            # spawn: forking a process that holds torch/Chroma threads is unsafe
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.workers,
+                mp_context=multiprocessing.get_context("spawn"),
+            )
+        return self._executor
+
+    def _replace_broken(self, broken: ProcessPoolExecutor) -> ProcessPoolExecutor:
+        # A worker killed mid-hash (OOM killer, kill -9) breaks the whole pool
+        with self._lock:
+            if self._executor is broken:
+                self._executor = None
+                self.restarts += 1
+            executor = self._get_executor()
+        broken.shutdown(wait=False, cancel_futures=True)
+        return executor
+
+    async def _submit(self, executor: ProcessPoolExecutor, fn, *args):
+        for attempt in range(2):
+            try:
+                return await asyncio.wrap_future(executor.submit(_timed, fn, *args))
+            except BrokenProcessPool as e:
+                if attempt:
+                    raise PasswordPoolUnavailable(f"Password worker pool failed: {e}") from e
+                executor = self._replace_broken(executor)
+
+    async def _run(self, fn, *args):
+        with self._lock:
+            if self.pending >= self.max_pending:
+                self.rejected += 1
+                raise PasswordPoolBusy(f"{self.pending} password hashes already pending")
+            self.pending += 1
+            executor = self._get_executor() if self.workers > 0 else None
+
+        start = time.perf_counter()
+        try:
+            if executor is None:
+                from starlette.concurrency import run_in_threadpool
+                result, run_s = await run_in_threadpool(_timed, fn, *args)
+            else:
+                result, run_s = await self._submit(executor, fn, *args)
+        finally:
+            with self._lock:
+                self.pending -= 1
+
+        wait_s = time.perf_counter() - start - run_s
+        observe_stage("password_hash", run_s)
+        observe_stage("password_queue_wait", wait_s)
+        with self._lock:
+            self.completed += 1
+            self._timings.append((wait_s, run_s))
+        return result
+
+    async def hash(self, password: str) -> str:
+        return await self._run(hash_password, password)
+
+    async def verify(self, plain_password: str, hashed_password: str) -> bool:
+        return await self._run(verify_password, plain_password, hashed_password)
+
+    def shutdown(self):
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=False, cancel_futures=True)
+
+    def stats(self) -> dict:
+        with self._lock:
+            timings = list(self._timings)
+            stats = {
+                "workers": self.workers,
+                "pending": self.pending,
+                "completed": self.completed,
+                "rejected": self.rejected,
+                "restarts": self.restarts,
+            }
+
+        def p(values, q):
+            values = sorted(values)
+            return round(values[min(len(values) - 1, int(q * len(values)))] * 1000, 1) if values else 0.0
+
+        waits, runs = [w for w, _ in timings], [r for _, r in timings]
+        stats.update({
+            "wait_ms_p50": p(waits, 0.5),
+            "wait_ms_p95": p(waits, 0.95),
+            "hash_ms_p50": p(runs, 0.5),
+            "hash_ms_p95": p(runs, 0.95),
+        })
+        return stats
+
+
+password_pool = PasswordPool()
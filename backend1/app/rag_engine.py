@@ -1,177 +1,377 @@
+import logging
 import os
-import chromadb
-from chromadb.utils import embedding_functions
-from sentence_transformers import SentenceTransformer
-from pypdf import PdfReader
-import pytesseract
-from PIL import Image
+import threading
+import time
+from typing import Callable, Optional
+
 from sqlalchemy.orm import Session
-from app import models
+from app import chunking, context, llm, models, reranker
+from app.observability import observe_stage, span
+from app.answer_cache import ANSWER_CACHE_ENABLED, answer_cache
+from app.lexical_index import lexical_index
+
+logger = logging.getLogger(__name__)
+
+# The embedding model, Chroma client and Tesseract are all initialized on
+# first use (or by warm_up() from the app lifespan), so importing this
+# module is cheap for /health, /auth/* and maintenance scripts.
 
-# Initialize ChromaDB
 # Persist data to disk
-CHROMA_DB_DIR = "chroma_db"
-client = chromadb.PersistentClient(path=CHROMA_DB_DIR)
-
-# Use a local model for embeddings to ensure privacy and no cost
-# 'all-MiniLM-L6-v2' is a good balance of speed and quality
-EMBEDDING_MODEL_NAME = "all-MiniLM-L6-v2"
-embedding_model = SentenceTransformer(EMBEDDING_MODEL_NAME)
-
-# Custom embedding function for Chroma
-class LocalEmbeddingFunction(chromadb.EmbeddingFunction):
-    def __call__(self, input: list[str]) -> list[list[float]]:
-        return embedding_model.encode(input).tolist()
-
-collection = client.get_or_create_collection(
-    name="medical_docs",
-    embedding_function=LocalEmbeddingFunction()
-)
-
-def extract_text_from_pdf(file_path: str) -> str:
-    reader = PdfReader(file_path)
-    text = ""
-    for page in reader.pages:
-        text += page.extract_text() + "\n"
-    return text
-
-# Tesseract Path Configuration for Windows
-# Attempt to find tesseract binary in common locations
-tesseract_paths = [
-    r"C:\Program Files\Tesseract-OCR\tesseract.exe",
-    r"C:\Program Files (x86)\Tesseract-OCR\tesseract.exe",
-    os.path.join(os.getenv('LOCALAPPDATA', ''), r"Tesseract-OCR\tesseract.exe"),
-    os.path.join(os.getenv('LOCALAPPDATA', ''), r"Programs\Tesseract-OCR\tesseract.exe"),
-    r"C:\Tesseract-OCR\tesseract.exe"
-]
-
-for path in tesseract_paths:
-    if os.path.exists(path):
-        pytesseract.pytesseract.tesseract_cmd = path
-        print(f"Found Tesseract at: {path}")
-        break
-
-def extract_text_from_image(file_path: str) -> str:
-    try:
-        image = Image.open(file_path)
-        text = pytesseract.image_to_string(image)
-        return text
-    except pytesseract.TesseractNotFoundError:
-        print("Tesseract not found. Please install Tesseract-OCR.")
-        return "[Image content cannot be read - Tesseract OCR is not installed on the server]"
-    except Exception as e:
-        print(f"OCR Error: {e}")
-        return f"[Error extracting text from image: {str(e)}]"
+CHROMA_DB_DIR = os.getenv("CHROMA_DB_DIR", "chroma_db")
+COLLECTION_NAME = "medical_docs"
+
+# "shared":   one collection, every chunk tagged with user_id and filtered on it
+# "per_user": one collection per user, so a query only touches that user's vectors
+# Existing chunks are re-tagged / moved with `python migrate_vectors.py`.
+VECTOR_PARTITIONING = os.getenv("VECTOR_PARTITIONING", "shared")
+
+# "float32": ChromaDB (HNSW over full-precision vectors)
+# "float16" / "int8": app.vector_store, compact vectors (int8 rescored on a float16 copy);
+# always partitioned by user. Switch with `python reindex_docs.py --force`.
+VECTOR_STORAGE = os.getenv("VECTOR_STORAGE", "float32")
+
+# "hybrid": fuse the BM25 (lexical_index) and vector rankings with reciprocal-rank fusion
+# "vector": MiniLM similarity only
+RETRIEVAL_MODE = os.getenv("RETRIEVAL_MODE", "hybrid")
+# Candidates taken from each ranking before fusion
+HYBRID_CANDIDATES = int(os.getenv("HYBRID_CANDIDATES", "10"))
+RRF_K = int(os.getenv("RRF_K", "60"))
+
+_client = None
+_collection = None
+_user_collections = {}
+_compact_store = None
+_init_lock = threading.Lock()
+
+def get_client():
+    global _client
+    if _client is None:
+        with _init_lock:
+            if _client is None:
+                import chromadb
+                _client = chromadb.PersistentClient(path=CHROMA_DB_DIR)
+    return _client
+
+def get_compact_store():
+    global _compact_store
+    if _compact_store is None:
+        with _init_lock:
+            if _compact_store is None:
+                from app.vector_store import CompactVectorStore
+                _compact_store = CompactVectorStore(dtype=VECTOR_STORAGE)
+    return _compact_store
+
+def get_collection():
+    global _collection
+    if VECTOR_STORAGE != "float32":
+        from app.vector_store import CompactCollection
+        return CompactCollection(get_compact_store())
+    if _collection is None:
+        client = get_client()
+        with _init_lock:
+            if _collection is None:
+                from app.embeddings import local_embedding_function
+                _collection = client.get_or_create_collection(
+                    name=COLLECTION_NAME,
+                    embedding_function=local_embedding_function()
+                )
+    return _collection
+
+def get_user_collection(user_id: int):
+    """The collection holding user_id's chunks under the configured partitioning."""
+    if VECTOR_STORAGE != "float32":
+        from app.vector_store import CompactCollection
+        return CompactCollection(get_compact_store(), user_id)
+    if VECTOR_PARTITIONING != "per_user":
+        return get_collection()
+    collection = _user_collections.get(user_id)
+    if collection is None:
+        client = get_client()
+        with _init_lock:
+            collection = _user_collections.get(user_id)
+            if collection is None:
+                from app.embeddings import local_embedding_function
+                collection = client.get_or_create_collection(
+                    name=f"{COLLECTION_NAME}_u{user_id}",
+                    embedding_function=local_embedding_function()
+                )
+                _user_collections[user_id] = collection
+    return collection
+
+def reopen_client():
+    """
+    Drops the cached client and collections. Ingestion workers write to
+    CHROMA_DB_DIR from their own processes and Chroma keeps an in-memory
+    index per client, so the API process reopens it after each job.
+    """
+    global _client, _collection
+    with _init_lock:
+        if _client is not None:
+            _client.clear_system_cache()
+        _client, _collection = None, None
+        _user_collections.clear()
+
+def all_collections() -> list:
+    """Every collection holding document chunks under the configured partitioning."""
+    if VECTOR_STORAGE != "float32" or VECTOR_PARTITIONING != "per_user":
+        return [get_collection()]
+    client = get_client()
+    names = [c if isinstance(c, str) else c.name for c in client.list_collections()]
+    return [client.get_collection(name) for name in names if name.startswith(f"{COLLECTION_NAME}_u")]
+
+def chunk_ids(doc_id: int, count: int) -> list[str]:
+    return [f"doc_{doc_id}_chunk_{i}" for i in range(count)]
+
+def user_filter(user_id: int) -> Optional[dict]:
+    # Per-user collections need no filter; the shared one is filtered by tag
+    return None if VECTOR_PARTITIONING == "per_user" or VECTOR_STORAGE != "float32" else {"user_id": user_id}
 
-def process_document(doc_id: int, file_path: str, db: Session):
+def max_write_batch_size() -> Optional[int]:
+    """Chroma rejects writes above its configured max batch size; the compact store has no limit."""
+    return get_client().get_max_batch_size() if VECTOR_STORAGE == "float32" else None
+
+def _document_owner(db: Session, doc_id: int) -> Optional[int]:
+    row = db.query(models.Document.user_id).filter(models.Document.id == doc_id).first()
+    return row.user_id if row else None
+
+def document_meta(db: Session, doc_id: int) -> str:
+    """Filename, category, description and metadata_info, indexed for BM25 next to the chunks."""
+    doc = db.query(
+        models.Document.filename,
+        models.Document.category,
+        models.Document.description,
+        models.Document.metadata_info,
+    ).filter(models.Document.id == doc_id).first()
+    return " ".join(field for field in doc if field) if doc else ""
+
+def warm_up():
+    """
+    Loads the embedding model, opens ChromaDB and probes Tesseract so the
+    first upload or chat request doesn't pay for it.
+    """
+    from app import embeddings, ocr
+    get_collection()
+    embeddings.get_embedding_model().encode(["warm up"])
+    if reranker.RERANK_ENABLED:
+        reranker.get_reranker()
+    ocr.tesseract_available()
+
+def process_document(
+    doc_id: int,
+    file_path: str,
+    db: Session,
+    on_status: Optional[Callable[[str], None]] = None,
+    user_id: Optional[int] = None,
+) -> dict:
     """
     Extracts text, chunks it, and stores embeddings in ChromaDB.
+    on_status is called with "extracting" / "embedding" as the pipeline advances.
+    Returns chunk statistics (see chunking.chunk_stats).
     """
-    print(f"[RAG Debug] Processing document {doc_id} path: {file_path}")
+    logger.debug(f"Processing document {doc_id} path: {file_path}")
     
     if not os.path.exists(file_path):
-        print(f"[RAG Debug] File not found: {file_path}")
-        return
+        logger.warning(f"File not found: {file_path}")
+        raise FileNotFoundError(file_path)
+
+    if on_status:
+        on_status("extracting")
+
+    from app.extraction import extract_text
+    text = extract_text(file_path)
+    chunks = chunking.chunk_text(text)
+    stats = chunking.chunk_stats(chunks)
+
+    if user_id is None:
+        user_id = _document_owner(db, doc_id)
 
-    file_ext = os.path.splitext(file_path)[1].lower()
-    text = ""
-    
-    if file_ext == ".pdf":
-        text = extract_text_from_pdf(file_path)
-    elif file_ext in [".png", ".jpg", ".jpeg"]:
-        text = extract_text_from_image(file_path)
-    elif file_ext == ".txt":
-        with open(file_path, "r", encoding="utf-8") as f:
-            text = f.read()
-            
-    print(f"[RAG Debug] Extracted {len(text)} characters.")
-            
-    if not text.strip():
-        print("[RAG Debug] Text is empty. Indexing metadata only.")
-        text = f"Filename: {os.path.basename(file_path)}\n"
-        # We can't easily get description here without DB query, but we can at least index the filename
-        # so the user knows the file exists but is unreadable.
-        text += "[Content unreadable - Scanned document or Image without OCR]"
-
-    # Simple chunking strategy
-    chunk_size = 1000
-    overlap = 100
-    chunks = []
-    
-    for i in range(0, len(text), chunk_size - overlap):
-        chunk = text[i:i + chunk_size]
-        chunks.append(chunk)
-        
     if not chunks:
-        return
+        # Nothing readable anymore; drop chunks from an earlier run
+        delete_document_embeddings(doc_id, user_id)
+        return stats
 
     # Add to ChromaDB
-    # We store doc_id in metadata to filter by user/document later
-    ids = [f"doc_{doc_id}_chunk_{i}" for i in range(len(chunks))]
-    metadatas = [{"doc_id": doc_id} for _ in chunks]
+    # We store doc_id and user_id in metadata to filter by user/document later
+    ids = chunk_ids(doc_id, len(chunks))
+    metadatas = [{"doc_id": doc_id, "user_id": user_id} for _ in chunks]
     
-    print(f"[RAG Debug] Indexing document {doc_id} ({file_path})...")
-    print(f"[RAG Debug] Created {len(chunks)} chunks.")
+    logger.debug(f"Indexing document {doc_id} ({file_path})...")
+    logger.debug(f"Created {stats['chunk_count']} chunks, avg {stats['avg_chunk_chars']} chars.")
 
-    collection.add(
-        documents=chunks,
-        metadatas=metadatas,
-        ids=ids
-    )
-    print(f"[RAG Debug] Successfully added to ChromaDB.")
+    if on_status:
+        on_status("embedding")
+
+    # Embedded up front so the Chroma span below is Chroma's own time
+    from app.embeddings import embed_texts
+    vectors = embed_texts(chunks)
+
+    # upsert so a retried job doesn't trip over chunks from an interrupted run
+    with span("chroma_upsert"):
+        get_user_collection(user_id).upsert(
+            documents=chunks,
+            metadatas=metadatas,
+            ids=ids,
+            embeddings=vectors,
+        )
+        delete_orphan_chunks(doc_id, user_id, ids)
+    with span("bm25_index"):
+        lexical_index.replace_document(doc_id, user_id, ids, chunks, document_meta(db, doc_id))
+    logger.debug(f"Successfully added document {doc_id} to ChromaDB.")
+    return stats
 
-def delete_document_embeddings(doc_id: int):
+def delete_document_embeddings(doc_id: int, user_id: int):
     """
-    Removes all chunks related to a document from ChromaDB.
+    Removes all chunks related to a document from ChromaDB and the BM25 index.
     """
-    collection.delete(
+    get_user_collection(user_id).delete(
         where={"doc_id": doc_id}
     )
+    lexical_index.delete_document(doc_id)
 
-def query_rag(query_text: str, user_id: int, db: Session, n_results: int = 3) -> str:
+def delete_orphan_chunks(doc_id: int, user_id: int, keep_ids: list[str]) -> int:
     """
-    Retrieves relevant context and generates an answer.
+    Deletes a document's chunks that are not in keep_ids, left over when a
+    re-run produces fewer chunks than before. Returns how many were deleted.
     """
-    # 1. Retrieve relevant chunks for this user
-    # We need to get all doc_ids belonging to the user first to filter
-    user_docs = db.query(models.Document).filter(models.Document.user_id == user_id).all()
-    user_doc_ids = [doc.id for doc in user_docs]
-    
-    print(f"[RAG Debug] User {user_id} has documents: {user_doc_ids}")
+    collection = get_user_collection(user_id)
+    keep = set(keep_ids)
+    stale = [i for i in collection.get(where={"doc_id": doc_id}, include=[])["ids"] if i not in keep]
+    if stale:
+        collection.delete(ids=stale)
+    return len(stale)
 
-    if not user_doc_ids:
-        print("[RAG Debug] No documents found for user.")
-        return "You haven't uploaded any documents yet."
+NO_DOCUMENTS_MESSAGE = "You haven't uploaded any documents yet."
 
-    results = collection.query(
-        query_texts=[query_text],
-        n_results=n_results,
-        where={"doc_id": {"$in": user_doc_ids}} # Filter by user's documents
+def embed_query(query_text: str):
+    return embed_queries([query_text])[0]
+
+def embed_queries(query_texts: list[str]):
+    """One encode call (and one cache lookup) for all the questions."""
+    from app.embeddings import embed_texts
+    return embed_texts(query_texts)
+
+def reciprocal_rank_fusion(rankings: list[list[str]], k: int = RRF_K) -> list[str]:
+    """Orders ids by sum(1 / (k + rank)) over the rankings they appear in."""
+    scores = {}
+    for ranking in rankings:
+        for rank, item in enumerate(ranking, start=1):
+            scores[item] = scores.get(item, 0.0) + 1.0 / (k + rank)
+    return sorted(scores, key=scores.get, reverse=True)
+
+def retrieve_chunks(
+    query_text: str,
+    user_id: int,
+    db: Session,
+    n_results: int = 3,
+    query_embedding=None,
+) -> Optional[list[tuple[str, str]]]:
+    """
+    Returns (chunk_id, text) for the chunks most relevant to query_text from
+    the user's documents, best first, or None if the user has no documents
+    at all. With RERANK_ENABLED, a larger candidate pool is cut down to
+    n_results by the cross-encoder.
+    """
+    batch = retrieve_chunks_batch(
+        [query_text], user_id, db, n_results, None if query_embedding is None else [query_embedding]
     )
-    
-    print(f"[RAG Debug] Query: {query_text}")
-    print(f"[RAG Debug] Retrieved {len(results['documents'][0])} chunks")
-    # print(f"[RAG Debug] Chunks: {results['documents'][0]}") # Uncomment for verbose output
-    
-    context_chunks = results['documents'][0]
-    context = "\n\n".join(context_chunks)
-    
-    # 2. Generate Answer with Gemini
-    api_key = os.getenv("GEMINI_API_KEY")
-    if not api_key or api_key == "paste_your_key_here":
-        return "[System] Gemini API Key is missing. Please add it to backend/.env file."
+    return None if batch is None else batch[0]
 
-    import google.generativeai as genai
-    genai.configure(api_key=api_key)
-    
-    try:
-        model = genai.GenerativeModel('gemini-2.0-flash-exp')
-        
-        prompt = f"""
+def retrieve_chunks_batch(
+    query_texts: list[str],
+    user_id: int,
+    db: Session,
+    n_results: int = 3,
+    query_embeddings=None,
+) -> Optional[list[list[tuple[str, str]]]]:
+    """
+    retrieve_chunks() for several questions at once: one encode call and one
+    multi-query vector search for all of them. Returns one list per question,
+    or None if the user has no documents.
+    """
+    if query_embeddings is None:
+        query_embeddings = embed_queries(query_texts)
+
+    has_docs = db.query(models.Document.id).filter(models.Document.user_id == user_id).first()
+
+    if not has_docs:
+        logger.debug("No documents found for user.")
+        return None
+
+    hybrid = RETRIEVAL_MODE == "hybrid"
+    rerank = reranker.RERANK_ENABLED
+    wanted = max(n_results, reranker.RERANK_CANDIDATES) if rerank else n_results
+    # Chunks are partitioned by user, so the search never scans other patients' vectors
+    with span("chroma_query"):
+        results = get_user_collection(user_id).query(
+            query_embeddings=list(query_embeddings),
+            n_results=max(wanted, HYBRID_CANDIDATES) if hybrid else wanted,
+            where=user_filter(user_id)
+        )
+
+    batch = []
+    for i, query_text in enumerate(query_texts):
+        ids, documents = results['ids'][i], results['documents'][i]
+        logger.debug(f"Query: {query_text}")
+        if not hybrid:
+            chunks = list(zip(ids, documents))
+            logger.debug(f"Retrieved {len(chunks)} chunks")
+        else:
+            texts = dict(zip(ids, documents))
+            with span("bm25_query"):
+                lexical = lexical_index.search(user_id, query_text, limit=max(wanted, HYBRID_CANDIDATES))
+            texts.update(lexical)
+            fused = reciprocal_rank_fusion([ids, [chunk_id for chunk_id, _ in lexical]])[:wanted]
+            chunks = [(chunk_id, texts[chunk_id]) for chunk_id in fused]
+            logger.debug(f"Retrieved {len(fused)} chunks ({len(ids)} vector / {len(lexical)} BM25 candidates)")
+
+        if rerank:
+            chunks = reranker.rerank(query_text, chunks, n_results)
+            logger.debug(f"Kept {len(chunks)} chunks after rerank")
+        batch.append(chunks)
+    return batch
+
+def retrieve_prompt_context(
+    query_text: str,
+    user_id: int,
+    db: Session,
+    n_results: int = 3,
+    query_embedding=None,
+) -> Optional[list[str]]:
+    """
+    Retrieved chunks assembled for the prompt (see app.context): merged per
+    document, deduplicated, source-tagged and within CONTEXT_TOKEN_BUDGET.
+    """
+    chunks = retrieve_chunks(query_text, user_id, db, n_results, query_embedding)
+    if chunks is None:
+        return None
+    with span("context_assembly"):
+        return context.assemble(db, chunks)
+
+def retrieve_prompt_context_batch(
+    query_texts: list[str],
+    user_id: int,
+    db: Session,
+    n_results: int = 3,
+    query_embeddings=None,
+) -> Optional[list[list[str]]]:
+    """retrieve_prompt_context() for several questions over one retrieve_chunks_batch()."""
+    batch = retrieve_chunks_batch(query_texts, user_id, db, n_results, query_embeddings)
+    if batch is None:
+        return None
+    assembled = []
+    for chunks in batch:
+        with span("context_assembly"):
+            assembled.append(context.assemble(db, chunks))
+    return assembled
+
+def build_prompt(context_chunks: list[str], query_text: str) -> str:
+    context = "\n\n".join(context_chunks)
+    return f"""
         You are a helpful medical assistant. 
         - If the user's input is a greeting (like "Hi", "Hello") or general conversation, respond politely and ask how you can help with their medical records.
         - For specific questions, answer based ONLY on the provided context.
         - If the answer to a specific question is not in the context, say "I cannot find this information in your documents."
+        - Context passages start with a [Source: ...] tag; mention the file when you use it.
         
         Context:
         {context}
@@ -181,8 +381,38 @@ def query_rag(query_text: str, user_id: int, db: Session, n_results: int = 3) ->
         
         Answer:
         """
-        
-        response = model.generate_content(prompt)
-        return response.text
+
+def query_rag(query_text: str, user_id: int, db: Session, n_results: int = 3) -> str:
+    """
+    Retrieves relevant context and generates an answer.
+    """
+    # The query embedding drives both the answer cache and the Chroma search
+    query_embedding = embed_query(query_text)
+    if ANSWER_CACHE_ENABLED:
+        cached = answer_cache.lookup(user_id, query_embedding)
+        if cached is not None:
+            return cached
+
+    # 1. Retrieve relevant chunks for this user
+    context_chunks = retrieve_prompt_context(query_text, user_id, db, n_results, query_embedding)
+    if context_chunks is None:
+        return NO_DOCUMENTS_MESSAGE
+    
+    # 2. Generate Answer with the configured LLM (LLM_PROVIDER, Gemini by default)
+    try:
+        client = llm.get_client()
+    except llm.LLMConfigError as e:
+        return str(e)
+
+    try:
+        start = time.perf_counter()
+        answer = client.generate(build_prompt(context_chunks, query_text))
     except Exception as e:
-        return f"[Error] Failed to generate response from Gemini: {str(e)}"
+        return f"[Error] Failed to generate response from {client.provider.name}: {str(e)}"
+    llm_seconds = time.perf_counter() - start
+    observe_stage("llm_generate", llm_seconds)
+
+    if ANSWER_CACHE_ENABLED:
+        llm_ms = llm_seconds * 1000
+        answer_cache.store(user_id, query_embedding, query_text, answer, llm_ms)
+    return answer
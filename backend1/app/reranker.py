@@ -0,0 +1,69 @@
+"""
+Optional cross-encoder rerank stage.
+
+With RERANK_ENABLED=1, retrieve_chunks pulls RERANK_CANDIDATES chunks from
+the vector/hybrid retrieval instead of n_results, scores each (question,
+chunk) pair with a small local cross-encoder, and keeps the best n_results.
+Good context ranked 4th-20th by the bi-encoder makes it into the prompt
+without growing it: the prompt's size is capped once, by app.context's
+CONTEXT_TOKEN_BUDGET, whichever stages ran.
+
+Scoring runs in batches of RERANK_BATCH_SIZE on CPU and stops starting new
+batches once RERANK_MAX_MS has passed; unscored candidates keep their
+retrieval order behind the scored ones.
+"""
+import logging
+import os
+import threading
+import time
+from typing import List, Tuple
+
+from app.observability import span
+
+logger = logging.getLogger(__name__)
+
+RERANK_ENABLED = os.getenv("RERANK_ENABLED", "0") == "1"
+RERANK_MODEL_NAME = os.getenv("RERANK_MODEL_NAME", "cross-encoder/ms-marco-MiniLM-L-6-v2")
+# Candidate pool scored per question
+RERANK_CANDIDATES = int(os.getenv("RERANK_CANDIDATES", "20"))
+RERANK_BATCH_SIZE = int(os.getenv("RERANK_BATCH_SIZE", "16"))
+# Latency cap for the scoring loop; 0 disables it
+RERANK_MAX_MS = float(os.getenv("RERANK_MAX_MS", "300"))
+
+_model = None
+_model_lock = threading.Lock()
+
+
+def get_reranker():
+    """Loads the cross-encoder on first use (~90MB)."""
+    global _model
+    if _model is None:
+        with _model_lock:
+            if _model is None:
+                from sentence_transformers import CrossEncoder
+                _model = CrossEncoder(RERANK_MODEL_NAME)
+    return _model
+
+
+def score(query_text: str, chunks: List[str], batch_size: int = RERANK_BATCH_SIZE, max_ms: float = RERANK_MAX_MS) -> List[float]:
+    """Cross-encoder scores for the leading chunks; may be shorter than chunks if max_ms ran out."""
+    model = get_reranker()
+    deadline = time.perf_counter() + max_ms / 1000 if max_ms else None
+    scores = []
+    for start in range(0, len(chunks), batch_size):
+        if deadline is not None and scores and time.perf_counter() >= deadline:
+            logger.debug(f"Rerank cap hit after {len(scores)}/{len(chunks)} candidates")
+            break
+        batch = chunks[start:start + batch_size]
+        scores.extend(float(s) for s in model.predict([(query_text, chunk) for chunk in batch], batch_size=batch_size))
+    return scores
+
+
+def rerank(query_text: str, chunks: List[Tuple[str, str]], top_k: int) -> List[Tuple[str, str]]:
+    """Returns the top_k (chunk_id, text) chunks, best cross-encoder score first."""
+    if not chunks:
+        return []
+    with span("rerank"):
+        scores = score(query_text, [text for _, text in chunks])
+    order = sorted(range(len(scores)), key=lambda i: scores[i], reverse=True) + list(range(len(scores), len(chunks)))
+    return [chunks[i] for i in order[:top_k]]
@@ -1,8 +1,10 @@
 from fastapi import APIRouter, Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordRequestForm
+from starlette.concurrency import run_in_threadpool
 from sqlalchemy.orm import Session
 from sqlalchemy.exc import IntegrityError
 from app import models, database, auth
+from app.passwords import PasswordPoolBusy, PasswordPoolError, password_pool
 from pydantic import BaseModel
 from typing import Optional
 import logging
@@ -31,8 +33,27 @@ class UserResponse(BaseModel):
         orm_mode = True
 
 
+def busy_exception(error: PasswordPoolError) -> HTTPException:
+    if isinstance(error, PasswordPoolBusy):
+        detail = "Too many login attempts in progress, please retry shortly"
+    else:
+        detail = "Password service temporarily unavailable, please retry shortly"
+    return HTTPException(
+        status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+        detail=detail,
+        headers={"Retry-After": "1"},
+    )
+
+
+def get_user_by_username(db: Session, username: str) -> Optional[models.User]:
+    return db.query(models.User).filter(models.User.username == username).first()
+
+
+# register and login are async so that pbkdf2 runs in app.passwords' process
+# pool while the shared threadpool keeps serving /documents and /chat.
+# DB calls are short and go through run_in_threadpool.
 @router.post("/register")
-def register(user: UserCreate, db: Session = Depends(database.get_db)):
+async def register(user: UserCreate, db: Session = Depends(database.get_db)):
     try:
         # Basic validation
         if not user.username or not user.password:
@@ -41,10 +62,10 @@ def register(user: UserCreate, db: Session = Depends(database.get_db)):
                 detail="Username and password are required"
             )
 
-        print("RAW PASSWORD LENGTH:", len(user.password))
+        logger.debug(f"Registering {user.username!r}, password length {len(user.password)}")
 
         # Check if user exists
-        existing_user = db.query(models.User).filter(models.User.username == user.username).first()
+        existing_user = await run_in_threadpool(get_user_by_username, db, user.username)
         if existing_user:
             raise HTTPException(
                 status_code=status.HTTP_400_BAD_REQUEST,
@@ -53,7 +74,9 @@ def register(user: UserCreate, db: Session = Depends(database.get_db)):
 
         # ✅ Hash password (pbkdf2_sha256, no 72-byte limit)
         try:
-            hashed_password = auth.get_password_hash(user.password)
+            hashed_password = await password_pool.hash(user.password)
+        except PasswordPoolError as e:
+            raise busy_exception(e)
         except Exception as hash_error:
             raise HTTPException(
                 status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
@@ -68,9 +91,11 @@ def register(user: UserCreate, db: Session = Depends(database.get_db)):
             provider_info=user.provider_info
         )
 
-        db.add(new_user)
-        db.commit()
-        db.refresh(new_user)
+        def save():
+            db.add(new_user)
+            db.commit()
+            db.refresh(new_user)
+        await run_in_threadpool(save)
 
         return {
             "id": new_user.id,
@@ -95,15 +120,19 @@ def register(user: UserCreate, db: Session = Depends(database.get_db)):
 
 
 @router.post("/login")
-def login(form_data: OAuth2PasswordRequestForm = Depends(), db: Session = Depends(database.get_db)):
-    user = db.query(models.User).filter(models.User.username == form_data.username).first()
-    if not user or not auth.verify_password(form_data.password, user.hashed_password):
+async def login(form_data: OAuth2PasswordRequestForm = Depends(), db: Session = Depends(database.get_db)):
+    user = await run_in_threadpool(get_user_by_username, db, form_data.username)
+    try:
+        valid = user is not None and await password_pool.verify(form_data.password, user.hashed_password)
+    except PasswordPoolError as e:
+        raise busy_exception(e)
+    if not valid:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Incorrect username or password",
             headers={"WWW-Authenticate": "Bearer"},
         )
-    access_token = auth.create_access_token(data={"sub": user.username})
+    access_token = auth.create_access_token(data={"sub": user.username, "uid": user.id})
     return {"access_token": access_token, "token_type": "bearer"}
 
 
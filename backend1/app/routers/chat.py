@@ -1,7 +1,19 @@
 from fastapi import APIRouter, Depends, HTTPException
+from fastapi.responses import StreamingResponse
+from starlette.concurrency import run_in_threadpool
 from sqlalchemy.orm import Session
-from app import models, database, auth, rag_engine
+from app import models, database, auth, llm, rag_engine
+from app.answer_cache import ANSWER_CACHE_ENABLED, answer_cache
+from app.observability import observe_stage
 from pydantic import BaseModel
+from typing import List, Optional
+import asyncio
+import json
+import logging
+import os
+import time
+
+logger = logging.getLogger(__name__)
 
 router = APIRouter(
     prefix="/chat",
@@ -14,6 +26,24 @@ class ChatRequest(BaseModel):
 class ChatResponse(BaseModel):
     response: str
 
+# Questions per /chat/batch call, and how many of them are generated at once
+CHAT_BATCH_MAX_QUESTIONS = int(os.getenv("CHAT_BATCH_MAX_QUESTIONS", "20"))
+CHAT_BATCH_CONCURRENCY = int(os.getenv("CHAT_BATCH_CONCURRENCY", "4"))
+
+class ChatBatchRequest(BaseModel):
+    questions: List[str]
+
+class ChatBatchAnswer(BaseModel):
+    question: str
+    answer: str
+    cached: bool = False
+    llm_ms: Optional[float] = None
+    error: Optional[str] = None
+
+class ChatBatchResponse(BaseModel):
+    results: List[ChatBatchAnswer]
+    timings: dict
+
 @router.post("/", response_model=ChatResponse)
 def chat(
     request: ChatRequest,
@@ -22,3 +52,155 @@ def chat(
 ):
     response_text = rag_engine.query_rag(request.message, current_user.id, db)
     return {"response": response_text}
+
+async def _single(text: str):
+    yield text
+
+def sse_event(event: str, data: dict) -> str:
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+@router.post("/stream")
+async def chat_stream(
+    request: ChatRequest,
+    current_user: models.User = Depends(auth.get_current_user),
+    db: Session = Depends(database.get_db)
+):
+    """
+    Server-sent events: "token" events carry answer text as it is generated,
+    a final "done" event carries retrieval_ms, ttft_ms and total_ms.
+    """
+    start = time.perf_counter()
+    # Embedding + Chroma query are blocking; keep them off the event loop
+    query_embedding = await run_in_threadpool(rag_engine.embed_query, request.message)
+    cached = answer_cache.lookup(current_user.id, query_embedding) if ANSWER_CACHE_ENABLED else None
+    context_chunks = None
+    if cached is None:
+        context_chunks = await run_in_threadpool(
+            rag_engine.retrieve_prompt_context, request.message, current_user.id, db, 3, query_embedding
+        )
+    retrieval_ms = (time.perf_counter() - start) * 1000
+
+    async def events():
+        ttft_ms = None
+        answer = []
+        try:
+            if cached is not None:
+                tokens = _single(cached)
+            elif context_chunks is None:
+                tokens = _single(rag_engine.NO_DOCUMENTS_MESSAGE)
+            else:
+                prompt = rag_engine.build_prompt(context_chunks, request.message)
+                tokens = llm.get_client().astream(prompt)
+
+            async for token in tokens:
+                if ttft_ms is None:
+                    ttft_ms = (time.perf_counter() - start) * 1000
+                    if cached is None and context_chunks is not None:
+                        observe_stage("llm_first_token", (ttft_ms - retrieval_ms) / 1000)
+                answer.append(token)
+                yield sse_event("token", {"text": token})
+
+            if cached is None and context_chunks is not None:
+                llm_ms = (time.perf_counter() - start) * 1000 - retrieval_ms
+                observe_stage("llm_generate", llm_ms / 1000)
+            if cached is None and context_chunks is not None and ANSWER_CACHE_ENABLED:
+                answer_cache.store(current_user.id, query_embedding, request.message, "".join(answer), llm_ms)
+        except llm.LLMConfigError as e:
+            yield sse_event("token", {"text": str(e)})
+        except Exception as e:
+            logger.exception("Streaming chat failed")
+            yield sse_event("error", {"detail": f"Failed to generate response: {e}"})
+
+        timings = {
+            "retrieval_ms": round(retrieval_ms, 1),
+            "ttft_ms": round(ttft_ms, 1) if ttft_ms is not None else None,
+            "total_ms": round((time.perf_counter() - start) * 1000, 1),
+            "cached": cached is not None,
+        }
+        logger.info(f"chat stream user={current_user.id} {timings}")
+        yield sse_event("done", timings)
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+@router.post("/batch", response_model=ChatBatchResponse)
+async def chat_batch(
+    request: ChatBatchRequest,
+    current_user: models.User = Depends(auth.get_current_user),
+    db: Session = Depends(database.get_db)
+):
+    """
+    Answers several questions about the user's records in one call: one
+    embedding pass and one multi-query vector search for all of them, then
+    up to CHAT_BATCH_CONCURRENCY answers generated at a time. Results come
+    back in request order; timings are per batch (embed/retrieval) and per
+    question (llm_ms).
+    """
+    questions = [q.strip() for q in request.questions]
+    if not questions or not all(questions):
+        raise HTTPException(status_code=400, detail="questions must be a non-empty list of non-empty strings")
+    if len(questions) > CHAT_BATCH_MAX_QUESTIONS:
+        raise HTTPException(status_code=400, detail=f"At most {CHAT_BATCH_MAX_QUESTIONS} questions per batch")
+
+    start = time.perf_counter()
+    query_embeddings = await run_in_threadpool(rag_engine.embed_queries, questions)
+    embed_ms = (time.perf_counter() - start) * 1000
+
+    results = [ChatBatchAnswer(question=q, answer="") for q in questions]
+    pending = []
+    for i, embedding in enumerate(query_embeddings):
+        cached = answer_cache.lookup(current_user.id, embedding) if ANSWER_CACHE_ENABLED else None
+        if cached is not None:
+            results[i].answer, results[i].cached = cached, True
+        else:
+            pending.append(i)
+
+    contexts = []
+    if pending:
+        contexts = await run_in_threadpool(
+            rag_engine.retrieve_prompt_context_batch,
+            [questions[i] for i in pending], current_user.id, db, 3, query_embeddings[pending],
+        )
+    retrieval_ms = (time.perf_counter() - start) * 1000 - embed_ms
+
+    if pending and contexts is None:
+        for i in pending:
+            results[i].answer = rag_engine.NO_DOCUMENTS_MESSAGE
+    elif pending:
+        try:
+            client = llm.get_client()
+        except llm.LLMConfigError as e:
+            for i in pending:
+                results[i].answer = str(e)
+        else:
+            limit = asyncio.Semaphore(CHAT_BATCH_CONCURRENCY)
+
+            async def answer(i: int, context_chunks: list):
+                async with limit:
+                    t0 = time.perf_counter()
+                    try:
+                        text = await client.agenerate(rag_engine.build_prompt(context_chunks, questions[i]))
+                    except Exception as e:
+                        logger.warning(f"Batch question {i} failed: {e}")
+                        results[i].error = f"Failed to generate response: {e}"
+                        return
+                    llm_ms = (time.perf_counter() - t0) * 1000
+                    observe_stage("llm_generate", llm_ms / 1000)
+                    results[i].answer, results[i].llm_ms = text, round(llm_ms, 1)
+                    if ANSWER_CACHE_ENABLED:
+                        answer_cache.store(current_user.id, query_embeddings[i], questions[i], text, llm_ms)
+
+            await asyncio.gather(*(answer(i, chunks) for i, chunks in zip(pending, contexts)))
+
+    timings = {
+        "questions": len(questions),
+        "cached": len(questions) - len(pending),
+        "embed_ms": round(embed_ms, 1),
+        "retrieval_ms": round(retrieval_ms, 1),
+        "total_ms": round((time.perf_counter() - start) * 1000, 1),
+    }
+    logger.info(f"chat batch user={current_user.id} {timings}")
+    return {"results": results, "timings": timings}
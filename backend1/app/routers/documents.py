@@ -1,10 +1,17 @@
-from fastapi import APIRouter, Depends, HTTPException, UploadFile, File, Form, status
+from fastapi import APIRouter, Depends, HTTPException, UploadFile, File, Form, Header, Query, Response, status
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import FileResponse
+from sqlalchemy import and_, or_
 from sqlalchemy.orm import Session
-from app import models, database, auth, rag_engine
-from typing import List, Optional
-import shutil
+from app import models, database, auth, rag_engine, ingestion, blob_store
+from app.answer_cache import answer_cache
+from typing import List, Optional, Tuple
+import aiofiles
+import base64
+import hashlib
+import json
+import mimetypes
 import os
-import uuid
 from pydantic import BaseModel
 from datetime import datetime
 
@@ -13,21 +20,69 @@ router = APIRouter(
     tags=["documents"],
 )
 
+# New uploads live in the content-addressed store under UPLOAD_DIR/blobs (app.blob_store)
 UPLOAD_DIR = "uploaded_files"
 if not os.path.exists(UPLOAD_DIR):
     os.makedirs(UPLOAD_DIR)
 
+MAX_UPLOAD_BYTES = int(os.getenv("MAX_UPLOAD_MB", "16")) * 1024 * 1024
+UPLOAD_CHUNK_SIZE = 1024 * 1024
+
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 500
+
 class DocumentResponse(BaseModel):
     id: int
     filename: str
     upload_date: datetime
-    category: Optional[str]
-    description: Optional[str]
-    metadata_info: Optional[str]
+    category: Optional[str] = None
+    description: Optional[str] = None
+    metadata_info: Optional[str] = None
+    status: Optional[str] = None
+
+    class Config:
+        orm_mode = True
+
+class DocumentStatusResponse(BaseModel):
+    id: int
+    status: Optional[str]
+    status_detail: Optional[str] = None
+    status_updated_at: Optional[datetime] = None
+    chunk_count: Optional[int] = None
+    avg_chunk_chars: Optional[float] = None
 
     class Config:
         orm_mode = True
 
+async def save_upload(file: UploadFile, dest_path: str, max_bytes: Optional[int] = None) -> Tuple[int, str]:
+    """
+    Streams an upload to disk in chunks, hashing as it goes.
+    Returns (size, sha256 hexdigest). Raises 413 and removes the partial file
+    once the upload grows past max_bytes.
+    """
+    max_bytes = max_bytes or MAX_UPLOAD_BYTES
+    sha256 = hashlib.sha256()
+    size = 0
+    try:
+        async with aiofiles.open(dest_path, "wb") as buffer:
+            while True:
+                chunk = await file.read(UPLOAD_CHUNK_SIZE)
+                if not chunk:
+                    break
+                size += len(chunk)
+                if size > max_bytes:
+                    raise HTTPException(
+                        status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+                        detail=f"File exceeds the {max_bytes // (1024 * 1024)}MB upload limit"
+                    )
+                sha256.update(chunk)
+                await buffer.write(chunk)
+    except BaseException:
+        if os.path.exists(dest_path):
+            os.remove(dest_path)
+        raise
+    return size, sha256.hexdigest()
+
 @router.post("/upload", response_model=DocumentResponse)
 async def upload_document(
     file: UploadFile = File(...),
@@ -37,48 +92,173 @@ async def upload_document(
     current_user: models.User = Depends(auth.get_current_user),
     db: Session = Depends(database.get_db)
 ):
-    # Validate file size (approx 16MB limit check would be better done via middleware or reading chunks, 
-    # but for simplicity we'll assume the server config handles max body size, or we check after read)
-    
     file_ext = os.path.splitext(file.filename)[1].lower()
     if file_ext not in [".pdf", ".png", ".jpg", ".jpeg", ".txt"]:
         raise HTTPException(status_code=400, detail="Invalid file type")
 
-    # Secure filename
-    unique_filename = f"{uuid.uuid4()}{file_ext}"
-    file_path = os.path.join(UPLOAD_DIR, unique_filename)
+    # Staged next to the blobs so storing it is a rename
+    partial_path = blob_store.temp_path()
+
+    file_size, content_hash = await save_upload(file, partial_path)
+
+    # Same bytes already uploaded by this user: reuse its row and Chroma chunks
+    existing = db.query(models.Document).filter(
+        models.Document.user_id == current_user.id,
+        models.Document.content_hash == content_hash
+    ).first()
+    if existing:
+        os.remove(partial_path)
+        if existing.status == ingestion.STATUS_FAILED:
+            answer_cache.invalidate(current_user.id)
+            ingestion.set_status(db, existing.id, ingestion.STATUS_QUEUED)
+            ingestion.queue.notify()
+            db.refresh(existing)
+        return existing
 
-    with open(file_path, "wb") as buffer:
-        shutil.copyfileobj(file.file, buffer)
+    # Another user's identical upload shares the stored file (fsync + rename, off the event loop)
+    blob = await run_in_threadpool(blob_store.store, db, partial_path, content_hash, file_size, file_ext)
 
     # Create DB record
     db_doc = models.Document(
         user_id=current_user.id,
         filename=file.filename, # Original name
-        file_path=file_path,
+        file_path=blob.path,
+        file_size=file_size,
+        content_hash=content_hash,
         category=category,
         description=description,
-        metadata_info=metadata_info
+        metadata_info=metadata_info,
+        status=ingestion.STATUS_QUEUED
     )
     db.add(db_doc)
     db.commit()
     db.refresh(db_doc)
 
-    # Trigger RAG processing (async in production, sync here for simplicity)
-    try:
-        rag_engine.process_document(db_doc.id, file_path, db)
-    except Exception as e:
-        print(f"Error processing document: {e}")
-        # We don't fail the upload if indexing fails, but we should log it
+    # Cached answers may be missing this document (also invalidated once it is indexed)
+    answer_cache.invalidate(current_user.id)
+
+    # RAG processing happens in the ingestion worker pool; poll /documents/{id}/status
+    ingestion.queue.notify()
 
     return db_doc
 
-@router.get("/", response_model=List[DocumentResponse])
+def encode_cursor(upload_date: datetime, doc_id: int) -> str:
+    raw = f"{upload_date.isoformat()}|{doc_id}".encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+def decode_cursor(cursor: str) -> Tuple[datetime, int]:
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode()
+        upload_date, doc_id = raw.rsplit("|", 1)
+        return datetime.fromisoformat(upload_date), int(doc_id)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+# The list view only needs these; description and metadata_info can be large
+LIST_COLUMNS = (
+    models.Document.id,
+    models.Document.filename,
+    models.Document.upload_date,
+    models.Document.category,
+    models.Document.status,
+)
+TEXT_COLUMNS = (models.Document.description, models.Document.metadata_info)
+
+@router.get("/", response_model=List[DocumentResponse], response_model_exclude_unset=True)
 def get_documents(
+    response: Response,
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    cursor: Optional[str] = Query(None, description="X-Next-Cursor from the previous page"),
+    category: Optional[str] = None,
+    uploaded_after: Optional[datetime] = None,
+    uploaded_before: Optional[datetime] = None,
+    include_text: bool = Query(False, description="Also return description and metadata_info"),
+    if_none_match: Optional[str] = Header(None),
+    current_user: models.User = Depends(auth.get_current_user),
+    db: Session = Depends(database.get_db)
+):
+    """
+    Newest documents first, one page at a time. Pages are keyset-paginated on
+    (upload_date, id), served by the ix_documents_user_id_upload_date index;
+    the cursor for the next page is returned in the X-Next-Cursor header.
+    """
+    columns = LIST_COLUMNS + TEXT_COLUMNS if include_text else LIST_COLUMNS
+    query = db.query(*columns).filter(models.Document.user_id == current_user.id)
+    if category is not None:
+        query = query.filter(models.Document.category == category)
+    if uploaded_after is not None:
+        query = query.filter(models.Document.upload_date >= uploaded_after)
+    if uploaded_before is not None:
+        query = query.filter(models.Document.upload_date < uploaded_before)
+    if cursor:
+        last_date, last_id = decode_cursor(cursor)
+        query = query.filter(or_(
+            models.Document.upload_date < last_date,
+            and_(models.Document.upload_date == last_date, models.Document.id < last_id),
+        ))
+
+    # One extra row tells us whether there is a next page
+    rows = query.order_by(
+        models.Document.upload_date.desc(), models.Document.id.desc()
+    ).limit(limit + 1).all()
+    docs = [row._asdict() for row in rows[:limit]]
+
+    headers = {}
+    if len(rows) > limit:
+        headers["X-Next-Cursor"] = encode_cursor(docs[-1]["upload_date"], docs[-1]["id"])
+
+    # Lets the dashboard poll without re-downloading an unchanged page
+    digest = hashlib.sha1(json.dumps([docs, headers], default=str).encode()).hexdigest()
+    headers["ETag"] = f'W/"{digest}"'
+    if if_none_match and headers["ETag"] in (tag.strip() for tag in if_none_match.split(",")):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+
+    response.headers.update(headers)
+    return docs
+
+@router.get("/{doc_id}/status", response_model=DocumentStatusResponse)
+def get_document_status(
+    doc_id: int,
     current_user: models.User = Depends(auth.get_current_user),
     db: Session = Depends(database.get_db)
 ):
-    return db.query(models.Document).filter(models.Document.user_id == current_user.id).all()
+    doc = db.query(models.Document).filter(models.Document.id == doc_id, models.Document.user_id == current_user.id).first()
+    if not doc:
+        raise HTTPException(status_code=404, detail="Document not found")
+    return doc
+
+@router.get("/{doc_id}/file")
+def download_document(
+    doc_id: int,
+    if_none_match: Optional[str] = Header(None),
+    current_user: models.User = Depends(auth.get_current_user),
+    db: Session = Depends(database.get_db)
+):
+    """
+    The uploaded file. Supports Range requests (206 Partial Content) so
+    large scans can be resumed or previewed page by page.
+    """
+    doc = db.query(models.Document).filter(models.Document.id == doc_id, models.Document.user_id == current_user.id).first()
+    if not doc:
+        raise HTTPException(status_code=404, detail="Document not found")
+    if not doc.file_path or not os.path.exists(doc.file_path):
+        raise HTTPException(status_code=404, detail="File missing")
+
+    headers = {"Cache-Control": "private, max-age=3600"}
+    if doc.content_hash:
+        # Stored files never change, so the content hash is a strong validator
+        headers["ETag"] = f'"{doc.content_hash}"'
+        if if_none_match and headers["ETag"] in (tag.strip() for tag in if_none_match.split(",")):
+            return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+
+    # FileResponse answers Range/If-Range itself and hands the path to the
+    # server (zero-copy) where it supports the http.response.pathsend extension
+    return FileResponse(
+        doc.file_path,
+        filename=doc.filename,
+        media_type=mimetypes.guess_type(doc.filename or "")[0] or "application/octet-stream",
+        headers=headers,
+    )
 
 @router.delete("/{doc_id}")
 def delete_document(
@@ -89,16 +269,21 @@ def delete_document(
     doc = db.query(models.Document).filter(models.Document.id == doc_id, models.Document.user_id == current_user.id).first()
     if not doc:
         raise HTTPException(status_code=404, detail="Document not found")
-    
-    # Remove file
-    if os.path.exists(doc.file_path):
+
+    # Drop this document's reference on the stored file; gc_blobs.py deletes
+    # it once nothing uses it. A file from before the store is this
+    # document's own, even if another user's blob has the same hash.
+    if blob_store.is_blob_path(doc.file_path):
+        blob_store.release(db, doc.content_hash)
+    elif doc.file_path and os.path.exists(doc.file_path):
         os.remove(doc.file_path)
-    
+
     # Remove from DB
     db.delete(doc)
     db.commit()
     
     # Remove from Vector Store
-    rag_engine.delete_document_embeddings(doc.id)
+    rag_engine.delete_document_embeddings(doc.id, doc.user_id)
+    answer_cache.invalidate(current_user.id)
 
     return {"message": "Document deleted"}
@@ -0,0 +1,330 @@
+"""
+Compact vector storage: chunk embeddings kept as float16 or scalar-quantized
+int8 instead of ChromaDB's float32 index.
+
+Selected with VECTOR_STORAGE=float16|int8 (see rag_engine). A 384-dim
+MiniLM vector takes 768 bytes as float16 and 388 as int8 (one float32 scale
+per vector) against 1536 in Chroma, before Chroma's HNSW graph. Queries
+score the user's compact matrix, which is all that is held in memory, with
+NumPy. With int8 the best VECTOR_RERANK_FACTOR x n candidates are then
+rescored against a float16 copy kept on disk next to each row (read only
+for those candidates), which recovers the ordering quantization blurs; so
+an int8 row costs 1156 bytes on disk. The store is self-contained: nothing
+is read back from the embedding cache or the model.
+
+CompactCollection mimics the handful of Chroma collection methods the app
+uses (upsert/get/delete/query/count), so rag_engine, bulk_ingest and
+reindex_docs.py work against either store.
+"""
+import json
+import os
+import sqlite3
+import threading
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+VECTOR_STORE_PATH = os.getenv("VECTOR_STORE_PATH", "vector_store.db")
+# Candidates per requested result rescored against the float16 rerank copy (int8 only)
+VECTOR_RERANK_FACTOR = int(os.getenv("VECTOR_RERANK_FACTOR", "4"))
+# Users whose compact matrices are kept in memory
+VECTOR_CACHE_USERS = int(os.getenv("VECTOR_CACHE_USERS", "256"))
+
+DTYPES = {"float16": np.float16, "int8": np.int8}
+
+# SQLite's default limit on bound parameters is 999
+_BATCH = 500
+# Rows widened to float32 at a time while scoring
+_SCORE_BLOCK = 4096
+
+
+def quantize(vectors: np.ndarray, dtype: str) -> Tuple[np.ndarray, np.ndarray]:
+    """Returns (compact rows, per-row float32 scales). int8 is symmetric, one scale per vector."""
+    vectors = np.asarray(vectors, dtype=np.float32)
+    if dtype == "float16":
+        return vectors.astype(np.float16), np.ones(len(vectors), dtype=np.float32)
+    scales = np.abs(vectors).max(axis=1) / 127
+    scales[scales == 0] = 1.0
+    return np.round(vectors / scales[:, None]).astype(np.int8), scales.astype(np.float32)
+
+
+def dequantize(data: np.ndarray, scales: np.ndarray) -> np.ndarray:
+    return data.astype(np.float32) * scales[:, None]
+
+
+def approximate_scores(data: np.ndarray, scales: np.ndarray, query: np.ndarray) -> np.ndarray:
+    """Dot products straight off the compact rows, widened block by block so only one block is ever float32."""
+    scores = np.empty(len(data), dtype=np.float32)
+    for start in range(0, len(data), _SCORE_BLOCK):
+        block = data[start:start + _SCORE_BLOCK]
+        scores[start:start + len(block)] = block.astype(np.float32) @ query
+    return scores * scales
+
+
+def _where_clause(where: Optional[dict]) -> Tuple[str, list]:
+    if not where:
+        return "", []
+    unknown = set(where) - {"doc_id", "user_id"}
+    if unknown:
+        raise ValueError(f"Unsupported filter keys: {sorted(unknown)}")
+    return " WHERE " + " AND ".join(f"{key} = ?" for key in where), list(where.values())
+
+
+class CompactVectorStore:
+    def __init__(self, path: str = VECTOR_STORE_PATH, dtype: str = "int8"):
+        if dtype not in DTYPES:
+            raise ValueError(f"Unknown vector dtype '{dtype}', expected one of {sorted(DTYPES)}")
+        self.path = path
+        self.dtype = dtype
+        self._conn = None
+        self._lock = threading.Lock()
+        # user_id -> (chunk ids, compact matrix, scales)
+        self._matrices: "OrderedDict[int, Tuple[List[str], np.ndarray, np.ndarray]]" = OrderedDict()
+        self._data_version = None
+        # Bumped whenever the cached matrices are dropped, so a matrix built
+        # outside the lock can tell it was read before a write
+        self._generation = 0
+
+    def _connection(self) -> sqlite3.Connection:
+        # Opened lazily so every ingestion worker process gets its own handle
+        if self._conn is None:
+            conn = sqlite3.connect(self.path, timeout=30, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS vectors (
+                    chunk_id TEXT PRIMARY KEY,
+                    doc_id INTEGER NOT NULL,
+                    user_id INTEGER NOT NULL,
+                    text TEXT NOT NULL,
+                    metadata TEXT NOT NULL,
+                    dtype TEXT NOT NULL,
+                    scale REAL NOT NULL,
+                    vector BLOB NOT NULL,
+                    rerank BLOB
+                )
+                """
+            )
+            columns = {row[1] for row in conn.execute("PRAGMA table_info(vectors)")}
+            if "rerank" not in columns:
+                # Stores created before the rerank copy; their rows rescore off the compact vector
+                conn.execute("ALTER TABLE vectors ADD COLUMN rerank BLOB")
+            conn.execute("CREATE INDEX IF NOT EXISTS ix_vectors_user_id ON vectors (user_id)")
+            conn.execute("CREATE INDEX IF NOT EXISTS ix_vectors_doc_id ON vectors (doc_id)")
+            self._conn = conn
+        return self._conn
+
+    def _invalidate_if_changed(self, conn: sqlite3.Connection):
+        # data_version moves when another process (an ingestion worker) commits
+        version = conn.execute("PRAGMA data_version").fetchone()[0]
+        if version != self._data_version:
+            self._clear_matrices()
+            self._data_version = version
+
+    def _clear_matrices(self):
+        self._matrices.clear()
+        self._generation += 1
+
+    def upsert(self, ids: List[str], documents: List[str], metadatas: List[dict], embeddings):
+        data, scales = quantize(embeddings, self.dtype)
+        if self.dtype == "int8":
+            reranks = [row.tobytes() for row in np.asarray(embeddings, dtype=np.float16)]
+        else:
+            reranks = [None] * len(ids)
+        rows = [
+            (chunk_id, meta["doc_id"], meta["user_id"], text, json.dumps(meta), self.dtype, float(scale), row.tobytes(), rerank)
+            for chunk_id, text, meta, row, scale, rerank in zip(ids, documents, metadatas, data, scales, reranks)
+        ]
+        with self._lock:
+            conn = self._connection()
+            conn.executemany(
+                "INSERT OR REPLACE INTO vectors (chunk_id, doc_id, user_id, text, metadata, dtype, scale, vector, rerank) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                rows,
+            )
+            conn.commit()
+            self._clear_matrices()
+
+    def get(self, where: Optional[dict] = None, ids: Optional[List[str]] = None, include=("metadatas", "documents")) -> dict:
+        clause, params = _where_clause(where)
+        with self._lock:
+            conn = self._connection()
+            if ids is not None:
+                found = []
+                for i in range(0, len(ids), _BATCH):
+                    batch = ids[i:i + _BATCH]
+                    found += conn.execute(
+                        f"SELECT chunk_id, text, metadata FROM vectors WHERE chunk_id IN ({','.join('?' * len(batch))})",
+                        batch,
+                    ).fetchall()
+            else:
+                found = conn.execute(f"SELECT chunk_id, text, metadata FROM vectors{clause}", params).fetchall()
+        result = {"ids": [row[0] for row in found]}
+        if "documents" in include:
+            result["documents"] = [row[1] for row in found]
+        if "metadatas" in include:
+            result["metadatas"] = [json.loads(row[2]) for row in found]
+        return result
+
+    def delete(self, ids: Optional[List[str]] = None, where: Optional[dict] = None):
+        with self._lock:
+            conn = self._connection()
+            if ids is not None:
+                conn.executemany("DELETE FROM vectors WHERE chunk_id = ?", [(i,) for i in ids])
+            else:
+                clause, params = _where_clause(where)
+                conn.execute(f"DELETE FROM vectors{clause}", params)
+            conn.commit()
+            self._clear_matrices()
+
+    def count(self, where: Optional[dict] = None) -> int:
+        clause, params = _where_clause(where)
+        with self._lock:
+            return self._connection().execute(f"SELECT COUNT(*) FROM vectors{clause}", params).fetchone()[0]
+
+    def _matrix(self, user_id: int) -> Tuple[List[str], np.ndarray, np.ndarray]:
+        """The user's vectors in the configured dtype, loaded once and kept until the store changes."""
+        with self._lock:
+            conn = self._connection()
+            self._invalidate_if_changed(conn)
+            cached = self._matrices.get(user_id)
+            if cached is not None:
+                self._matrices.move_to_end(user_id)
+                return cached
+            rows = self._matrix_rows(conn, user_id)
+            generation = self._generation
+
+        # Built outside the lock so other users' queries and writes aren't held up
+        entry = self._build_matrix(rows)
+        with self._lock:
+            conn = self._connection()
+            self._invalidate_if_changed(conn)
+            if self._generation != generation:
+                # A write landed while we were building; this entry is already stale
+                entry = self._build_matrix(self._matrix_rows(conn, user_id))
+            self._matrices[user_id] = entry
+            while len(self._matrices) > VECTOR_CACHE_USERS:
+                self._matrices.popitem(last=False)
+        return entry
+
+    def _matrix_rows(self, conn: sqlite3.Connection, user_id: int) -> list:
+        return conn.execute(
+            "SELECT chunk_id, dtype, scale, vector FROM vectors WHERE user_id = ?", (user_id,)
+        ).fetchall()
+
+    def _build_matrix(self, rows: list) -> Tuple[List[str], np.ndarray, np.ndarray]:
+        ids = [row[0] for row in rows]
+        if all(row[1] == self.dtype for row in rows):
+            dtype = DTYPES[self.dtype]
+            data = np.frombuffer(b"".join(row[3] for row in rows), dtype=dtype).reshape(len(rows), -1) if rows else None
+            scales = np.fromiter((row[2] for row in rows), dtype=np.float32, count=len(rows))
+        else:
+            # Written under another VECTOR_STORAGE setting; convert until reindexed
+            full = np.stack([
+                np.frombuffer(row[3], dtype=DTYPES[row[1]]).astype(np.float32) * row[2] for row in rows
+            ])
+            data, scales = quantize(full, self.dtype)
+        return ids, data, scales
+
+    def _rerank_rows(self, chunk_ids: List[str]) -> Dict[str, Tuple[str, np.ndarray]]:
+        """chunk_id -> (text, float32 vector from the rerank copy, or the compact vector without one)."""
+        found = {}
+        with self._lock:
+            conn = self._connection()
+            for i in range(0, len(chunk_ids), _BATCH):
+                batch = chunk_ids[i:i + _BATCH]
+                found.update((row[0], row[1:]) for row in conn.execute(
+                    f"SELECT chunk_id, text, dtype, scale, vector, rerank FROM vectors "
+                    f"WHERE chunk_id IN ({','.join('?' * len(batch))})",
+                    batch,
+                ))
+        rows = {}
+        for chunk_id, (text, dtype, scale, vector, rerank) in found.items():
+            if rerank is not None:
+                rows[chunk_id] = (text, np.frombuffer(rerank, dtype=np.float16).astype(np.float32))
+            else:
+                rows[chunk_id] = (text, np.frombuffer(vector, dtype=DTYPES[dtype]).astype(np.float32) * scale)
+        return rows
+
+    def query(self, user_id: int, query_embedding: np.ndarray, n_results: int, where: Optional[dict] = None) -> dict:
+        """Top n_results chunks of user_id by cosine similarity, rescored on the rerank copy."""
+        ids, data, scales = self._matrix(user_id)
+        if not ids:
+            return {"ids": [[]], "documents": [[]], "distances": [[]]}
+        query = np.asarray(query_embedding, dtype=np.float32)
+
+        approx = approximate_scores(data, scales, query)
+        if where and "doc_id" in where:
+            allowed = set(self.get(where={**where, "user_id": user_id}, include=())["ids"])
+            approx = np.where([i in allowed for i in ids], approx, -np.inf)
+        candidates = min(len(ids), max(n_results, n_results * VECTOR_RERANK_FACTOR))
+        top = np.argpartition(-approx, candidates - 1)[:candidates]
+        top = top[np.isfinite(approx[top])]
+
+        found = self._rerank_rows([ids[i] for i in top])
+        candidate_ids = [ids[i] for i in top if ids[i] in found]
+        candidate_texts = [found[i][0] for i in candidate_ids]
+        if candidate_ids:
+            exact = np.stack([found[i][1] for i in candidate_ids]) @ query
+        else:
+            exact = np.zeros(0, dtype=np.float32)
+        order = np.argsort(-exact)[:n_results]
+        return {
+            "ids": [[candidate_ids[i] for i in order]],
+            "documents": [[candidate_texts[i] for i in order]],
+            "distances": [[float(1 - exact[i]) for i in order]],
+        }
+
+    def footprint(self) -> Dict[str, int]:
+        """Bytes used on disk (the whole file, rerank copies included) and by the cached matrices in memory."""
+        with self._lock:
+            memory = sum(data.nbytes + scales.nbytes for _, data, scales in self._matrices.values() if data is not None)
+            # Pages still in the WAL would otherwise be counted twice
+            self._connection().execute("PRAGMA wal_checkpoint(TRUNCATE)")
+        disk = sum(os.path.getsize(p) for p in (self.path, self.path + "-wal") if os.path.exists(p))
+        return {"disk_bytes": disk, "memory_bytes": memory}
+
+
+class CompactCollection:
+    """A user's slice of the store behind Chroma's collection interface."""
+
+    def __init__(self, store: CompactVectorStore, user_id: Optional[int] = None):
+        self.store = store
+        self.user_id = user_id
+
+    def _scoped(self, where: Optional[dict]) -> dict:
+        where = dict(where or {})
+        if self.user_id is not None:
+            where["user_id"] = self.user_id
+        return where
+
+    def upsert(self, ids, documents, metadatas, embeddings):
+        self.store.upsert(ids, documents, metadatas, embeddings)
+
+    def get(self, where: Optional[dict] = None, ids: Optional[List[str]] = None, include=("metadatas", "documents")) -> dict:
+        if ids is not None:
+            return self.store.get(ids=ids, include=include)
+        return self.store.get(where=self._scoped(where), include=include)
+
+    def delete(self, ids: Optional[List[str]] = None, where: Optional[dict] = None):
+        if ids is not None:
+            self.store.delete(ids=ids)
+        else:
+            self.store.delete(where=self._scoped(where))
+
+    def count(self) -> int:
+        return self.store.count(self._scoped(None))
+
+    def query(self, query_embeddings, n_results: int = 10, where: Optional[dict] = None) -> dict:
+        where = self._scoped(where)
+        user_id = where.pop("user_id", None)
+        if user_id is None:
+            raise ValueError("Compact vector queries are always scoped to one user")
+        merged = {"ids": [], "documents": [], "distances": []}
+        for query in query_embeddings:
+            result = self.store.query(user_id, query, n_results, where or None)
+            for key in merged:
+                merged[key].extend(result[key])
+        return merged
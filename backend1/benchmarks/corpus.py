@@ -0,0 +1,234 @@
+"""
+Synthetic medical corpus for the benchmarks.
+
+Generates lab-report-like documents (text files, text-layer PDFs and, if
+asked, PNG scans) from a seeded RNG, together with labeled questions: each
+question names one lab result, and the retrieved context counts as a hit if
+it contains that result's row.
+
+    python -m benchmarks.corpus --docs 200 --out /tmp/corpus
+"""
+import argparse
+import json
+import os
+import random
+from dataclasses import asdict, dataclass, field
+from datetime import date, timedelta
+from typing import Dict, List
+
+FIRST_NAMES = ["Jane", "Arjun", "Maria", "Wei", "Fatima", "John", "Priya", "Lukas", "Amara", "Kenji"]
+LAST_NAMES = ["Doe", "Raman", "Garcia", "Chen", "Khan", "Smith", "Iyer", "Weber", "Okafor", "Sato"]
+DOCTORS = ["Smith", "Okafor", "Nakamura", "Fischer", "Menon", "Alvarez", "Novak", "Haddad"]
+LABS = ["CITY DIAGNOSTICS LAB", "SUNRISE PATHOLOGY", "METRO HEALTH LABS", "GREENVIEW CLINIC"]
+
+# panel -> [(test, unit, low, high, decimals)]
+PANELS: Dict[str, List[tuple]] = {
+    "COMPLETE BLOOD COUNT": [
+        ("Hemoglobin", "g/dL", 9.0, 17.5, 1),
+        ("WBC Count", "10^3/uL", 3.0, 14.0, 1),
+        ("Platelet Count", "10^3/uL", 120, 450, 0),
+        ("Hematocrit", "%", 30.0, 52.0, 1),
+        ("MCV", "fL", 75, 105, 0),
+    ],
+    "LIPID PROFILE": [
+        ("Total Cholesterol", "mg/dL", 140, 290, 0),
+        ("LDL Cholesterol", "mg/dL", 60, 200, 0),
+        ("HDL Cholesterol", "mg/dL", 30, 90, 0),
+        ("Triglycerides", "mg/dL", 60, 400, 0),
+    ],
+    "DIABETES PANEL": [
+        ("HbA1c", "%", 4.5, 11.0, 1),
+        ("Fasting Glucose", "mg/dL", 70, 240, 0),
+        ("Insulin", "uIU/mL", 2.0, 30.0, 1),
+    ],
+    "THYROID PANEL": [
+        ("TSH", "mIU/L", 0.2, 9.0, 2),
+        ("Free T4", "ng/dL", 0.6, 2.2, 2),
+        ("Free T3", "pg/mL", 2.0, 5.0, 1),
+    ],
+    "KIDNEY FUNCTION": [
+        ("Creatinine", "mg/dL", 0.5, 2.5, 2),
+        ("Blood Urea Nitrogen", "mg/dL", 6, 40, 0),
+        ("eGFR", "mL/min/1.73m2", 30, 120, 0),
+    ],
+}
+IMPRESSIONS = [
+    "Values within normal limits. Routine follow-up advised.",
+    "Mild anemia noted. Iron studies recommended.",
+    "Borderline hypercholesterolemia. Advise diet modification and recheck in three months.",
+    "Elevated glucose markers. Refer to endocrinology for diabetes management.",
+    "Thyroid function suggests subclinical hypothyroidism. Repeat TSH in six weeks.",
+    "Reduced kidney function. Avoid nephrotoxic drugs and monitor creatinine.",
+]
+
+
+@dataclass
+class Question:
+    doc_index: int
+    user_index: int
+    question: str
+    # The lab row as chunking normalizes it ("Hemoglobin 13.5 g/dL 12.0-15.5")
+    expected: str
+
+
+@dataclass
+class CorpusDoc:
+    index: int
+    user_index: int
+    path: str
+    format: str
+    report_date: str
+    lines: List[str] = field(repr=False)
+
+
+def _value(rng: random.Random, low: float, high: float, decimals: int) -> str:
+    value = rng.uniform(low, high)
+    return f"{value:.{decimals}f}" if decimals else str(int(round(value)))
+
+
+def make_report(rng: random.Random, report_date: date, rows_per_panel: int) -> tuple:
+    """Returns (lines, [(test, normalized row, panel)])."""
+    patient = f"{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)}"
+    doctor = rng.choice(DOCTORS)
+    lines = [
+        rng.choice(LABS),
+        f"Patient: {patient}      Age: {rng.randint(18, 90)}",
+        f"Referring Dr. {doctor}. Sample collected {report_date:%d/%m/%Y}.",
+        "",
+    ]
+    facts = []
+    for panel in rng.sample(sorted(PANELS), k=rng.randint(1, 3)):
+        lines.append(panel)
+        for test, unit, low, high, decimals in PANELS[panel][:rows_per_panel]:
+            value = _value(rng, low, high, decimals)
+            ref = f"{_value(rng, low, (low + high) / 2, decimals)}-{_value(rng, (low + high) / 2, high, decimals)}"
+            lines.append(f"{test:<20}{value:<10}{unit:<14}{ref}")
+            facts.append((test, f"{test} {value} {unit} {ref}", panel))
+        lines.append("")
+    lines.append(f"Impression: {rng.choice(IMPRESSIONS)}")
+    return lines, facts
+
+
+def write_pdf(path: str, lines: List[str]):
+    """Minimal single-page PDF with a Courier text layer; no PDF library needed."""
+    def escape(s: str) -> str:
+        return s.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)")
+
+    text = "BT /F1 9 Tf 11 TL 40 800 Td " + " ".join(f"({escape(line)}) '" for line in lines) + " ET"
+    objects = [
+        "<< /Type /Catalog /Pages 2 0 R >>",
+        "<< /Type /Pages /Kids [3 0 R] /Count 1 >>",
+        "<< /Type /Page /Parent 2 0 R /MediaBox [0 0 595 842] "
+        "/Resources << /Font << /F1 4 0 R >> >> /Contents 5 0 R >>",
+        "<< /Type /Font /Subtype /Type1 /BaseFont /Courier >>",
+        f"<< /Length {len(text)} >>\nstream\n{text}\nendstream",
+    ]
+    out = "%PDF-1.4\n"
+    offsets = []
+    for i, obj in enumerate(objects, start=1):
+        offsets.append(len(out))
+        out += f"{i} 0 obj\n{obj}\nendobj\n"
+    xref = len(out)
+    out += f"xref\n0 {len(objects) + 1}\n0000000000 65535 f \n"
+    out += "".join(f"{offset:010d} 00000 n \n" for offset in offsets)
+    out += f"trailer\n<< /Size {len(objects) + 1} /Root 1 0 R >>\nstartxref\n{xref}\n%%EOF\n"
+    with open(path, "w", encoding="latin-1") as f:
+        f.write(out)
+
+
+def write_png(path: str, lines: List[str]):
+    """A 'scanned' report: the text rendered into an image, readable only through OCR."""
+    from PIL import Image, ImageDraw, ImageFont
+
+    font = ImageFont.load_default()
+    image = Image.new("L", (1000, 24 * len(lines) + 40), color=255)
+    draw = ImageDraw.Draw(image)
+    for i, line in enumerate(lines):
+        draw.text((20, 20 + 24 * i), line, fill=0, font=font)
+    image.save(path)
+
+
+WRITERS = {
+    "txt": lambda path, lines: open(path, "w").write("\n".join(lines) + "\n"),
+    "pdf": write_pdf,
+    "png": write_png,
+}
+
+
+def generate(
+    out_dir: str,
+    docs: int,
+    users: int = 1,
+    formats: Dict[str, float] = None,
+    reports_per_doc: int = 1,
+    rows_per_panel: int = 5,
+    questions_per_doc: float = 0.2,
+    seed: int = 42,
+) -> tuple:
+    """
+    Writes docs files to out_dir and returns (corpus docs, questions).
+    formats maps "txt"/"pdf"/"png" to their share of the corpus; a document
+    holds reports_per_doc reports, which sets its size in chunks.
+    """
+    formats = formats or {"txt": 0.7, "pdf": 0.3}
+    rng = random.Random(seed)
+    os.makedirs(out_dir, exist_ok=True)
+    names, weights = zip(*sorted(formats.items()))
+
+    corpus, questions = [], []
+    start = date(2015, 1, 1)
+    for i in range(docs):
+        fmt = rng.choices(names, weights)[0]
+        user_index = i % users
+        lines, facts = [], []
+        for _ in range(reports_per_doc):
+            report_date = start + timedelta(days=rng.randint(0, 3650))
+            report_lines, report_facts = make_report(rng, report_date, rows_per_panel)
+            lines += report_lines + [""]
+            facts += [(test, row, panel, report_date) for test, row, panel in report_facts]
+
+        path = os.path.join(out_dir, f"report_{i:07d}.{fmt}")
+        WRITERS[fmt](path, lines)
+        corpus.append(CorpusDoc(i, user_index, path, fmt, facts[0][3].isoformat(), lines))
+
+        # Fractional rates: 0.2 means one labeled question every fifth document
+        if rng.random() < questions_per_doc:
+            test, row, panel, report_date = rng.choice(facts)
+            question = f"What was my {test} in the {panel.lower()} from {report_date:%d/%m/%Y}?"
+            questions.append(Question(i, user_index, question, row))
+
+    return corpus, questions
+
+
+def parse_formats(spec: str) -> Dict[str, float]:
+    """"txt:0.6,pdf:0.3,png:0.1" -> {"txt": 0.6, ...}"""
+    formats = {}
+    for part in spec.split(","):
+        name, _, share = part.partition(":")
+        if name not in WRITERS:
+            raise ValueError(f"Unknown format '{name}', expected one of {sorted(WRITERS)}")
+        formats[name] = float(share or 1)
+    return formats
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate a synthetic lab report corpus.")
+    parser.add_argument("--docs", type=int, default=200)
+    parser.add_argument("--users", type=int, default=1)
+    parser.add_argument("--formats", default="txt:0.7,pdf:0.3")
+    parser.add_argument("--reports-per-doc", type=int, default=1)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--out", required=True)
+    args = parser.parse_args()
+
+    corpus, questions = generate(
+        args.out, args.docs, args.users, parse_formats(args.formats),
+        reports_per_doc=args.reports_per_doc, seed=args.seed,
+    )
+    with open(os.path.join(args.out, "questions.json"), "w") as f:
+        json.dump([asdict(q) for q in questions], f, indent=2)
+    print(f"Wrote {len(corpus)} documents and {len(questions)} questions to {args.out}")
+
+
+if __name__ == "__main__":
+    main()
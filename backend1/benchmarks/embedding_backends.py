@@ -0,0 +1,174 @@
+"""
+Embedding backend comparison: encode throughput, single-query latency and
+retrieval-quality drift of each EMBEDDING_BACKEND against the fp32 PyTorch
+baseline, on chunks of the synthetic corpus (see benchmarks.corpus).
+
+Run from backend1/:
+
+    python -m benchmarks.embedding_backends --docs 300
+    python -m benchmarks.embedding_backends --backends torch,onnx-int8 --threads 4 --json emb.json
+
+The embedding cache is bypassed, every backend encodes the same chunks from
+scratch. Drift is the cosine similarity between a backend's vectors and the
+baseline's; retrieval is exact top-k over the chunk matrix, reported both as
+recall@k of the labeled answer and as overlap@k with the baseline's top-k.
+"""
+import argparse
+import json
+import os
+import platform
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+
+from benchmarks.rag_suite import git_commit, percentiles  # noqa: E402
+
+
+def build_chunks(corpus) -> list:
+    from app import chunking
+    # The corpus writer's lines are the extracted text of its txt documents
+    chunks = []
+    for doc in corpus:
+        chunks.extend(chunking.chunk_text("\n".join(doc.lines)))
+    return chunks
+
+
+def normalize(vectors: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    return vectors / np.where(norms == 0, 1, norms)
+
+
+def bench_backend(backend: str, threads: int, batch_size: int, chunks: list, questions: list) -> tuple:
+    from app import embeddings
+
+    t0 = time.perf_counter()
+    model = embeddings.load_model(backend, threads)
+    model.encode(["warm up"])
+    load_s = time.perf_counter() - t0
+
+    t0 = time.perf_counter()
+    doc_vectors = np.asarray(model.encode(chunks, batch_size=batch_size), dtype=np.float32)
+    encode_s = time.perf_counter() - t0
+
+    latencies, query_vectors = [], []
+    for q in questions:
+        t0 = time.perf_counter()
+        query_vectors.append(model.encode([q.question])[0])
+        latencies.append(time.perf_counter() - t0)
+
+    result = {
+        "load_s": round(load_s, 2),
+        "chunks": len(chunks),
+        "encode_s": round(encode_s, 2),
+        "chunks_per_sec": round(len(chunks) / encode_s, 1) if encode_s else 0.0,
+        "query_embedding": percentiles(latencies),
+    }
+    return result, normalize(doc_vectors), normalize(np.asarray(query_vectors, dtype=np.float32))
+
+
+def top_k(doc_vectors: np.ndarray, query_vectors: np.ndarray, k: int) -> np.ndarray:
+    scores = query_vectors @ doc_vectors.T
+    return np.argsort(-scores, axis=1)[:, :k]
+
+
+def quality(chunks, questions, doc_vectors, query_vectors, baseline, ks: list) -> dict:
+    """recall@k of the labeled answers, plus drift and overlap@k against baseline (doc, query vectors)."""
+    ranked = top_k(doc_vectors, query_vectors, max(ks))
+    result = {"recall": {}}
+    for k in ks:
+        hits = sum(any(q.expected in chunks[i] for i in row[:k]) for q, row in zip(questions, ranked))
+        result["recall"][f"@{k}"] = round(hits / len(questions), 4) if questions else 0.0
+
+    if baseline is not None:
+        base_docs, base_queries = baseline
+        cosine = np.sum(doc_vectors * base_docs, axis=1)
+        result["drift"] = {
+            "mean_cosine": round(float(cosine.mean()), 5),
+            "min_cosine": round(float(cosine.min()), 5),
+        }
+        base_ranked = top_k(base_docs, base_queries, max(ks))
+        result["overlap"] = {
+            f"@{k}": round(float(np.mean([len(set(a[:k]) & set(b[:k])) / k for a, b in zip(ranked, base_ranked)])), 4)
+            if questions else 0.0
+            for k in ks
+        }
+    return result
+
+
+def run(args, workdir: str) -> dict:
+    from app import embeddings
+    from benchmarks import corpus as corpus_mod
+
+    corpus, questions = corpus_mod.generate(
+        os.path.join(workdir, "corpus"),
+        args.docs,
+        formats={"txt": 1.0},
+        reports_per_doc=args.reports_per_doc,
+        questions_per_doc=args.questions_per_doc,
+        seed=args.seed,
+    )
+    chunks = build_chunks(corpus)
+    print(f"{len(chunks)} chunks, {len(questions)} questions")
+
+    ks = sorted({int(k) for k in args.k.split(",")})
+    backends = args.backends.split(",")
+    results, baseline = {}, None
+    # The fp32 baseline goes first so every other backend is compared against it
+    for backend in sorted(backends, key=lambda b: b != "torch"):
+        try:
+            result, doc_vectors, query_vectors = bench_backend(
+                backend, args.threads, args.batch_size, chunks, questions
+            )
+        except Exception as e:
+            print(f"{backend}: unavailable ({e})")
+            results[backend] = {"error": str(e)}
+            continue
+        result.update(quality(chunks, questions, doc_vectors, query_vectors, baseline, ks))
+        if backend == "torch":
+            baseline = (doc_vectors, query_vectors)
+        results[backend] = result
+        print(f"{backend}: {json.dumps(result)}")
+
+    return {
+        "meta": {
+            "commit": git_commit(),
+            "python": platform.python_version(),
+            "cpu_count": os.cpu_count(),
+            "model": embeddings.EMBEDDING_MODEL_NAME,
+            "args": vars(args),
+        },
+        "backends": results,
+    }
+
+
+def main():
+    from app import embeddings
+
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--backends", default=",".join(embeddings.BACKENDS))
+    parser.add_argument("--docs", type=int, default=300)
+    parser.add_argument("--reports-per-doc", type=int, default=1)
+    parser.add_argument("--questions-per-doc", type=float, default=0.5)
+    parser.add_argument("--threads", type=int, default=embeddings.EMBEDDING_THREADS, help="0 = runtime default")
+    parser.add_argument("--batch-size", type=int, default=embeddings.EMBED_BATCH_SIZE)
+    parser.add_argument("--k", default="1,3,5,10", help="Cut-offs for recall@k and overlap@k")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--json", help="Write results to this file")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as workdir:
+        result = run(args, workdir)
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(result, f, indent=2)
+        print(f"Results written to {args.json}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,174 @@
+"""
+Login storm benchmark: fires concurrent /auth/login requests at a real
+uvicorn server while probing GET /documents/ and /health, and reports how
+responsive those stay.
+
+Run from backend1/:
+
+    python -m benchmarks.login_storm --concurrency 32 --logins 400
+    python -m benchmarks.login_storm --compare --json login_storm.json
+
+--compare runs the storm twice: once with PASSWORD_WORKERS=0 (pbkdf2 on the
+shared threadpool, the old behaviour) and once with the password pool.
+The server runs in a temporary working directory with a fresh database.
+"""
+import argparse
+import json
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def request(url: str, data: bytes = None, headers: dict = None, timeout: float = 60) -> tuple:
+    """Returns (status, body, seconds)."""
+    req = urllib.request.Request(url, data=data, headers=headers or {})
+    start = time.perf_counter()
+    try:
+        with urllib.request.urlopen(req, timeout=timeout) as resp:
+            return resp.status, resp.read(), time.perf_counter() - start
+    except urllib.error.HTTPError as e:
+        return e.code, e.read(), time.perf_counter() - start
+
+
+def percentiles(samples: list) -> dict:
+    if not samples:
+        return {}
+    ordered = sorted(samples)
+    pick = lambda q: ordered[min(len(ordered) - 1, int(q * len(ordered)))] * 1000
+    return {
+        "count": len(ordered),
+        "p50_ms": round(statistics.median(ordered) * 1000, 1),
+        "p95_ms": round(pick(0.95), 1),
+        "p99_ms": round(pick(0.99), 1),
+        "max_ms": round(ordered[-1] * 1000, 1),
+    }
+
+
+def start_server(workdir: str, port: int, env_overrides: dict) -> subprocess.Popen:
+    env = dict(os.environ)
+    env["PYTHONPATH"] = BACKEND_DIR + os.pathsep + env.get("PYTHONPATH", "")
+    env.update({"RAG_WARMUP": "0", "INGEST_WORKERS": "1"}, **env_overrides)
+    proc = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "app.main:app", "--port", str(port), "--log-level", "warning"],
+        cwd=workdir, env=env,
+    )
+    base = f"http://127.0.0.1:{port}"
+    for _ in range(300):
+        try:
+            if request(base + "/health", timeout=1)[0] == 200:
+                return proc
+        except OSError:
+            time.sleep(0.1)
+    proc.terminate()
+    raise RuntimeError("Server did not come up")
+
+
+def login(base: str, username: str, password: str) -> tuple:
+    form = urllib.parse.urlencode({"username": username, "password": password}).encode()
+    return request(base + "/auth/login", form, {"Content-Type": "application/x-www-form-urlencoded"})
+
+
+def run_storm(env_overrides: dict, concurrency: int, logins: int, users: int) -> dict:
+    port = free_port()
+    base = f"http://127.0.0.1:{port}"
+    with tempfile.TemporaryDirectory() as workdir:
+        os.makedirs(os.path.join(workdir, "uploaded_files"))
+        proc = start_server(workdir, port, env_overrides)
+        try:
+            names = [f"storm{i}" for i in range(users)]
+            for name in names:
+                body = json.dumps({"username": name, "password": "correct horse"}).encode()
+                request(base + "/auth/register", body, {"Content-Type": "application/json"})
+            token = json.loads(login(base, names[0], "correct horse")[1])["access_token"]
+            auth = {"Authorization": f"Bearer {token}"}
+
+            probes = {"documents": [], "health": []}
+            stop = threading.Event()
+
+            def probe():
+                while not stop.is_set():
+                    probes["documents"].append(request(base + "/documents/", headers=auth)[2])
+                    probes["health"].append(request(base + "/health")[2])
+                    time.sleep(0.02)
+
+            probe_thread = threading.Thread(target=probe, daemon=True)
+            probe_thread.start()
+
+            start = time.perf_counter()
+            with ThreadPoolExecutor(max_workers=concurrency) as pool:
+                results = list(pool.map(
+                    lambda i: login(base, names[i % users], "correct horse"), range(logins)
+                ))
+            elapsed = time.perf_counter() - start
+            stop.set()
+            probe_thread.join()
+
+            pool_stats = json.loads(request(base + "/health")[1]).get("password_pool")
+        finally:
+            proc.terminate()
+            proc.wait()
+
+    statuses = {}
+    for status, _, _ in results:
+        statuses[str(status)] = statuses.get(str(status), 0) + 1
+    return {
+        "config": env_overrides,
+        "elapsed_s": round(elapsed, 2),
+        "logins_per_sec": round(logins / elapsed, 1),
+        "login_status": statuses,
+        "login": percentiles([s for status, _, s in results if status == 200]),
+        "documents_during_storm": percentiles(probes["documents"]),
+        "health_during_storm": percentiles(probes["health"]),
+        "password_pool": pool_stats,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--concurrency", type=int, default=32, help="Concurrent login clients")
+    parser.add_argument("--logins", type=int, default=400, help="Total login requests")
+    parser.add_argument("--users", type=int, default=8, help="Distinct accounts to log in as")
+    parser.add_argument("--workers", type=int, help="PASSWORD_WORKERS for the pooled run")
+    parser.add_argument("--max-pending", type=int, help="PASSWORD_MAX_PENDING for the pooled run")
+    parser.add_argument("--compare", action="store_true", help="Also run with hashing on the threadpool")
+    parser.add_argument("--json", help="Write results to this file")
+    args = parser.parse_args()
+
+    pooled = {}
+    if args.workers is not None:
+        pooled["PASSWORD_WORKERS"] = str(args.workers)
+    if args.max_pending is not None:
+        pooled["PASSWORD_MAX_PENDING"] = str(args.max_pending)
+    configs = [pooled]
+    if args.compare:
+        configs.insert(0, {"PASSWORD_WORKERS": "0", "PASSWORD_MAX_PENDING": str(args.logins)})
+
+    runs = []
+    for config in configs:
+        print(f"Storm with {config or 'defaults'}...")
+        runs.append(run_storm(config, args.concurrency, args.logins, args.users))
+        print(json.dumps(runs[-1], indent=2))
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(runs, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,271 @@
+"""
+Offline RAG benchmark: ingestion throughput, query latency and recall@k on
+a synthetic corpus (see benchmarks.corpus), with the LLM replaced by the
+local stub generator.
+
+Run from backend1/:
+
+    python -m benchmarks.rag_suite --docs 200
+    python -m benchmarks.rag_suite --docs 5000 --reports-per-doc 4 --json rag.json
+    python -m benchmarks.rag_suite --docs 200 --bulk --modes hybrid,vector
+    python -m benchmarks.rag_suite --docs 200 --modes hybrid,hybrid+rerank
+
+Scale is set by --docs and --reports-per-doc (each report is one or two
+chunks), from ~1k chunks up to 1M+. Everything (database, ChromaDB,
+caches, corpus) lives in a temporary directory unless --workdir is given;
+results are printed and, with --json, written for comparison between
+commits.
+"""
+import argparse
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def percentiles(samples: list) -> dict:
+    if not samples:
+        return {}
+    ordered = sorted(samples)
+    pick = lambda q: ordered[min(len(ordered) - 1, int(q * len(ordered)))] * 1000
+    return {
+        "count": len(ordered),
+        "mean_ms": round(statistics.mean(ordered) * 1000, 2),
+        "p50_ms": round(statistics.median(ordered) * 1000, 2),
+        "p95_ms": round(pick(0.95), 2),
+        "p99_ms": round(pick(0.99), 2),
+        "max_ms": round(ordered[-1] * 1000, 2),
+    }
+
+
+def git_commit() -> str:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=BACKEND_DIR, capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def isolate(workdir: str):
+    """Points every store at workdir; must run before any app module is imported."""
+    os.environ.update({
+        "DATABASE_URL": f"sqlite:///{os.path.join(workdir, 'bench.db')}",
+        "CHROMA_DB_DIR": os.path.join(workdir, "chroma_db"),
+        "EMBEDDING_CACHE_PATH": os.path.join(workdir, "embedding_cache.db"),
+        "LEXICAL_INDEX_PATH": os.path.join(workdir, "lexical_index.db"),
+        "VECTOR_STORE_PATH": os.path.join(workdir, "vector_store.db"),
+        "OCR_CACHE_DIR": os.path.join(workdir, "ocr_cache"),
+        "LLM_PROVIDER": "stub",
+        # Repeated questions must measure retrieval, not the answer cache
+        "ANSWER_CACHE_ENABLED": "0",
+    })
+    os.chdir(workdir)
+
+
+def create_rows(corpus, users: int) -> tuple:
+    """Inserts one user per synthetic patient group and a Document row per file."""
+    from app import database, migrations, models
+
+    migrations.upgrade()
+    db = database.SessionLocal()
+    user_ids = []
+    for i in range(users):
+        user = models.User(username=f"bench{i}", hashed_password="-")
+        db.add(user)
+        db.flush()
+        user_ids.append(user.id)
+    doc_ids = []
+    for doc in corpus:
+        row = models.Document(
+            user_id=user_ids[doc.user_index],
+            filename=os.path.basename(doc.path),
+            file_path=doc.path,
+            category="lab",
+            status="queued",
+        )
+        db.add(row)
+        db.flush()
+        doc_ids.append(row.id)
+    db.commit()
+    db.close()
+    return user_ids, doc_ids
+
+
+def bench_ingestion(corpus, user_ids, doc_ids, bulk: bool, workers: int) -> dict:
+    from app import database, rag_engine
+    from app.bulk_ingest import ingest_documents
+
+    docs = [(doc_ids[d.index], user_ids[d.user_index], d.path) for d in corpus]
+    start = time.perf_counter()
+    if bulk:
+        stats = ingest_documents(docs, workers=workers)
+        elapsed, chunks, per_doc = stats.elapsed, stats.chunks, []
+    else:
+        db = database.SessionLocal()
+        chunks, per_doc = 0, []
+        for doc_id, user_id, path in docs:
+            t0 = time.perf_counter()
+            chunks += rag_engine.process_document(doc_id, path, db, user_id=user_id)["chunk_count"]
+            per_doc.append(time.perf_counter() - t0)
+        db.close()
+        elapsed = time.perf_counter() - start
+
+    result = {
+        "path": "bulk_ingest" if bulk else "process_document",
+        "documents": len(docs),
+        "chunks": chunks,
+        "elapsed_s": round(elapsed, 2),
+        "docs_per_sec": round(len(docs) / elapsed, 2) if elapsed else 0.0,
+        "chunks_per_sec": round(chunks / elapsed, 1) if elapsed else 0.0,
+    }
+    if per_doc:
+        result["per_document"] = percentiles(per_doc)
+    return result
+
+
+def bench_queries(questions, user_ids, modes: list, ks: list, n_results: int) -> dict:
+    from app import chunking, database, rag_engine, reranker
+
+    db = database.SessionLocal()
+    results = {}
+    for mode in modes:
+        # "hybrid+rerank" adds the cross-encoder stage to a retrieval mode
+        rag_engine.RETRIEVAL_MODE, _, stage = mode.partition("+")
+        reranker.RERANK_ENABLED = stage == "rerank"
+        retrieval, end_to_end, context_tokens = [], [], []
+        hits = {k: 0 for k in ks}
+        for q in questions:
+            user_id = user_ids[q.user_index]
+
+            t0 = time.perf_counter()
+            context = rag_engine.retrieve_prompt_context(q.question, user_id, db, n_results) or []
+            retrieval.append(time.perf_counter() - t0)
+            context_tokens.append(sum(chunking.count_tokens(chunk) for chunk in context))
+
+            t0 = time.perf_counter()
+            rag_engine.query_rag(q.question, user_id, db, n_results)
+            end_to_end.append(time.perf_counter() - t0)
+
+            # recall@k: the answer row is in the prompt context assembled from
+            # k retrieved chunks, exactly what query_rag would send the LLM.
+            # The labels are whitespace-normalized rows; only the structure-aware
+            # chunkers collapse the padded columns, so compare normalized text
+            expected = " ".join(q.expected.split())
+            for k in ks:
+                blocks = rag_engine.retrieve_prompt_context(q.question, user_id, db, k) or []
+                if expected in " ".join(" ".join(blocks).split()):
+                    hits[k] += 1
+
+        results[mode] = {
+            "retrieval": percentiles(retrieval),
+            "query_rag": percentiles(end_to_end),
+            # What the LLM gets to read, in embedding-tokenizer tokens
+            "context_tokens_mean": round(statistics.mean(context_tokens), 1) if context_tokens else 0.0,
+            "recall": {f"@{k}": round(hits[k] / len(questions), 4) if questions else 0.0 for k in ks},
+        }
+    db.close()
+    return results
+
+
+def run(args, workdir: str) -> dict:
+    isolate(workdir)
+    sys.path.insert(0, BACKEND_DIR)
+    from benchmarks import corpus as corpus_mod
+
+    t0 = time.perf_counter()
+    corpus, questions = corpus_mod.generate(
+        os.path.join(workdir, "corpus"),
+        args.docs,
+        users=args.users,
+        formats=corpus_mod.parse_formats(args.formats),
+        reports_per_doc=args.reports_per_doc,
+        questions_per_doc=args.questions_per_doc,
+        seed=args.seed,
+    )
+    generate_s = time.perf_counter() - t0
+    print(f"Generated {len(corpus)} documents and {len(questions)} questions in {generate_s:.1f}s")
+
+    from app import chunking, embeddings, extraction, rag_engine, reranker
+    # Model load is not ingestion throughput
+    embeddings.get_embedding_model()
+
+    user_ids, doc_ids = create_rows(corpus, args.users)
+    ingestion = bench_ingestion(corpus, user_ids, doc_ids, args.bulk, args.workers)
+    print(f"Ingestion: {json.dumps(ingestion)}")
+
+    ks = sorted({int(k) for k in args.k.split(",")})
+    queries = bench_queries(questions, user_ids, args.modes.split(","), ks, args.n_results)
+    for mode, result in queries.items():
+        print(f"Queries ({mode}): {json.dumps(result)}")
+
+    return {
+        "meta": {
+            "commit": git_commit(),
+            "timestamp": datetime.utcnow().isoformat(timespec="seconds") + "Z",
+            "python": platform.python_version(),
+            "cpu_count": os.cpu_count(),
+            "args": vars(args),
+            "versions": {
+                "extractor": extraction.EXTRACTOR_VERSION,
+                "chunker": chunking.CHUNKER_VERSION,
+                "embedding": embeddings.EMBEDDING_VERSION,
+                "vector_partitioning": rag_engine.VECTOR_PARTITIONING,
+                "vector_storage": rag_engine.VECTOR_STORAGE,
+                "reranker": reranker.RERANK_MODEL_NAME,
+            },
+        },
+        "corpus": {
+            "documents": len(corpus),
+            "questions": len(questions),
+            "formats": {fmt: sum(1 for d in corpus if d.format == fmt) for fmt in corpus_mod.WRITERS},
+            "generate_s": round(generate_s, 2),
+        },
+        "ingestion": ingestion,
+        "queries": queries,
+        "embedding_cache": embeddings.embedding_cache.stats(),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--docs", type=int, default=200)
+    parser.add_argument("--users", type=int, default=1)
+    parser.add_argument("--reports-per-doc", type=int, default=1, help="Reports (~1-2 chunks each) per document")
+    parser.add_argument("--formats", default="txt:0.7,pdf:0.3", help="e.g. txt:0.6,pdf:0.3,png:0.1 (png needs Tesseract)")
+    parser.add_argument("--questions-per-doc", type=float, default=0.2)
+    parser.add_argument("--modes", default="hybrid,vector",
+                        help="RETRIEVAL_MODE values to compare, optionally with +rerank")
+    parser.add_argument("--k", default="1,3,5,10", help="Cut-offs for recall@k")
+    parser.add_argument("--n-results", type=int, default=3, help="Chunks retrieved per query_rag call")
+    parser.add_argument("--bulk", action="store_true", help="Ingest through bulk_ingest instead of process_document")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="Extraction processes for --bulk")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--workdir", help="Keep the corpus and stores here instead of a temp dir")
+    parser.add_argument("--json", help="Write results to this file")
+    args = parser.parse_args()
+
+    json_path = os.path.abspath(args.json) if args.json else None
+    if args.workdir:
+        os.makedirs(args.workdir, exist_ok=True)
+        result = run(args, os.path.abspath(args.workdir))
+    else:
+        with tempfile.TemporaryDirectory() as workdir:
+            result = run(args, workdir)
+            os.chdir(BACKEND_DIR)
+
+    if json_path:
+        with open(json_path, "w") as f:
+            json.dump(result, f, indent=2)
+        print(f"Results written to {json_path}")
+
+
+if __name__ == "__main__":
+    main()
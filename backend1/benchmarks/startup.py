@@ -0,0 +1,85 @@
+"""
+Startup benchmark: how long a fresh process takes to import the app and
+answer /health, and how long the (background) RAG warm-up takes.
+
+Run from backend1/:
+
+    python -m benchmarks.startup --runs 5
+    python -m benchmarks.startup --runs 3 --warmup --json startup.json
+
+Each run uses a fresh interpreter in a temporary working directory, so the
+real database and vector store are never touched.
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+PROBE = r"""
+import json, sys, time
+t0 = time.perf_counter()
+import app.main
+from fastapi.testclient import TestClient
+t_import = time.perf_counter() - t0
+result = {"import_s": t_import}
+with TestClient(app.main.app) as client:
+    assert client.get("/health").status_code == 200
+    result["first_health_s"] = time.perf_counter() - t0
+    t1 = time.perf_counter()
+    client.get("/health")
+    result["health_request_s"] = time.perf_counter() - t1
+    if "--warmup" in sys.argv:
+        from app import rag_engine
+        t2 = time.perf_counter()
+        rag_engine.warm_up()
+        result["warm_up_s"] = time.perf_counter() - t2
+print("RESULT " + json.dumps(result))
+"""
+
+
+def run_probe(workdir: str, warmup: bool) -> dict:
+    env = dict(os.environ)
+    env["PYTHONPATH"] = BACKEND_DIR + os.pathsep + env.get("PYTHONPATH", "")
+    # The benchmark times warm-up explicitly; keep it out of the startup numbers
+    env["RAG_WARMUP"] = "0"
+    args = [sys.executable, "-c", PROBE] + (["--warmup"] if warmup else [])
+    out = subprocess.run(args, cwd=workdir, env=env, capture_output=True, text=True, check=True)
+    for line in out.stdout.splitlines():
+        if line.startswith("RESULT "):
+            return json.loads(line[len("RESULT "):])
+    raise RuntimeError(f"Probe produced no result:\n{out.stdout}\n{out.stderr}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--warmup", action="store_true", help="Also time rag_engine.warm_up()")
+    parser.add_argument("--json", help="Write results to this file")
+    args = parser.parse_args()
+
+    samples = []
+    with tempfile.TemporaryDirectory() as workdir:
+        for i in range(args.runs):
+            samples.append(run_probe(workdir, args.warmup))
+            print(f"run {i + 1}: " + ", ".join(f"{k}={v * 1000:.0f}ms" for k, v in samples[-1].items()))
+
+    summary = {
+        key: {
+            "median_ms": statistics.median(s[key] for s in samples) * 1000,
+            "max_ms": max(s[key] for s in samples) * 1000,
+        }
+        for key in samples[0]
+    }
+    print(json.dumps(summary, indent=2))
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({"runs": samples, "summary": summary}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,102 @@
+"""
+Local stand-in for the Gemini REST API, for tests and benchmarks.
+
+Serves generateContent and streamGenerateContent (alt=sse) with the same
+deterministic answer as the in-process stub provider, plus configurable
+latency and injected failures, so the real LLM client path (connection
+reuse, concurrency limit, deadlines, retries, coalescing) can be exercised
+offline. Point the app at it with:
+
+    python -m benchmarks.stub_llm_server --port 8765 --token-ms 20 --fail-rate 0.1
+    GEMINI_BASE_URL=http://127.0.0.1:8765 GEMINI_API_KEY=stub uvicorn app.main:app
+
+GET /stats reports requests served, failures injected and the peak number
+of concurrent requests.
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import re
+import sys
+
+from fastapi import FastAPI, HTTPException, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+
+from app.llm import stub_answer  # noqa: E402
+
+
+def create_app(first_token_ms: float = 200, token_ms: float = 10, fail_rate: float = 0.0, seed: int = 0) -> FastAPI:
+    app = FastAPI(title="Stub Gemini")
+    rng = random.Random(seed)
+    stats = {"requests": 0, "failures": 0, "active": 0, "peak_active": 0}
+
+    def payload(text: str) -> dict:
+        return {"candidates": [{"content": {"role": "model", "parts": [{"text": text}]}}]}
+
+    async def tokens(prompt: str):
+        await asyncio.sleep(first_token_ms / 1000)
+        for i, token in enumerate(re.findall(r"\S+\s*", stub_answer(prompt))):
+            if i:
+                await asyncio.sleep(token_ms / 1000)
+            yield token
+
+    @app.post("/v1beta/models/{model_action}")
+    async def generate(model_action: str, request: Request):
+        _, _, action = model_action.partition(":")
+        if action not in ("generateContent", "streamGenerateContent"):
+            raise HTTPException(status_code=404, detail=f"Unknown action '{action}'")
+        body = await request.json()
+        prompt = "".join(part.get("text", "") for content in body.get("contents", []) for part in content.get("parts", []))
+
+        stats["requests"] += 1
+        if rng.random() < fail_rate:
+            stats["failures"] += 1
+            return JSONResponse({"error": {"code": 503, "message": "injected failure"}}, status_code=503)
+
+        if action == "generateContent":
+            stats["active"] += 1
+            stats["peak_active"] = max(stats["peak_active"], stats["active"])
+            try:
+                return payload("".join([token async for token in tokens(prompt)]))
+            finally:
+                stats["active"] -= 1
+
+        async def events():
+            stats["active"] += 1
+            stats["peak_active"] = max(stats["peak_active"], stats["active"])
+            try:
+                async for token in tokens(prompt):
+                    yield f"data: {json.dumps(payload(token))}\r\n\r\n"
+            finally:
+                stats["active"] -= 1
+
+        return StreamingResponse(events(), media_type="text/event-stream")
+
+    @app.get("/stats")
+    def get_stats():
+        return stats
+
+    return app
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Stub Gemini REST server.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--first-token-ms", type=float, default=200)
+    parser.add_argument("--token-ms", type=float, default=10)
+    parser.add_argument("--fail-rate", type=float, default=0.0, help="Share of requests answered with a 503")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    import uvicorn
+    uvicorn.run(create_app(args.first_token_ms, args.token_ms, args.fail_rate, args.seed), host=args.host, port=args.port)
+
+
+if __name__ == "__main__":
+    main()
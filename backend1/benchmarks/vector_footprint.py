@@ -0,0 +1,176 @@
+"""
+Vector storage footprint: disk and memory per million chunks, query latency
+and recall against exact float32 search for each VECTOR_STORAGE mode
+(ChromaDB float32, compact float16, compact int8).
+
+Run from backend1/:
+
+    python -m benchmarks.vector_footprint --chunks 20000
+    python -m benchmarks.vector_footprint --chunks 100000 --modes float16,int8 --json footprint.json
+
+The vectors are synthetic (clustered unit vectors, like MiniLM's). Queries
+are perturbed copies of stored vectors; recall@k is measured against
+brute-force float32 top-k over all chunks. Disk includes the chunk text,
+which is the same in every mode, and int8's float16 rerank copy; the
+compact stores need nothing else (no embedding cache) to answer queries.
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+
+from benchmarks.rag_suite import git_commit, isolate, percentiles  # noqa: E402
+
+MODES = ("float32", "float16", "int8")
+WORDS = "hemoglobin glucose creatinine tsh cholesterol platelet insulin ferritin sodium potassium".split()
+USER_ID = 1
+
+
+def synthetic_vectors(n: int, dim: int, clusters: int, rng: np.random.Generator) -> np.ndarray:
+    centers = rng.standard_normal((clusters, dim)).astype(np.float32)
+    vectors = centers[rng.integers(0, clusters, n)] + 0.6 * rng.standard_normal((n, dim)).astype(np.float32)
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+
+def synthetic_texts(n: int, chars: int, seed: int) -> list:
+    rng = random.Random(seed)
+    # The index makes every text unique, so each one has its own cache entry
+    return [f"chunk {i} " + " ".join(rng.choice(WORDS) for _ in range(chars // 9)) for i in range(n)]
+
+
+def disk_bytes(path: str) -> int:
+    if os.path.isfile(path):
+        return sum(os.path.getsize(p) for p in (path, path + "-wal") if os.path.exists(p))
+    return sum(os.path.getsize(os.path.join(root, f)) for root, _, files in os.walk(path) for f in files)
+
+
+def rss_bytes() -> int:
+    # Linux only; Chroma's index lives in native memory that tracemalloc can't see
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError):
+        return 0
+
+
+def open_collection(mode: str, workdir: str):
+    """Returns (collection, path holding its data)."""
+    if mode == "float32":
+        import chromadb
+        path = os.path.join(workdir, "chroma_db")
+        client = chromadb.PersistentClient(path=path)
+        return client.get_or_create_collection("footprint", embedding_function=None), path
+
+    from app.vector_store import CompactCollection, CompactVectorStore
+    path = os.path.join(workdir, f"vectors_{mode}.db")
+    return CompactCollection(CompactVectorStore(path, dtype=mode), USER_ID), path
+
+
+def bench_mode(mode: str, workdir: str, ids, texts, vectors, queries, truth, ks, batch: int) -> dict:
+    before = rss_bytes()
+    collection, path = open_collection(mode, workdir)
+    metadatas = [{"doc_id": i // 10, "user_id": USER_ID} for i in range(len(ids))]
+
+    t0 = time.perf_counter()
+    for start in range(0, len(ids), batch):
+        end = start + batch
+        collection.upsert(ids=ids[start:end], documents=texts[start:end], metadatas=metadatas[start:end],
+                          embeddings=vectors[start:end])
+    write_s = time.perf_counter() - t0
+
+    index = {chunk_id: i for i, chunk_id in enumerate(ids)}
+    latencies, hits = [], {k: 0.0 for k in ks}
+    for query, expected in zip(queries, truth):
+        t0 = time.perf_counter()
+        found = collection.query(query_embeddings=[query], n_results=max(ks))["ids"][0]
+        latencies.append(time.perf_counter() - t0)
+        rows = [index[chunk_id] for chunk_id in found]
+        for k in ks:
+            hits[k] += len(set(rows[:k]) & set(expected[:k])) / k
+
+    n = len(ids)
+    if mode == "float32":
+        disk = disk_bytes(path)
+        memory = max(0, rss_bytes() - before)
+    else:
+        footprint = collection.store.footprint()
+        disk, memory = footprint["disk_bytes"], footprint["memory_bytes"]
+    per_million = 1_000_000 / n
+    return {
+        "chunks": n,
+        "write_s": round(write_s, 2),
+        "disk_mb": round(disk / 2**20, 1),
+        "memory_mb": round(memory / 2**20, 1),
+        "disk_mb_per_million": round(disk * per_million / 2**20, 1),
+        "memory_mb_per_million": round(memory * per_million / 2**20, 1),
+        "query": percentiles(latencies),
+        "recall_vs_exact": {f"@{k}": round(hits[k] / len(queries), 4) for k in ks},
+    }
+
+
+def run(args, workdir: str) -> dict:
+    isolate(workdir)
+
+    rng = np.random.default_rng(args.seed)
+    vectors = synthetic_vectors(args.chunks, args.dim, args.clusters, rng)
+    texts = synthetic_texts(args.chunks, args.text_chars, args.seed)
+    ids = [f"doc_{i // 10}_chunk_{i % 10}" for i in range(args.chunks)]
+
+    picks = rng.integers(0, args.chunks, args.queries)
+    queries = vectors[picks] + 0.5 * rng.standard_normal((args.queries, args.dim)).astype(np.float32)
+    queries /= np.linalg.norm(queries, axis=1, keepdims=True)
+    ks = sorted({int(k) for k in args.k.split(",")})
+    truth = np.argsort(-(queries @ vectors.T), axis=1)[:, :max(ks)].tolist()
+
+    results = {}
+    for mode in args.modes.split(","):
+        results[mode] = bench_mode(mode, workdir, ids, texts, vectors, queries, truth, ks, args.batch)
+        print(f"{mode}: {json.dumps(results[mode])}")
+
+    return {
+        "meta": {
+            "commit": git_commit(),
+            "python": platform.python_version(),
+            "cpu_count": os.cpu_count(),
+            "args": vars(args),
+        },
+        "modes": results,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--chunks", type=int, default=20000)
+    parser.add_argument("--modes", default=",".join(MODES))
+    parser.add_argument("--dim", type=int, default=384)
+    parser.add_argument("--clusters", type=int, default=200)
+    parser.add_argument("--text-chars", type=int, default=600, help="Approximate chunk text length")
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", default="1,3,10")
+    parser.add_argument("--batch", type=int, default=5000, help="Chunks per upsert")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--json", help="Write results to this file")
+    args = parser.parse_args()
+
+    json_path = os.path.abspath(args.json) if args.json else None
+    with tempfile.TemporaryDirectory() as workdir:
+        result = run(args, workdir)
+        os.chdir(BACKEND_DIR)
+
+    if json_path:
+        with open(json_path, "w") as f:
+            json.dump(result, f, indent=2)
+        print(f"Results written to {json_path}")
+
+
+if __name__ == "__main__":
+    main()
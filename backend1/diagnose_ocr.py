@@ -8,22 +8,15 @@ except ImportError:
     print("PIL or pytesseract not installed.")
     sys.exit(1)
 
-# Tesseract Path Setup
-possible_paths = [
-    r"C:\Program Files\Tesseract-OCR\tesseract.exe",
-    r"C:\Program Files (x86)\Tesseract-OCR\tesseract.exe",
-    os.path.join(os.getenv('LOCALAPPDATA', ''), r"Tesseract-OCR\tesseract.exe"),
-    os.path.join(os.getenv('LOCALAPPDATA', ''), r"Programs\Tesseract-OCR\tesseract.exe"),
-    r"C:\Tesseract-OCR\tesseract.exe"
-]
+from app import ocr
 
+# Tesseract Path Setup (same lookup as the app)
 print("Searching for Tesseract in:")
-for path in possible_paths:
+for path in ocr.tesseract_paths:
     print(f" - {path}")
-    if os.path.exists(path):
-        pytesseract.pytesseract.tesseract_cmd = path
-        print(f"✅ FOUND Tesseract at: {path}")
-        break
+found = ocr.configure_tesseract()
+if found:
+    print(f"✅ FOUND Tesseract at: {found}")
 else:
     print("❌ Tesseract NOT found in any common path.")
 
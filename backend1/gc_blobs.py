@@ -0,0 +1,48 @@
+"""
+Garbage-collects the content-addressed upload store (uploaded_files/blobs).
+
+Reference counts are first recomputed from the documents table, then blobs
+nobody has used for --grace-seconds are deleted, along with temp files left
+by interrupted uploads and stray files that have no blob row.
+
+    python gc_blobs.py                   # collect
+    python gc_blobs.py --dry-run         # only report what would be deleted
+    python gc_blobs.py --adopt-legacy    # also move pre-store uploads into the store
+
+Safe to run next to the server (e.g. from cron): a blob is only deleted
+once its row has reached zero references and stayed there past the grace
+period.
+"""
+import argparse
+
+from app import blob_store, database, migrations
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Garbage-collect unreferenced uploaded files.")
+    parser.add_argument("--grace-seconds", type=int, default=blob_store.BLOB_GC_GRACE_SECONDS,
+                        help="Keep unreferenced files this long (default: BLOB_GC_GRACE_SECONDS)")
+    parser.add_argument("--adopt-legacy", action="store_true",
+                        help="Move files from before the blob store into it, deduplicating them")
+    parser.add_argument("--dry-run", action="store_true", help="Report what would change without writing")
+    args = parser.parse_args()
+
+    # The blobs table arrived with migration 0005
+    migrations.upgrade()
+
+    db = database.SessionLocal()
+    try:
+        stats = blob_store.collect_garbage(
+            db, grace_seconds=args.grace_seconds, dry_run=args.dry_run, adopt_legacy=args.adopt_legacy
+        )
+    finally:
+        db.close()
+
+    prefix = "Dry run: would have " if args.dry_run else ""
+    print(f"{prefix}adopted {stats['adopted']} legacy files, corrected {stats['recounted']} reference counts")
+    print(f"{prefix}deleted {stats['blobs_deleted']} unreferenced blobs, {stats['orphans_deleted']} orphaned files "
+          f"and {stats['temp_deleted']} temp files ({stats['bytes_freed'] / 2**20:.1f} MB)")
+
+
+if __name__ == "__main__":
+    main()
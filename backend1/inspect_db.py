@@ -1,24 +1,9 @@
-import chromadb
-from chromadb.utils import embedding_functions
-from sentence_transformers import SentenceTransformer
-
-# Same setup as rag_engine.py
-CHROMA_DB_DIR = "chroma_db"
-client = chromadb.PersistentClient(path=CHROMA_DB_DIR)
-
-EMBEDDING_MODEL_NAME = "all-MiniLM-L6-v2"
-embedding_model = SentenceTransformer(EMBEDDING_MODEL_NAME)
-
-class LocalEmbeddingFunction(chromadb.EmbeddingFunction):
-    def __call__(self, input: list[str]) -> list[list[float]]:
-        return embedding_model.encode(input).tolist()
+from app import rag_engine
 
+# Same collection as the app; the embedding model is not loaded for a peek
 try:
-    collection = client.get_collection(
-        name="medical_docs",
-        embedding_function=LocalEmbeddingFunction()
-    )
-    print(f"Collection 'medical_docs' found.")
+    collection = rag_engine.get_collection()
+    print(f"Collection '{rag_engine.COLLECTION_NAME}' found.")
     print(f"Total items in collection: {collection.count()}")
     
     if collection.count() > 0:
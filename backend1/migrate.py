@@ -0,0 +1,31 @@
+"""
+Brings the database at DATABASE_URL up to the current schema.
+
+    python migrate.py           # apply pending migrations
+    python migrate.py --status  # list pending migrations only
+"""
+import argparse
+
+from app import database, migrations
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Apply database schema migrations.")
+    parser.add_argument("--status", action="store_true", help="Only list pending migrations")
+    args = parser.parse_args()
+
+    print(f"Database: {database.engine.url.render_as_string(hide_password=True)}")
+    pending = migrations.pending_migrations()
+    if args.status:
+        if not pending:
+            print("Schema is up to date.")
+        for version, description in pending:
+            print(f"Pending {version}: {description}")
+        return
+
+    applied = migrations.upgrade()
+    print(f"Applied {len(applied)} migration(s): {', '.join(applied)}" if applied else "Schema is up to date.")
+
+
+if __name__ == "__main__":
+    main()
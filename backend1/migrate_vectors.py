@@ -0,0 +1,75 @@
+"""
+Re-tags existing ChromaDB chunks with their owner's user_id and, when
+VECTOR_PARTITIONING=per_user, moves them from the shared collection into
+one collection per user.
+
+    python migrate_vectors.py            # migrate
+    python migrate_vectors.py --dry-run  # only report what would change
+
+Chunks whose document no longer exists are deleted.
+"""
+import argparse
+
+from app import models, database, rag_engine
+
+BATCH_SIZE = 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Partition ChromaDB chunks by user.")
+    parser.add_argument("--dry-run", action="store_true")
+    args = parser.parse_args()
+
+    db = database.SessionLocal()
+    owners = dict(db.query(models.Document.id, models.Document.user_id).all())
+    db.close()
+
+    shared = rag_engine.get_collection()
+    all_ids = shared.get(include=[])["ids"]
+    print(f"Partitioning mode: {rag_engine.VECTOR_PARTITIONING}")
+    print(f"{len(all_ids)} chunks in shared collection '{shared.name}'")
+
+    retagged = moved = orphaned = 0
+    for start in range(0, len(all_ids), BATCH_SIZE):
+        batch = shared.get(
+            ids=all_ids[start:start + BATCH_SIZE],
+            include=["metadatas", "documents", "embeddings"],
+        )
+
+        orphans, by_user = [], {}
+        for i, meta in enumerate(batch["metadatas"]):
+            user_id = owners.get(meta.get("doc_id"))
+            if user_id is None:
+                orphans.append(batch["ids"][i])
+            else:
+                by_user.setdefault(user_id, []).append(i)
+        orphaned += len(orphans)
+
+        for user_id, rows in by_user.items():
+            ids = [batch["ids"][i] for i in rows]
+            metadatas = [{**batch["metadatas"][i], "user_id": user_id} for i in rows]
+            if rag_engine.VECTOR_PARTITIONING == "per_user":
+                moved += len(ids)
+                if not args.dry_run:
+                    # Embeddings are copied as-is, nothing is re-encoded
+                    rag_engine.get_user_collection(user_id).upsert(
+                        ids=ids,
+                        documents=[batch["documents"][i] for i in rows],
+                        metadatas=metadatas,
+                        embeddings=[batch["embeddings"][i] for i in rows],
+                    )
+                    shared.delete(ids=ids)
+            else:
+                retagged += len(ids)
+                if not args.dry_run:
+                    shared.update(ids=ids, metadatas=metadatas)
+
+        if orphans and not args.dry_run:
+            shared.delete(ids=orphans)
+
+    verb = "Would" if args.dry_run else "Did"
+    print(f"{verb} re-tag {retagged}, move {moved} and delete {orphaned} orphaned chunks.")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,20 +1,147 @@
-from app import models, database, rag_engine
+"""
+Incremental re-index of uploaded documents into ChromaDB and the BM25 index.
+
+Each document records the file hash and the extractor, chunker and embedding
+versions its chunks were built from. Only documents where one of those
+changed (or that were never indexed) are reprocessed; chunks are upserted in
+place and leftovers from longer previous runs, or from deleted documents,
+are removed.
+
+State is committed per document as soon as its chunks are written, so an
+interrupted run simply resumes with whatever is still out of date.
+Documents that are queued or being processed belong to the running
+ingestion queue and are skipped, even with --force.
+
+    python reindex_docs.py             # reprocess what changed
+    python reindex_docs.py --dry-run   # only report what would change
+    python reindex_docs.py --force     # reprocess everything
+"""
+import argparse
 import os
+from collections import Counter
+from typing import Optional
+
+from app import models, database, embeddings, ingestion, migrations, rag_engine
+from app.bulk_ingest import DEFAULT_WORKERS, DEFAULT_WRITE_BATCH_SIZE, ingest_documents
+from app.lexical_index import lexical_index
+
+# Owned by the live ingestion queue; reprocessing them here would race its workers
+QUEUE_OWNED_STATUSES = (ingestion.STATUS_QUEUED,) + ingestion.IN_PROGRESS_STATUSES
+
+
+def stale_reason(doc: models.Document, file_hash: str, versions: dict) -> Optional[str]:
+    """Why doc needs reprocessing, or None if its chunks are current."""
+    if doc.indexed_at is None:
+        return "never indexed"
+    if doc.status != ingestion.STATUS_INDEXED:
+        return f"status {doc.status}"
+    if doc.index_file_hash != file_hash:
+        return "file changed"
+    for key, current in versions.items():
+        if getattr(doc, key) != current:
+            return f"{key.replace('_', ' ')} changed"
+    return None
+
+
+def find_orphans(doc_ids: set) -> tuple:
+    """Chunks in Chroma, and documents in the BM25 index, whose document no longer exists."""
+    orphan_chunks = []
+    for collection in rag_engine.all_collections():
+        found = collection.get(include=["metadatas"])
+        ids = [i for i, meta in zip(found["ids"], found["metadatas"]) if meta.get("doc_id") not in doc_ids]
+        if ids:
+            orphan_chunks.append((collection, ids))
+    return orphan_chunks, lexical_index.document_ids() - doc_ids
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Incrementally re-index uploaded documents.")
+    parser.add_argument("--workers", type=int, default=DEFAULT_WORKERS,
+                        help="Processes used for text extraction (default: CPU count)")
+    parser.add_argument("--batch-size", type=int, default=embeddings.EMBED_BATCH_SIZE,
+                        help="Chunks per SentenceTransformer.encode batch")
+    parser.add_argument("--write-batch-size", type=int, default=DEFAULT_WRITE_BATCH_SIZE,
+                        help="Chunks per ChromaDB upsert")
+    parser.add_argument("--dry-run", action="store_true", help="Report what would change without writing")
+    parser.add_argument("--force", action="store_true", help="Reprocess every document")
+    args = parser.parse_args()
+
+    # Bring older databases up to the current schema before writing state
+    migrations.upgrade()
+
+    db = database.SessionLocal()
+    docs = db.query(models.Document).order_by(models.Document.id).all()
+    versions = ingestion.index_versions()
+
+    print(f"Found {len(docs)} documents in database.")
+    print(f"Current versions: {versions}")
+
+    to_index, file_hashes, reasons = [], {}, Counter()
+    for doc in docs:
+        # Check if file exists
+        if not os.path.exists(doc.file_path):
+            print(f"File missing: {doc.file_path}")
+            reasons["file missing"] += 1
+            continue
+        if doc.status in QUEUE_OWNED_STATUSES:
+            reasons["in the ingestion queue"] += 1
+            continue
+        file_hash = ingestion.file_sha256(doc.file_path)
+        reason = "forced" if args.force else stale_reason(doc, file_hash, versions)
+        if reason is None:
+            reasons["up to date"] += 1
+            continue
+        reasons[reason] += 1
+        file_hashes[doc.id] = file_hash
+        to_index.append((doc.id, doc.user_id, doc.file_path))
+        if args.dry_run:
+            print(f"Would re-index Document ID: {doc.id} ({reason})")
+
+    orphan_chunks, orphan_docs = find_orphans({doc.id for doc in docs})
+    orphan_count = sum(len(ids) for _, ids in orphan_chunks)
+
+    print("Plan: " + ", ".join(f"{count} {reason}" for reason, count in reasons.most_common()))
+    print(f"{orphan_count} orphaned chunks in ChromaDB, {len(orphan_docs)} orphaned documents in the BM25 index.")
+    if args.dry_run:
+        print(f"Dry run: would re-index {len(to_index)} documents and delete the orphans.")
+        db.close()
+        return
+
+    for collection, ids in orphan_chunks:
+        collection.delete(ids=ids)
+    for doc_id in orphan_docs:
+        lexical_index.delete_document(doc_id)
+
+    def indexed(doc_id, chunk_stats):
+        status = db.query(models.Document.status).filter(models.Document.id == doc_id).scalar()
+        if status in QUEUE_OWNED_STATUSES:
+            # Re-queued during the run; the queue's own job writes the final chunks and state
+            print(f"Skipped Document ID: {doc_id} (re-queued meanwhile)")
+            return
+        # The checkpoint: once recorded, a re-run skips this document
+        ingestion.record_index_state(db, doc_id, file_hashes[doc_id], chunk_stats, versions)
+        ingestion.set_status(db, doc_id, ingestion.STATUS_INDEXED)
+        print(f"Re-indexed Document ID: {doc_id} ({chunk_stats['chunk_count']} chunks, "
+              f"avg {chunk_stats['avg_chunk_chars']} chars)")
+
+    print(f"Re-indexing {len(to_index)} documents with {args.workers} workers, batch size {args.batch_size}...")
+    stats = ingest_documents(
+        to_index,
+        workers=args.workers,
+        batch_size=args.batch_size,
+        write_batch_size=args.write_batch_size,
+        on_indexed=indexed,
+    )
 
-db = database.SessionLocal()
-docs = db.query(models.Document).all()
+    for doc_id, error in stats.failed:
+        print(f"Error processing document {doc_id}: {error}")
 
-print(f"Found {len(docs)} documents in database.")
+    print("Re-indexing complete.")
+    print(f"{stats.documents} documents, {stats.chunks} chunks in {stats.elapsed:.1f}s "
+          f"({stats.docs_per_sec:.2f} docs/sec, {stats.chunks_per_sec:.1f} chunks/sec)")
+    print(f"Embedding cache: {embeddings.embedding_cache.stats()}")
+    db.close()
 
-for doc in docs:
-    print(f"Re-indexing Document ID: {doc.id}, Filename: {doc.filename}")
-    # Check if file exists
-    if os.path.exists(doc.file_path):
-        try:
-            rag_engine.process_document(doc.id, doc.file_path, db)
-        except Exception as e:
-            print(f"Error processing {doc.filename}: {e}")
-    else:
-        print(f"File missing: {doc.file_path}")
 
-print("Re-indexing complete.")
+if __name__ == "__main__":
+    main()
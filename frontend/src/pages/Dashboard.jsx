@@ -14,8 +14,15 @@ const Dashboard = () => {
 
     const fetchDocuments = async () => {
         try {
-            const response = await api.get('/documents/');
-            setDocuments(response.data);
+            // The list is paginated; follow X-Next-Cursor until the last page
+            let docs = [];
+            let cursor = null;
+            do {
+                const response = await api.get('/documents/', { params: cursor ? { cursor } : {} });
+                docs = docs.concat(response.data);
+                cursor = response.headers['x-next-cursor'];
+            } while (cursor);
+            setDocuments(docs);
         } catch (error) {
             console.error('Failed to fetch documents', error);
         } finally {